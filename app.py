@@ -1,4 +1,4 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, session, flash, make_response, send_file
+from flask import Flask, render_template, request, jsonify, redirect, url_for, session, flash, make_response, send_file, Response, stream_with_context
 import os
 from dotenv import load_dotenv
 import json
@@ -7,6 +7,7 @@ import uuid
 import bcrypt
 import time
 import random
+import threading
 
 # Try to import reportlab for PDF generation
 try:
@@ -29,7 +30,12 @@ load_dotenv()
 
 
 try:
-    import google.generativeai as genai
+    if os.getenv('GEMINI_BACKEND', 'google').lower() == 'fake':
+        # Offline stand-in for load and regression testing (see fake_gemini.py)
+        import fake_gemini as genai
+        print(" Using the offline fake Gemini backend (GEMINI_BACKEND=fake)")
+    else:
+        import google.generativeai as genai
     GEMINI_AVAILABLE = True
     print(" Google Generative AI import successful!")
 except ImportError as e:
@@ -83,6 +89,7 @@ from PIL import Image
 import io
 import numpy as np
 import base64
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
 
 
 try:
@@ -95,6 +102,20 @@ except ImportError as e:
     AnimalDiseaseChatbot = None
     CHATBOT_AVAILABLE = False
 
+from image_preparation import vision_image_preparer
+from prediction_tiers import PredictionTierStats, TIER_LOCAL, TIER_GEMINI, TIER_FALLBACK
+from structured_output import structured_output_parser
+from quota_ledger import quota_ledger
+from prompt_budget import token_budget, estimate_image_tokens
+from gemini_key_pool import gemini_key_pool, bind_model, FEATURE_DISEASE, FEATURE_CHAT
+from gemini_dispatch import gemini_dispatcher, CLASS_DIAGNOSIS
+from fallback_corpus import fallback_corpus
+from fallback_matcher import fallback_matcher
+from knowledge_index import knowledge_index, veterinary_passages
+from conversation_store import conversation_writer, MongoSessionBackend, SESSION_BACKEND
+from intent_router import intent_router
+from gemini_resilience import create_single_flight, make_request_key, CircuitBreakerRegistry, classify_gemini_error, HedgedCaller, Deadline
+
 app = Flask(__name__)
 app.secret_key = 'your-secret-key-change-in-production'  
 
@@ -192,7 +213,8 @@ def initialize_mongodb():
 
 
 class GeminiRateLimiter:
-    def __init__(self):
+    def __init__(self, api_key=None, label='disease_detection'):
+        self.api_key = api_key  # Usage is persisted per key in the quota ledger
         self.last_call_time = 0
         self.min_interval = 0.5  # Reduced to 0.5 seconds for better performance
         self.rate_limit_until = 0  # Timestamp until when we're rate limited
@@ -203,6 +225,18 @@ class GeminiRateLimiter:
         self.max_daily_calls = 1500  # Conservative daily limit
         self.last_reset_date = time.strftime('%Y-%m-%d')  # Track when we last reset
         
+        # Resume from the persisted ledger so restarts and worker recycles keep today's count
+        quota_ledger.register_key(api_key, label, self.max_daily_calls)
+        self.daily_calls = quota_ledger.calls_today(api_key)
+        self._sync_quota_lockout()
+        
+    def _sync_quota_lockout(self):
+        """Adopt a daily-quota lockout recorded by any worker"""
+        exhausted_until = quota_ledger.exhausted_until(self.api_key)
+        if exhausted_until:
+            self.quota_exceeded = True
+            self.quota_reset_time = max(self.quota_reset_time, exhausted_until)
+        
     def wait_if_needed(self):
         """Wait if we need to respect rate limits"""
         current_time = time.time()
@@ -216,6 +250,10 @@ class GeminiRateLimiter:
             self.consecutive_failures = 0
             print("Daily quota counter reset for new day")
         
+        # Other workers share the key: use the persisted count when it is ahead of ours
+        self.daily_calls = max(self.daily_calls, quota_ledger.calls_today(self.api_key))
+        self._sync_quota_lockout()
+        
         # Check daily call limit
         if self.daily_calls >= self.max_daily_calls:
             self.quota_exceeded = True
@@ -246,6 +284,7 @@ class GeminiRateLimiter:
             
         self.last_call_time = time.time()
         self.daily_calls += 1  # Increment daily call counter
+        quota_ledger.record_call(self.api_key)
         return False
         
     def handle_rate_limit_error(self, error_message=""):
@@ -260,9 +299,12 @@ class GeminiRateLimiter:
             from datetime import datetime, timedelta
             next_day = datetime.now() + timedelta(days=1)
             self.quota_reset_time = next_day.replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+            quota_ledger.record_rate_limit(self.api_key, exhausted_until=self.quota_reset_time)
             print(f"Daily quota exceeded. API calls suspended until next day.")
             return 24 * 3600  # Return 24 hours in seconds
         
+        quota_ledger.record_rate_limit(self.api_key)
+        
         # Regular rate limiting - more conservative
         base_wait = min(30, 1.5 ** min(self.consecutive_failures, 5))  # More gradual backoff
         jitter = random.uniform(0.9, 1.1)
@@ -281,79 +323,278 @@ class GeminiRateLimiter:
         
     def is_quota_exceeded(self):
         """Check if quota is currently exceeded"""
+        self._sync_quota_lockout()
         current_time = time.time()
         if self.quota_exceeded and current_time >= self.quota_reset_time:
             self.quota_exceeded = False
         return self.quota_exceeded
+    
+    def record_usage(self, response):
+        """Persist the token counts of a successful response"""
+        quota_ledger.record_usage_metadata(self.api_key, response)
+        token_budget.observe(response)
+        gemini_dispatcher.record_usage(response)
+    
+    def has_headroom(self, reserve=0):
+        """Check if more than `reserve` calls remain in today's budget"""
+        if self.is_quota_exceeded():
+            return False
+        return self.daily_calls + reserve < self.max_daily_calls
 
 # Global rate limiter instance
-gemini_rate_limiter = GeminiRateLimiter()
-
-def call_gemini_with_retry(model_name, prompt, image_parts=None, max_retries=2, api_key=None):
+gemini_rate_limiter = GeminiRateLimiter(GEMINI_API_KEY_DISEASE, 'disease_detection')
+gemini_key_pool.add_key('disease_detection', GEMINI_API_KEY_DISEASE, gemini_rate_limiter, FEATURE_DISEASE)
+
+# Single-flight layer shared by all disease detection Gemini calls
+gemini_single_flight = create_single_flight()
+
+# Per (API key, model) circuit breakers used to skip failing fallback models
+gemini_circuit_breakers = CircuitBreakerRegistry()
+
+# Optional hedging for latency-critical calls (see call_gemini_hedged)
+GEMINI_HEDGING_ENABLED = os.getenv('GEMINI_HEDGING_ENABLED', 'false').lower() == 'true'
+GEMINI_HEDGE_AFTER_SECONDS = os.getenv('GEMINI_HEDGE_AFTER_SECONDS', 'auto')
+GEMINI_HEDGE_DEFAULT_DELAY = float(os.getenv('GEMINI_HEDGE_DEFAULT_DELAY', '6.0'))
+GEMINI_HEDGE_DEADLINE = float(os.getenv('GEMINI_HEDGE_DEADLINE', '25'))
+GEMINI_HEDGE_QUOTA_RESERVE = int(os.getenv('GEMINI_HEDGE_QUOTA_RESERVE', '50'))
+gemini_hedged_caller = HedgedCaller()
+
+GEMINI_SHED_MESSAGE = "AI service is busy with higher-priority requests. Please try again shortly."
+
+def _dispatch_gemini(priority_class, deadline, call):
+    """Run call() once the dispatcher admits a request of this priority class"""
+    max_wait = deadline.remaining() if deadline is not None else None
+    with gemini_dispatcher.admit(priority_class, max_wait) as ticket:
+        if ticket.shed:
+            return None, GEMINI_SHED_MESSAGE
+        return call()
+
+def call_gemini_with_retry(model_name, prompt, image_parts=None, max_retries=2, api_key=None, deadline=None,
+                           response_schema=None, priority_class=CLASS_DIAGNOSIS):
     """
-    Call Gemini API with proper error handling, rate limiting, and quota management
+    Call Gemini API with proper error handling, rate limiting, and quota management.
+    Concurrent identical requests (same model, prompt and image) share one upstream call.
+    An optional Deadline bounds retries, rate-limit waits and each request's timeout.
+    With response_schema, models that support it are asked for schema-conforming JSON.
+    Without api_key the key is taken from the shared key pool, failing over to other keys on 429.
+    The request waits for a dispatcher slot of its priority class and may be shed under load.
     """
+    request_key = make_request_key(f"json:{model_name}" if response_schema else model_name, prompt, image_parts)
+    result, was_shared = gemini_single_flight.do(
+        request_key,
+        lambda: _dispatch_gemini(priority_class, deadline, lambda: _call_gemini_uncoalesced(
+            model_name, prompt, image_parts, max_retries, api_key, deadline, response_schema))
+    )
+    if was_shared:
+        print(f"  Coalesced identical Gemini request onto in-flight call ({model_name})")
+    return result
+
+GEMINI_DEADLINE_MESSAGE = "AI analysis did not finish within the request deadline."
+
+def _call_gemini_uncoalesced(model_name, prompt, image_parts=None, max_retries=2, api_key=None, deadline=None,
+                             response_schema=None):
+    """Make the actual Gemini call with model fallbacks and retries, failing over across pooled keys"""
     if not GEMINI_AVAILABLE:
         return None, "Gemini AI is not available"
     
-    # Check if quota is exceeded before making any calls
-    if gemini_rate_limiter.is_quota_exceeded():
+    if api_key is not None:
+        # Pinned key: no failover
+        response_text, error, _ = _call_gemini_on_key(model_name, prompt, image_parts, max_retries, api_key,
+                                                      deadline, response_schema)
+        return response_text, error
+    
+    # Pick the pooled key with the most headroom; the others are failover targets on 429
+    pooled_keys = gemini_key_pool.candidates(FEATURE_DISEASE)
+    if not pooled_keys:
+        if not GEMINI_API_KEY_DISEASE and not GEMINI_API_KEY_CHATBOT:
+            return None, "API key not configured"
         return None, "Daily API quota exceeded. Please try again tomorrow or upgrade your plan."
     
-    # Use provided API key or default to disease detection key
-    if api_key is None:
-        api_key = GEMINI_API_KEY_DISEASE
-        
+    for index, pooled_key in enumerate(pooled_keys):
+        response_text, error, rate_limited = _call_gemini_on_key(model_name, prompt, image_parts, max_retries,
+                                                                 pooled_key.api_key, deadline, response_schema)
+        if not rate_limited or index == len(pooled_keys) - 1:
+            return response_text, error
+        gemini_key_pool.record_failover(FEATURE_DISEASE, pooled_key, pooled_keys[index + 1])
+    return None, "All available AI models are currently unavailable. Please try again later."
+
+def _call_gemini_on_key(model_name, prompt, image_parts, max_retries, api_key, deadline=None, response_schema=None):
+    """
+    Model fallbacks and retries on one key.
+    Returns (response_text, error, rate_limited); rate_limited means another key may still succeed.
+    """
+    if gemini_key_pool.limiter_for(api_key, gemini_rate_limiter).is_quota_exceeded():
+        return None, "Daily API quota exceeded. Please try again tomorrow or upgrade your plan.", True
+    
     if not api_key:
-        return None, "API key not configured"
+        return None, "API key not configured", False
         
     # Define fallback models in order of preference
     models_to_try = [model_name, 'gemini-2.5-flash', 'gemini-flash-latest', 'gemini-pro-latest']
     # Remove duplicates while preserving order
     models_to_try = list(dict.fromkeys(models_to_try))
-        
+    
+    rate_limited = False
     for attempt in range(max_retries):
-        for current_model in models_to_try:
-            try:
-                # Wait if rate limited or quota exceeded
-                should_skip = gemini_rate_limiter.wait_if_needed()
-                if should_skip and gemini_rate_limiter.is_quota_exceeded():
-                    return None, "Daily API quota exceeded. Please try again tomorrow."
-                
-                # Configure with the specific API key for this request
-                genai.configure(api_key=api_key)
-                
-                # Create model and make request
-                model = genai.GenerativeModel(current_model)
-                
-                if image_parts:
-                    response = model.generate_content([prompt] + image_parts)
-                else:
-                    response = model.generate_content(prompt)
-                
-                if response and response.text:
-                    gemini_rate_limiter.reset_on_success()
-                    return response.text.strip(), None
-                else:
-                    continue  # Try next model
-                    
-            except Exception as model_error:
-                error_str = str(model_error).lower()
-                
-                # If quota exceeded, try next model
-                if "429" in error_str or "quota" in error_str:
-                    print(f"  Model {current_model} quota exceeded, trying next model...")
-                    continue
-                # If model not found, try next model
-                elif "404" in error_str or "not found" in error_str:
-                    print(f"  Model {current_model} not available, trying next model...")
-                    continue
-                else:
-                    # Other errors, break the model loop but continue retries
-                    break
+        # Skip models whose circuit is open and try the healthiest ones first
+        for current_model in gemini_circuit_breakers.ordered_models(api_key, models_to_try):
+            if deadline is not None and deadline.expired():
+                return None, GEMINI_DEADLINE_MESSAGE, False
+            response_text, error_kind = _call_gemini_model_once(current_model, prompt, image_parts, api_key, deadline,
+                                                                response_schema)
+            
+            if error_kind is None:
+                return response_text, None, False
+            if error_kind == 'quota_exceeded':
+                return None, "Daily API quota exceeded. Please try again tomorrow.", True
+            if error_kind == 'deadline_exceeded':
+                return None, GEMINI_DEADLINE_MESSAGE, False
+            if error_kind == 'rate_limit':
+                rate_limited = True
+                print(f"  Model {current_model} quota exceeded, trying next model...")
+            elif error_kind == 'not_found':
+                print(f"  Model {current_model} not available, trying next model...")
+            elif error_kind == 'error':
+                # Other errors, break the model loop but continue retries
+                break
+            # Empty responses and circuits that refused a probe fall through to the next model
     
     # If all models and retries failed
-    return None, "All available AI models are currently unavailable. Please try again later."
+    return None, "All available AI models are currently unavailable. Please try again later.", rate_limited
+
+def _call_gemini_model_once(current_model, prompt, image_parts, api_key, deadline=None, response_schema=None):
+    """
+    Make a single request against one model, recording the outcome on its circuit breaker.
+    Returns (response_text, error_kind) where error_kind is None on success.
+    """
+    # Each pooled key has its own limiter; unpooled keys share the disease detection one
+    rate_limiter = gemini_key_pool.limiter_for(api_key, gemini_rate_limiter)
+    
+    remaining = deadline.remaining() if deadline is not None else None
+    if remaining is not None:
+        # Don't sleep through a rate-limit backoff that outlasts the request
+        if remaining < 1 or rate_limiter.rate_limit_until - time.time() >= remaining:
+            return None, 'deadline_exceeded'
+    
+    # Checked after the deadline so a half-open probe is only claimed for a call that can go out
+    if not gemini_circuit_breakers.allow_request(api_key, current_model):
+        return None, 'circuit_open'
+    
+    try:
+        # Wait if rate limited or quota exceeded
+        should_skip = rate_limiter.wait_if_needed()
+        if should_skip and rate_limiter.is_quota_exceeded():
+            # No call was made, so the model's health is unknown; let the next request probe it
+            gemini_circuit_breakers.release_probe(api_key, current_model)
+            return None, 'quota_exceeded'
+        
+        # Create the model on a client bound to this request's API key
+        model = bind_model(genai, current_model, api_key)
+        
+        request_options = {}
+        if remaining is not None:
+            request_options['timeout'] = max(1.0, deadline.remaining())
+        
+        contents = [prompt] + image_parts if image_parts else prompt
+        generation_config = structured_output_parser.generation_config(current_model, response_schema)
+        
+        call_started = time.time()
+        try:
+            response = model.generate_content(contents, generation_config=generation_config,
+                                              request_options=request_options)
+        except Exception as schema_error:
+            if generation_config is None or not structured_output_parser.is_schema_rejection(schema_error):
+                raise
+            # This model does not take a response schema; the prompt still asks for JSON
+            structured_output_parser.mark_unsupported(current_model)
+            response = model.generate_content(contents, request_options=request_options)
+        
+        if response and response.text:
+            rate_limiter.reset_on_success()
+            rate_limiter.record_usage(response)
+            gemini_circuit_breakers.record_success(api_key, current_model, time.time() - call_started)
+            return response.text.strip(), None
+        
+        gemini_circuit_breakers.record_failure(api_key, current_model, 'error', 'Empty response')
+        return None, 'empty'
+            
+    except Exception as model_error:
+        error_kind = classify_gemini_error(model_error)
+        gemini_circuit_breakers.record_failure(api_key, current_model, error_kind, str(model_error))
+        if error_kind == 'rate_limit':
+            quota_ledger.record_rate_limit(api_key)
+            gemini_key_pool.record_rate_limited(api_key)
+        if error_kind == 'timeout':
+            if deadline is not None and deadline.expired():
+                return None, 'deadline_exceeded'
+            return None, 'error'
+        return None, error_kind
+
+def _hedge_delay_for(api_key, model_name):
+    """Hedge delay: configured seconds, or the primary model's observed p90 latency when 'auto'"""
+    if GEMINI_HEDGE_AFTER_SECONDS != 'auto':
+        return float(GEMINI_HEDGE_AFTER_SECONDS)
+    p90 = gemini_circuit_breakers.p90_latency(api_key, model_name)
+    return p90 if p90 else GEMINI_HEDGE_DEFAULT_DELAY
+
+def call_gemini_hedged(model_name, prompt, image_parts=None, api_key=None, deadline=None, response_schema=None):
+    """
+    Latency-critical variant of call_gemini_with_retry. When hedging is enabled and the
+    primary model has not answered within its p90 latency, the same prompt is sent to the
+    next healthy fallback model and the first answer wins. Hedges are only fired while the
+    daily quota keeps GEMINI_HEDGE_QUOTA_RESERVE calls in hand, and the whole call is
+    bounded by a per-request deadline.
+    """
+    if not GEMINI_HEDGING_ENABLED:
+        return call_gemini_with_retry(model_name, prompt, image_parts, api_key=api_key, deadline=deadline,
+                                      response_schema=response_schema)
+    
+    if not GEMINI_AVAILABLE:
+        return None, "Gemini AI is not available"
+    
+    pooled = api_key is None
+    if pooled:
+        # Hedge on the key with the most headroom; a quota failure falls back to pooled failover
+        pooled_keys = gemini_key_pool.candidates(FEATURE_DISEASE)
+        if not pooled_keys:
+            return None, "Daily API quota exceeded. Please try again tomorrow or upgrade your plan."
+        api_key = pooled_keys[0].api_key
+    
+    if not api_key:
+        return None, "API key not configured"
+    
+    if deadline is None:
+        deadline = Deadline(GEMINI_HEDGE_DEADLINE)
+    
+    models_to_try = list(dict.fromkeys([model_name, 'gemini-2.5-flash', 'gemini-flash-latest', 'gemini-pro-latest']))
+    candidates = gemini_circuit_breakers.ordered_models(api_key, models_to_try)
+    if not candidates:
+        return None, "All available AI models are currently unavailable. Please try again later."
+    
+    def run_hedged():
+        response_text, error_kind, model_used = gemini_hedged_caller.call(
+            candidates,
+            lambda current_model: _call_gemini_model_once(current_model, prompt, image_parts, api_key, deadline,
+                                                          response_schema),
+            hedge_delay=_hedge_delay_for(api_key, candidates[0]),
+            deadline=deadline,
+            may_hedge=lambda: gemini_key_pool.has_headroom(api_key, GEMINI_HEDGE_QUOTA_RESERVE)
+        )
+        if error_kind is None:
+            return response_text, None
+        if error_kind in ('quota_exceeded', 'rate_limit') and pooled and not deadline.expired():
+            # Already holding a dispatcher slot: fail over directly rather than through call_gemini_with_retry
+            return _call_gemini_uncoalesced(model_name, prompt, image_parts, deadline=deadline,
+                                            response_schema=response_schema)
+        if error_kind == 'quota_exceeded':
+            return None, "Daily API quota exceeded. Please try again tomorrow."
+        if error_kind == 'deadline_exceeded':
+            return None, GEMINI_DEADLINE_MESSAGE
+        return None, "All available AI models are currently unavailable. Please try again later."
+    
+    request_key = make_request_key(f"hedged:{'json:' if response_schema else ''}{model_name}", prompt, image_parts)
+    result, _ = gemini_single_flight.do(request_key, lambda: _dispatch_gemini(CLASS_DIAGNOSIS, deadline, run_hedged))
+    return result
 
 # Initialize chatbot service
 chatbot = None
@@ -377,13 +618,25 @@ def initialize_chatbot():
         print("Initializing chatbot service with dedicated API key...")
         chatbot = AnimalDiseaseChatbot(gemini_api_key)
         
-        # Force clear any existing quota restrictions with new API key
-        if hasattr(chatbot, 'rate_limiter'):
-            chatbot.rate_limiter.clear_quota_exceeded_state()
-            print("  Quota restrictions cleared for new API key")
-        
         print("  Chatbot service initialized successfully with chatbot API key!")
         
+        # Share chat context across workers and nodes through MongoDB when configured
+        if SESSION_BACKEND == 'mongo':
+            if db is not None:
+                chatbot.sessions.use_backend(MongoSessionBackend(db.chat_sessions, conversation_writer))
+            else:
+                print("  CHATBOT_SESSION_BACKEND=mongo but the database is not connected - chat sessions stay per worker")
+        
+        # Teach the offline intent router from past chat messages without delaying startup
+        if db is not None and os.getenv('CHATBOT_INTENT_TRAIN_FROM_HISTORY', 'true').lower() == 'true':
+            def train_intent_router():
+                try:
+                    past_messages = db.conversations.find({'type': 'text'}, {'message': 1}).sort('timestamp', -1).limit(2000)
+                    intent_router.train_from_history(doc.get('message', '') for doc in past_messages)
+                except Exception as train_error:
+                    print(f"  Intent router training from history failed: {train_error}")
+            threading.Thread(target=train_intent_router, daemon=True).start()
+        
 
         run_health_check = os.getenv('RUN_GEMINI_HEALTH_CHECK', 'false').lower() == 'true'
 
@@ -426,18 +679,27 @@ def quota_info():
 def get_quota_status():
     """Get current quota status for the API"""
     try:
-        # Check both rate limiters
-        app_quota_exceeded = gemini_rate_limiter.is_quota_exceeded()
+        # A feature is available while any pooled key can still serve it
+        app_quota_exceeded = not gemini_key_pool.available(FEATURE_DISEASE)
         chatbot_quota_exceeded = False
         
         if chatbot and hasattr(chatbot, 'rate_limiter'):
-            chatbot_quota_exceeded = chatbot.rate_limiter.is_quota_exceeded()
+            chatbot_quota_exceeded = not gemini_key_pool.available(FEATURE_CHAT)
         
         status = {
             'quota_exceeded': app_quota_exceeded or chatbot_quota_exceeded,
             'disease_detection_available': not app_quota_exceeded,
             'chatbot_available': not chatbot_quota_exceeded,
-            'reset_time': None
+            'reset_time': None,
+            'coalescing': gemini_single_flight.get_stats(),
+            'circuit_breakers': gemini_circuit_breakers.snapshot(),
+            'hedging': dict(gemini_hedged_caller.get_stats(), enabled=GEMINI_HEDGING_ENABLED),
+            'vision_images': vision_image_preparer.get_stats(),
+            'prediction_tiers': prediction_tier_stats.snapshot(),
+            'structured_output': structured_output_parser.get_stats(),
+            'token_budget': token_budget.get_stats(),
+            'key_pool': gemini_key_pool.snapshot(),
+            'priority_classes': gemini_dispatcher.snapshot()
         }
         
         # Get reset time if quota exceeded
@@ -461,180 +723,21 @@ def get_chatbot_status():
     if chatbot is None:
         return False, "Chatbot not initialized"
     
-    # Reset quota if expired (new day) or if we have a new API key
+    # Reset quota if expired (new day); lockouts persist in the quota ledger until then
     if hasattr(chatbot, 'reset_quota_if_expired'):
         chatbot.reset_quota_if_expired()
     
-    # With the new API key, clear any false quota exceeded state
-    if hasattr(chatbot, 'rate_limiter'):
-        # Force clear quota state since we have a fresh API key
-        current_time = time.time()
-        # If quota was set more than an hour ago, clear it (in case it's stale)
-        if (hasattr(chatbot.rate_limiter, 'quota_reset_time') and 
-            chatbot.rate_limiter.quota_reset_time > 0 and
-            (current_time - chatbot.rate_limiter.quota_reset_time > 3600)):  # 1 hour
-            chatbot.rate_limiter.clear_quota_exceeded_state()
-            print("  Cleared old quota state for fresh API key usage")
-    
-    # Check quota status - this is not a failure, just quota exceeded
-    if hasattr(chatbot, 'rate_limiter') and chatbot.rate_limiter.is_quota_exceeded():
+    # Check quota status - this is not a failure, just quota exceeded (on every key chat may use)
+    if hasattr(chatbot, 'rate_limiter') and not gemini_key_pool.available(FEATURE_CHAT):
         return "quota_exceeded", "Chatbot quota exceeded"
     
     return True, "Chatbot ready"
 
-def get_enhanced_fallback_response(user_input=""):
-    """Enhanced fallback response system with animal-specific guidance"""
-    user_lower = user_input.lower() if user_input else ""
-    
-    # Animal-specific responses
-    if any(word in user_lower for word in ['cow', 'cattle', 'bull', 'calf', 'bovine']):
-        if 'fever' in user_lower:
-            return """🐄 **Cow Fever Management**
-**Normal Temperature**: 101.5-103.5°F (38.6-39.7°C)
-**Action Steps**:
-• Provide shade and cool, fresh water
-• Check for respiratory distress
-• Monitor appetite and milk production
-• Contact vet if fever >104°F or persists >24h
-• Consider electrolyte solutions"""
-        elif 'mastitis' in user_lower:
-            return """🥛 **Mastitis in Cows**
-**Signs**: Hot, swollen udder quarters, abnormal milk
-**Immediate Care**:
-• Frequent milking every 2-3 hours
-• Apply warm compresses before milking
-• Strip affected quarters completely
-• **Veterinary consultation required for antibiotics**
-• Monitor for systemic illness"""
-        elif 'lameness' in user_lower or 'limp' in user_lower:
-            return """🦶 **Cow Lameness Assessment**
-**Common Causes**: Hoof problems, stones, injuries
-**Action Steps**:
-• Examine hooves for cuts/stones
-• Clean and trim if experienced
-• Provide soft, dry bedding
-• Limit movement
-• **Vet needed if no improvement in 24-48h**"""
-    
-    elif any(word in user_lower for word in ['dog', 'puppy', 'canine']):
-        if 'fever' in user_lower:
-            return """🐕 **Dog Fever Care**
-**Normal Temperature**: 101-102.5°F (38.3-39.2°C)
-**Action Steps**:
-• Ensure adequate water intake
-• Cool environment, avoid overheating
-• Monitor for lethargy, loss of appetite
-• **Emergency if fever >104°F**
-• Consider wet towels on paws and belly"""
-        elif 'diarrhea' in user_lower:
-            return """💧 **Dog Diarrhea Treatment**
-**Immediate Care**:
-• Withhold food for 12-24 hours (not water)
-• Bland diet: boiled rice with chicken
-• Small, frequent water offerings
-• **Vet needed if**: Blood, severe dehydration, persists >2 days
-• Watch for signs of bloat"""
-    
-    elif any(word in user_lower for word in ['cat', 'kitten', 'feline']):
-        if 'fever' in user_lower:
-            return """🐱 **Cat Fever Management**
-**Normal Temperature**: 100.5-102.5°F (38.1-39.2°C)
-**Action Steps**:
-• Quiet, cool environment
-• Encourage water intake
-• Monitor breathing and appetite
-• **Emergency if fever >104°F or lethargic**
-• Wet food may help hydration"""
-        elif 'vomit' in user_lower or 'throw up' in user_lower:
-            return """🤢 **Cat Vomiting Care**
-**Immediate Steps**:
-• Withhold food for 12 hours (not water)
-• Small amounts of water frequently
-• **Emergency signs**: Blood, continuous retching, dehydration
-• Return to bland diet gradually
-• **Vet needed if persists >24h**"""
-    
-    elif any(word in user_lower for word in ['sheep', 'lamb', 'ewe', 'ram']):
-        if 'fever' in user_lower:
-            return """🐑 **Sheep Fever Care**
-**Normal Temperature**: 102-104°F (38.9-40°C)
-**Action Steps**:
-• Provide shade and ventilation
-• Fresh water access
-• Check for respiratory issues
-• **Emergency if >105°F or difficulty breathing**
-• Isolate from flock if contagious suspected"""
-        elif 'limp' in user_lower or 'foot rot' in user_lower:
-            return """🦶 **Sheep Foot Problems**
-**Common Issues**: Foot rot, stones, injuries
-**Care Steps**:
-• Examine hooves for lesions/smell
-• Trim overgrown hooves if experienced
-• Clean, dry environment essential
-• **Foot rot requires antibiotic treatment**
-• Zinc supplements may help prevention"""
-    
-    # General responses by symptom
-    if 'emergency' in user_lower or 'urgent' in user_lower:
-        return """🚨 **EMERGENCY SIGNS - Contact Veterinarian IMMEDIATELY**
-• **Breathing difficulties** - Open mouth breathing, gasping
-• **Severe bleeding** - Continuous, won't stop with pressure
-• **Cannot stand or walk** - Paralysis, extreme weakness
-• **High fever** - >104°F (40°C) for most animals
-• **Seizures or convulsions**
-• **Severe pain** - Crying, restlessness, rigid posture
-• **Bloated abdomen** - Especially in ruminants
-• **Eye injuries** - Any trauma to eyes"""
-    
-    elif 'fever' in user_lower:
-        return """🌡️ **General Fever Management**
-**Recognition**: Lethargy, warm nose/ears, shivering
-**Immediate Care**:
-• Cool, quiet environment with good ventilation
-• Fresh water access - encourage drinking
-• Light, easily digestible food
-• Monitor temperature if possible
-• **Call vet if fever >104°F or lasts >24h**"""
-    
-    elif 'diarrhea' in user_lower or 'loose stool' in user_lower:
-        return """💧 **Diarrhea Management**
-**Immediate Steps**:
-• Ensure hydration - offer water/electrolytes frequently
-• Withhold food 12-24h (keep water available)
-• Gradual return to bland diet
-• **Warning signs**: Blood, severe dehydration, fever
-• **Vet needed**: Persists >2 days, animal becomes weak"""
-    
-    # Default comprehensive response with quota message
-    return f"""🩺 **PashuArogyam - Animal Health Guidance** (2025-11-19 {time.strftime('%H:%M:%S')})
-    
-I've reached my daily quota limit. This is normal for free tier usage. Please try again tomorrow, or you can:
-
-• **Use our disease detection features**
-• **Consult with our veterinarians** 
-• **Browse our health resources**
-
-Here's some general guidance:
-
-**🩺 Animal Health Guidance ({time.strftime('%Y-%m-%d %H:%M:%S')})**
-I'm currently unable to provide AI-powered responses, but here's some general guidance:
-
-**Emergency Signs - Contact Veterinarian Immediately:**
-• Difficulty breathing, severe bleeding, unable to stand
-• High fever (>104°F/40°C), seizures, severe pain
-
-**General Care Tips:**
-• Monitor appetite, behavior, and vital signs daily
-• Ensure clean water and appropriate nutrition  
-• Maintain clean, dry living conditions
-• Isolate sick animals to prevent spread
-
-**Common Treatments:**
-• **Fever**: Cool water, shade, electrolytes
-• **Minor cuts**: Clean, disinfect, monitor healing
-• **Digestive issues**: Withhold food briefly, provide water
-
-Always consult a qualified veterinarian for proper diagnosis and treatment."""
+def get_enhanced_fallback_response(user_input="", language='en'):
+    """Enhanced fallback response system with animal-specific guidance, served from the pre-translated corpus"""
+    # Animal- and symptom-specific rules come from fallback_rules.json, matched in one pass;
+    # with no rule matched this is the comprehensive default answer with the quota message
+    return fallback_corpus.render(fallback_matcher.best_template(user_input or ""), language)
 
 def get_db_status():
     """Check if database is connected and available"""
@@ -2207,6 +2310,46 @@ def admin_api_stats():
         print(f" Admin API stats error: {str(e)}")
         return jsonify({'success': False, 'message': 'Error fetching statistics'}), 500
 
+@app.route('/admin/api/gemini-usage')
+def admin_api_gemini_usage():
+    """Daily Gemini usage history and remaining budget per API key"""
+    if 'admin_logged_in' not in session:
+        return jsonify({'success': False, 'message': 'Unauthorized'}), 401
+    
+    try:
+        days = min(90, max(1, request.args.get('days', 14, type=int)))
+        return jsonify({
+            'success': True,
+            'ledger_enabled': quota_ledger.enabled,
+            'days': days,
+            'keys': quota_ledger.report(days),
+            'pool': gemini_key_pool.snapshot()
+        })
+        
+    except Exception as e:
+        print(f" Admin API Gemini usage error: {str(e)}")
+        return jsonify({'success': False, 'message': 'Error fetching Gemini usage'}), 500
+
+@app.route('/admin/api/gemini-usage/clear-lockout', methods=['POST'])
+def admin_api_clear_gemini_lockout():
+    """Lift a daily-quota lockout that is known to be false (e.g. after a key upgrade)"""
+    if 'admin_logged_in' not in session:
+        return jsonify({'success': False, 'message': 'Unauthorized'}), 401
+    
+    data = request.get_json(silent=True) or {}
+    target = data.get('key', 'all')
+    cleared = []
+    if target in ('all', 'disease_detection'):
+        quota_ledger.clear_exhausted(GEMINI_API_KEY_DISEASE)
+        gemini_rate_limiter.quota_exceeded = False
+        gemini_rate_limiter.quota_reset_time = 0
+        cleared.append('disease_detection')
+    if target in ('all', 'chatbot') and chatbot and hasattr(chatbot, 'rate_limiter'):
+        chatbot.rate_limiter.clear_quota_exceeded_state()
+        cleared.append('chatbot')
+    
+    return jsonify({'success': True, 'cleared': cleared})
+
 @app.route('/predict_disease', methods=['POST'])
 def predict_disease():
     """Handle disease prediction requests"""
@@ -2267,86 +2410,86 @@ def predict_disease():
             'error': str(e)
         }), 500
 
+# Disease database for different animals, used by mock_disease_prediction
+MOCK_DISEASE_DATABASE = {
+    'cattle': {
+        'diseases': ['Bovine Respiratory Disease', 'Mastitis', 'Foot and Mouth Disease', 'Bloat', 'Milk Fever'],
+        'symptoms_map': {
+            'fever': ['Bovine Respiratory Disease', 'Foot and Mouth Disease'],
+            'coughing': ['Bovine Respiratory Disease'],
+            'difficulty_breathing': ['Bovine Respiratory Disease', 'Bloat'],
+            'lethargy': ['Mastitis', 'Milk Fever'],
+            'loss_of_appetite': ['Bloat', 'Milk Fever']
+        }
+    },
+    'pig': {
+        'diseases': ['Swine Flu', 'Porcine Reproductive and Respiratory Syndrome', 'Salmonellosis', 'Pneumonia'],
+        'symptoms_map': {
+            'fever': ['Swine Flu', 'Pneumonia'],
+            'coughing': ['Swine Flu', 'Pneumonia'],
+            'diarrhea': ['Salmonellosis'],
+            'lethargy': ['Swine Flu', 'Salmonellosis']
+        }
+    },
+    'chicken': {
+        'diseases': ['Avian Influenza', 'Newcastle Disease', 'Coccidiosis', 'Fowl Pox'],
+        'symptoms_map': {
+            'fever': ['Avian Influenza', 'Newcastle Disease'],
+            'difficulty_breathing': ['Avian Influenza', 'Newcastle Disease'],
+            'diarrhea': ['Coccidiosis'],
+            'skin_lesions': ['Fowl Pox']
+        }
+    },
+    'sheep': {
+        'diseases': ['Scrapie', 'Foot Rot', 'Parasitic Infections', 'Pneumonia'],
+        'symptoms_map': {
+            'lameness': ['Foot Rot'],
+            'lethargy': ['Parasitic Infections', 'Pneumonia'],
+            'coughing': ['Pneumonia']
+        }
+    },
+    'goat': {
+        'diseases': ['Caprine Arthritis Encephalitis', 'Pneumonia', 'Internal Parasites', 'Ketosis'],
+        'symptoms_map': {
+            'coughing': ['Pneumonia'],
+            'lethargy': ['Internal Parasites', 'Ketosis'],
+            'loss_of_appetite': ['Ketosis']
+        }
+    },
+    'horse': {
+        'diseases': ['Equine Influenza', 'Colic', 'Laminitis', 'Strangles'],
+        'symptoms_map': {
+            'fever': ['Equine Influenza', 'Strangles'],
+            'coughing': ['Equine Influenza', 'Strangles'],
+            'lameness': ['Laminitis']
+        }
+    },
+    'dog': {
+        'diseases': ['Parvovirus', 'Distemper', 'Kennel Cough', 'Hip Dysplasia'],
+        'symptoms_map': {
+            'vomiting': ['Parvovirus'],
+            'diarrhea': ['Parvovirus'],
+            'coughing': ['Kennel Cough', 'Distemper'],
+            'lameness': ['Hip Dysplasia']
+        }
+    },
+    'cat': {
+        'diseases': ['Feline Leukemia', 'Upper Respiratory Infection', 'Feline Distemper', 'Urinary Tract Infection'],
+        'symptoms_map': {
+            'discharge': ['Upper Respiratory Infection'],
+            'lethargy': ['Feline Leukemia', 'Feline Distemper'],
+            'vomiting': ['Feline Distemper']
+        }
+    }
+}
+
 def mock_disease_prediction(animal_type, symptoms, age, weight, temperature, additional_info):
     """
     Mock disease prediction function
     Replace this with your actual AI model prediction logic
     """
-    # Disease database for different animals
-    disease_database = {
-        'cattle': {
-            'diseases': ['Bovine Respiratory Disease', 'Mastitis', 'Foot and Mouth Disease', 'Bloat', 'Milk Fever'],
-            'symptoms_map': {
-                'fever': ['Bovine Respiratory Disease', 'Foot and Mouth Disease'],
-                'coughing': ['Bovine Respiratory Disease'],
-                'difficulty_breathing': ['Bovine Respiratory Disease', 'Bloat'],
-                'lethargy': ['Mastitis', 'Milk Fever'],
-                'loss_of_appetite': ['Bloat', 'Milk Fever']
-            }
-        },
-        'pig': {
-            'diseases': ['Swine Flu', 'Porcine Reproductive and Respiratory Syndrome', 'Salmonellosis', 'Pneumonia'],
-            'symptoms_map': {
-                'fever': ['Swine Flu', 'Pneumonia'],
-                'coughing': ['Swine Flu', 'Pneumonia'],
-                'diarrhea': ['Salmonellosis'],
-                'lethargy': ['Swine Flu', 'Salmonellosis']
-            }
-        },
-        'chicken': {
-            'diseases': ['Avian Influenza', 'Newcastle Disease', 'Coccidiosis', 'Fowl Pox'],
-            'symptoms_map': {
-                'fever': ['Avian Influenza', 'Newcastle Disease'],
-                'difficulty_breathing': ['Avian Influenza', 'Newcastle Disease'],
-                'diarrhea': ['Coccidiosis'],
-                'skin_lesions': ['Fowl Pox']
-            }
-        },
-        'sheep': {
-            'diseases': ['Scrapie', 'Foot Rot', 'Parasitic Infections', 'Pneumonia'],
-            'symptoms_map': {
-                'lameness': ['Foot Rot'],
-                'lethargy': ['Parasitic Infections', 'Pneumonia'],
-                'coughing': ['Pneumonia']
-            }
-        },
-        'goat': {
-            'diseases': ['Caprine Arthritis Encephalitis', 'Pneumonia', 'Internal Parasites', 'Ketosis'],
-            'symptoms_map': {
-                'coughing': ['Pneumonia'],
-                'lethargy': ['Internal Parasites', 'Ketosis'],
-                'loss_of_appetite': ['Ketosis']
-            }
-        },
-        'horse': {
-            'diseases': ['Equine Influenza', 'Colic', 'Laminitis', 'Strangles'],
-            'symptoms_map': {
-                'fever': ['Equine Influenza', 'Strangles'],
-                'coughing': ['Equine Influenza', 'Strangles'],
-                'lameness': ['Laminitis']
-            }
-        },
-        'dog': {
-            'diseases': ['Parvovirus', 'Distemper', 'Kennel Cough', 'Hip Dysplasia'],
-            'symptoms_map': {
-                'vomiting': ['Parvovirus'],
-                'diarrhea': ['Parvovirus'],
-                'coughing': ['Kennel Cough', 'Distemper'],
-                'lameness': ['Hip Dysplasia']
-            }
-        },
-        'cat': {
-            'diseases': ['Feline Leukemia', 'Upper Respiratory Infection', 'Feline Distemper', 'Urinary Tract Infection'],
-            'symptoms_map': {
-                'discharge': ['Upper Respiratory Infection'],
-                'lethargy': ['Feline Leukemia', 'Feline Distemper'],
-                'vomiting': ['Feline Distemper']
-            }
-        }
-    }
-    
     # Get animal data
-    animal_data = disease_database.get(animal_type, {
+    animal_data = MOCK_DISEASE_DATABASE.get(animal_type, {
         'diseases': ['General Infection', 'Nutritional Deficiency', 'Stress-related Condition'],
         'symptoms_map': {}
     })
@@ -3063,9 +3206,188 @@ def predict_sheep():
             'show_popup': True
         })
 
+# =================== LOCAL-FIRST INTEGRATED PREDICTION ===================
+# The in-process YOLO models and the symptom scorer answer clear-cut cases;
+# Gemini is only consulted when they are unsure or disagree.
+LOCAL_FIRST_ENABLED = os.getenv('LOCAL_FIRST_ENABLED', 'true').lower() == 'true'
+LOCAL_FIRST_MIN_MODEL_CONFIDENCE = float(os.getenv('LOCAL_FIRST_MIN_MODEL_CONFIDENCE', '0.70'))
+LOCAL_FIRST_MIN_AGREEMENT = float(os.getenv('LOCAL_FIRST_MIN_AGREEMENT', '0.5'))
+# Symptom-only requests have no detector to cross-check, so they need a stronger symptom match
+LOCAL_FIRST_MIN_SYMPTOM_SCORE = float(os.getenv('LOCAL_FIRST_MIN_SYMPTOM_SCORE', '0.75'))
+
+# Form animal types -> species model in `models`
+LOCAL_MODEL_FOR_ANIMAL = {
+    'cat': 'cat',
+    'cattle': 'cow',
+    'cow': 'cow',
+    'buffalo': 'cow',
+    'dog': 'dog',
+    'sheep': 'sheep'
+}
+
+LOCAL_MODEL_FILES = {
+    'cat': 'cat_disease_best.pt',
+    'cow': 'lumpy_disease_best.pt',
+    'dog': 'dog_disease_best.pt',
+    'sheep': 'sheep_disease_model.pt'
+}
+
+_AGREEMENT_STOPWORDS = {
+    'and', 'the', 'with', 'from', 'that', 'this', 'for', 'are', 'causing', 'disease',
+    'infection', 'condition', 'treatment', 'essential', 'recovery', 'requires', 'often'
+}
+
+prediction_tier_stats = PredictionTierStats()
+
+def run_local_species_model(animal_type, image):
+    """Run the species YOLO model for animal_type; returns (model_key, predictions sorted by confidence)"""
+    model_key = LOCAL_MODEL_FOR_ANIMAL.get((animal_type or '').lower())
+    if not model_key or model_key not in models:
+        return None, []
+
+    predictions = []
+    for result in models[model_key](image):
+        if result.boxes is not None and len(result.boxes) > 0:
+            for box in result.boxes:
+                predictions.append({
+                    'class': result.names[int(box.cls[0])],
+                    'confidence': float(box.conf[0])
+                })
+    predictions.sort(key=lambda x: x['confidence'], reverse=True)
+    return model_key, predictions
+
+def _content_words(text):
+    return {word for word in re.findall(r'[a-z]+', text.lower())
+            if len(word) > 3 and word not in _AGREEMENT_STOPWORDS}
+
+def detection_symptom_agreement(model_key, detected_class, symptoms, symptom_match):
+    """
+    How well the reported symptoms support the detected disease (0-1).
+    1.0 when the symptom scorer reached the same disease, otherwise the share of
+    reported symptoms that share a content word with the detected disease profile.
+    """
+    if not symptoms or detected_class.lower() == 'healthy':
+        # A 'healthy' detection never confirms a sick-animal report
+        return 0.0
+
+    detected = detected_class.lower()
+    if symptom_match:
+        matched_name = symptom_match['name'].lower()
+        if detected in matched_name or matched_name in detected:
+            return 1.0
+
+    profile = TREATMENT_DATABASE.get(model_key, {}).get(detected_class, {})
+    profile_words = _content_words(' '.join([detected_class, profile.get('description', ''), profile.get('treatment', '')]))
+    if not profile_words:
+        return 0.0
+    supported = sum(1 for symptom in symptoms if _content_words(symptom) & profile_words)
+    return supported / len(symptoms)
+
+def try_local_prediction(animal_info, symptoms, severity, image=None):
+    """
+    Local tier of the integrated prediction. Returns (prediction, image_analysis, decision)
+    where prediction is None when the case must be escalated to Gemini.
+    """
+    has_image = image is not None
+    symptom_match, symptom_score = score_symptoms_against_database(animal_info['type'], symptoms, has_image)
+    decision = {'symptom_score': round(symptom_score, 3), 'escalate_reason': None}
+
+    if not has_image:
+        if not symptom_match or symptom_score < LOCAL_FIRST_MIN_SYMPTOM_SCORE:
+            decision['escalate_reason'] = 'weak_symptom_match'
+            return None, None, decision
+        prediction = generate_fallback_comprehensive_prediction(animal_info, symptoms, severity, False)
+        prediction['analysis_type'] = 'Local Symptoms Analysis'
+        return prediction, None, decision
+
+    model_key, detections = run_local_species_model(animal_info['type'], image)
+    if not model_key:
+        decision['escalate_reason'] = 'no_local_model'
+        return None, None, decision
+    if not detections:
+        decision['escalate_reason'] = 'no_detection'
+        return None, None, decision
+
+    top = detections[0]
+    agreement = detection_symptom_agreement(model_key, top['class'], symptoms, symptom_match)
+    decision.update({
+        'model': LOCAL_MODEL_FILES.get(model_key, model_key),
+        'detected_class': top['class'],
+        'model_confidence': round(top['confidence'], 3),
+        'agreement': round(agreement, 3)
+    })
+    if top['confidence'] < LOCAL_FIRST_MIN_MODEL_CONFIDENCE:
+        decision['escalate_reason'] = 'low_model_confidence'
+        return None, None, decision
+    if agreement < LOCAL_FIRST_MIN_AGREEMENT:
+        decision['escalate_reason'] = 'symptom_disagreement'
+        return None, None, decision
+
+    # Both signals agree: build the answer around the detector's finding
+    prediction = generate_fallback_comprehensive_prediction(animal_info, symptoms, severity, True)
+    confidence = round(min(0.95, (top['confidence'] + agreement) / 2 + 0.1), 2)
+    prediction.update({
+        'primary_diagnosis': top['class'],
+        'confidence_score': confidence,
+        'diagnostic_reasoning': f"The {model_key} disease detection model identified {top['class']} in the image "
+                                f"with {top['confidence']:.0%} confidence, and the reported symptoms are consistent with this finding.",
+        'image_symptom_correlation': f"Reported symptoms support the visual detection of {top['class']}",
+        'alternative_diagnoses': [
+            {'disease': d['class'], 'confidence': round(d['confidence'], 2), 'reasoning': 'Also detected by the image model'}
+            for d in detections[1:4] if d['class'] != top['class']
+        ] or prediction['alternative_diagnoses'],
+        'treatment': get_treatment_suggestions(model_key, top['class']),
+        'analysis_type': 'Local Model + Symptoms Analysis'
+    })
+    image_analysis = {
+        'visible_abnormalities': [d['class'] for d in detections[:3]],
+        'symptom_correlation': prediction['image_symptom_correlation'],
+        'confidence': round(top['confidence'], 2),
+        'source': 'local_model'
+    }
+    return prediction, image_analysis, decision
+
+def _is_offline_prediction(prediction):
+    """True for predictions produced by generate_fallback_comprehensive_prediction"""
+    return str(prediction.get('analysis_type', '')).startswith('Enhanced')
+
+# =================== DEADLINE-AWARE INTEGRATED PREDICTION ===================
+# Vercel stops functions after 30s (vercel.json maxDuration); answer with the offline
+# prediction before then and attach the AI answer to the stored record when it lands.
+INTEGRATED_PREDICTION_DEADLINE = float(os.getenv('INTEGRATED_PREDICTION_DEADLINE', '25'))
+integrated_prediction_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('INTEGRATED_PREDICTION_WORKERS', '8')),
+    thread_name_prefix='integrated-prediction'
+)
+
+def _attach_late_ai_result(prediction_id, ai_future):
+    """Store an AI prediction that finished after its request was answered with the offline one"""
+    try:
+        ai_prediction, ai_image_analysis = ai_future.result()
+    except Exception as e:
+        print(f" Late AI prediction failed: {e}")
+        ai_prediction, ai_image_analysis = None, None
+    
+    update = {'ai_pending': False, 'ai_completed_at': datetime.now()}
+    if ai_prediction is not None and not _is_offline_prediction(ai_prediction):
+        update['ai_prediction'] = ai_prediction
+        update['ai_image_analysis'] = ai_image_analysis
+        prediction_tier_stats.record_event('late_ai_attached')
+    else:
+        prediction_tier_stats.record_event('late_ai_failed')
+    
+    try:
+        if predictions_collection is not None:
+            predictions_collection.update_one({'_id': prediction_id}, {'$set': update})
+            print(f" Late AI result recorded for prediction {prediction_id}")
+    except Exception as db_error:
+        print(f" Database update error for late AI prediction: {db_error}")
+
 @app.route('/predict/integrated', methods=['POST'])
 def predict_integrated():
     """Advanced prediction combining image analysis with comprehensive symptom assessment"""
+    request_start = time.time()
+    deadline = Deadline(INTEGRATED_PREDICTION_DEADLINE)
     try:
         # Check authentication
         if 'user_id' not in session:
@@ -3099,12 +3421,28 @@ def predict_integrated():
         if not all_symptoms:
             return jsonify({'success': False, 'error': 'At least one symptom must be provided'}), 400
         
+        animal_info = {
+            'type': animal_type,
+            'age': animal_age,
+            'weight': animal_weight,
+            'breed': animal_breed
+        }
+        
+        # Speculative offline prediction, ready in case the AI path misses the deadline
+        image_requested = 'image' in request.files and request.files['image'].filename != ''
+        fallback_future = integrated_prediction_executor.submit(
+            generate_fallback_comprehensive_prediction, animal_info, all_symptoms, severity, image_requested
+        )
+        
         # Handle image upload and analysis
         image_analysis = None
         image_filename = None
         has_image = False
+        image = None
+        image_bytes = None
+        single_call = INTEGRATED_PREDICTION_MODE == 'single_call'
         
-        if 'image' in request.files and request.files['image'].filename != '':
+        if image_requested:
             file = request.files['image']
             if file and allowed_file(file.filename):
                 try:
@@ -3119,62 +3457,120 @@ def predict_integrated():
                     image.save(image_path)
                     image_filename = unique_filename
                     has_image = True
-                    
-                    # Analyze image with Gemini Vision
-                    image_analysis = analyze_image_with_gemini_advanced(image, animal_type, all_symptoms)
-                    
+                
+                except Exception as img_error:
+                    print(f" Image upload error: {img_error}")
+        
+        # Local tier: species model + symptom scorer, escalate to Gemini only when unsure
+        prediction = None
+        local_decision = None
+        answered_by = TIER_GEMINI
+        if LOCAL_FIRST_ENABLED:
+            try:
+                prediction, local_image_analysis, local_decision = try_local_prediction(
+                    animal_info, all_symptoms, severity, image if has_image else None
+                )
+                if prediction is not None:
+                    image_analysis = local_image_analysis
+                    answered_by = TIER_LOCAL
+                else:
+                    print(f" Escalating integrated prediction to Gemini: {local_decision['escalate_reason']}")
+            except Exception as local_error:
+                print(f" Local prediction error: {local_error}")
+                prediction = None
+        
+        prediction_mode = 'single_call' if single_call and has_image else 'two_step'
+        
+        user_id = session['user_id']
+        
+        def run_ai_path():
+            """Gemini image analysis and diagnosis, charged to the user's token budget"""
+            with token_budget.scope('disease_prediction', user_id):
+                return _run_ai_path()
+        
+        def _run_ai_path():
+            """Gemini image analysis and diagnosis; returns (prediction, image_analysis)"""
+            ai_image_analysis = None
+            if has_image and not single_call:
+                # Analyze image with Gemini Vision (single-call mode analyzes it with the diagnosis)
+                try:
+                    ai_image_analysis = analyze_image_with_gemini_advanced(
+                        image, animal_type, all_symptoms, image_bytes=image_bytes, deadline=deadline
+                    )
                 except Exception as img_error:
                     print(f" Image analysis error: {img_error}")
-                    # Check if it's a rate limit error
                     error_str = str(img_error).lower()
                     if "429" in error_str or "resource exhausted" in error_str or "rate limit" in error_str:
-                        return jsonify({
-                            'success': False,
-                            'error': ' AI Service Temporarily Overloaded',
-                            'detailed_message': 'Our AI analysis service is currently experiencing high demand. Please wait a moment and try again, or proceed with symptom-only analysis.',
-                            'rate_limited': True,
-                            'retry_after': 60  # Suggest retry after 60 seconds
-                        }), 429
+                        raise
                     # Continue without image analysis for other errors
-                    image_analysis = None
-        
-        # Generate comprehensive prediction
-        try:
-            prediction = generate_comprehensive_prediction(
-                animal_info={
-                    'type': animal_type,
-                    'age': animal_age,
-                    'weight': animal_weight,
-                    'breed': animal_breed
-                },
+            
+            if prediction_mode == 'single_call':
+                return generate_single_call_prediction(
+                    animal_info=animal_info,
+                    symptoms=all_symptoms,
+                    duration=symptom_duration,
+                    severity=severity,
+                    recent_changes=recent_changes,
+                    previous_treatment=previous_treatment,
+                    image=image,
+                    image_bytes=image_bytes,
+                    deadline=deadline
+                )
+            return generate_comprehensive_prediction(
+                animal_info=animal_info,
                 symptoms=all_symptoms,
                 duration=symptom_duration,
                 severity=severity,
                 recent_changes=recent_changes,
                 previous_treatment=previous_treatment,
-                image_analysis=image_analysis,
-                has_image=has_image
-            )
-        except Exception as pred_error:
-            print(f" Prediction generation error: {pred_error}")
-            # Check if it's a rate limit error
-            error_str = str(pred_error).lower()
-            if "429" in error_str or "resource exhausted" in error_str or "rate limit" in error_str:
-                return jsonify({
-                    'success': False,
-                    'error': ' AI Service Temporarily Overloaded',
-                    'detailed_message': 'Our AI prediction service is currently experiencing high demand. Please wait a moment and try again.',
-                    'rate_limited': True,
-                    'retry_after': 60
-                }), 429
-            else:
-                # Use fallback prediction for other errors
-                prediction = generate_fallback_comprehensive_prediction(
-                    {'type': animal_type, 'age': animal_age, 'weight': animal_weight, 'breed': animal_breed},
-                    all_symptoms, severity, has_image
-                )
+                image_analysis=ai_image_analysis,
+                has_image=has_image,
+                deadline=deadline
+            ), ai_image_analysis
+        
+        # Generate comprehensive prediction
+        late_ai_future = None
+        if prediction is None and not token_budget.allows_user(user_id):
+            # Daily token budget spent: answer from the offline tier instead of Gemini
+            token_budget.reject('disease_prediction', 'daily token budget exhausted')
+            prediction = dict(fallback_future.result(), token_budget_exceeded=True)
+            answered_by = TIER_FALLBACK
+        if prediction is None:
+            ai_future = integrated_prediction_executor.submit(run_ai_path)
+            try:
+                prediction, image_analysis = ai_future.result(timeout=deadline.remaining())
+            except FuturesTimeoutError:
+                print(f" AI prediction missed the {INTEGRATED_PREDICTION_DEADLINE:.0f}s deadline, returning offline prediction")
+                prediction = dict(fallback_future.result(), deadline_fallback=True, ai_pending=True)
+                answered_by = TIER_FALLBACK
+                late_ai_future = ai_future
+                prediction_tier_stats.record_event('deadline_misses')
+            except Exception as pred_error:
+                print(f" Prediction generation error: {pred_error}")
+                # Check if it's a rate limit error
+                error_str = str(pred_error).lower()
+                if "429" in error_str or "resource exhausted" in error_str or "rate limit" in error_str:
+                    return jsonify({
+                        'success': False,
+                        'error': ' AI Service Temporarily Overloaded',
+                        'detailed_message': 'Our AI prediction service is currently experiencing high demand. Please wait a moment and try again.',
+                        'rate_limited': True,
+                        'retry_after': 60
+                    }), 429
+                else:
+                    # Use fallback prediction for other errors
+                    prediction = fallback_future.result()
+        
+        if answered_by == TIER_GEMINI and _is_offline_prediction(prediction):
+            answered_by = TIER_FALLBACK
+        processing_time = time.time() - request_start
+        # A local answer saves the image analysis call (two-step mode) and the diagnosis call
+        gemini_calls_saved = (2 if has_image and prediction_mode == 'two_step' else 1) if answered_by == TIER_LOCAL else 0
+        prediction_tier_stats.record(answered_by, processing_time, gemini_calls_saved,
+                                     escalated=local_decision is not None and answered_by != TIER_LOCAL)
         
         # Store in database
+        prediction_id = None
         try:
             user_id = session['user_id']
             prediction_data = {
@@ -3195,12 +3591,23 @@ def predict_integrated():
                 'image_analysis': image_analysis,
                 'prediction': prediction,
                 'timestamp': datetime.now(),
-                'prediction_type': 'integrated_image_symptoms'
+                'prediction_type': 'integrated_image_symptoms',
+                'prediction_mode': prediction_mode,
+                'answered_by': answered_by,
+                'local_decision': local_decision,
+                'processing_time': round(processing_time, 3),
+                'ai_pending': late_ai_future is not None
             }
             
             if predictions_collection is not None:
-                predictions_collection.insert_one(prediction_data)
+                insert_result = predictions_collection.insert_one(prediction_data)
+                prediction_id = str(insert_result.inserted_id)
                 print(f" Integrated prediction saved to database")
+                if late_ai_future is not None:
+                    # Attach the AI answer to this record once it arrives
+                    late_ai_future.add_done_callback(
+                        lambda future, doc_id=insert_result.inserted_id: _attach_late_ai_result(doc_id, future)
+                    )
             
         except Exception as db_error:
             print(f" Database save error: {db_error}")
@@ -3208,8 +3615,11 @@ def predict_integrated():
         return jsonify({
             'success': True,
             'prediction': prediction,
+            'prediction_id': prediction_id,
             'has_image': has_image,
-            'image_analysis_available': image_analysis is not None
+            'image_analysis_available': image_analysis is not None,
+            'answered_by': answered_by,
+            'deadline_fallback': late_ai_future is not None
         })
         
     except Exception as e:
@@ -3219,24 +3629,81 @@ def predict_integrated():
             'error': f'Prediction failed: {str(e)}'
         }), 500
 
-def analyze_image_with_gemini_advanced(image, animal_type, symptoms):
+# Response schemas for Gemini structured output; also used to validate parsed JSON
+IMAGE_ANALYSIS_SCHEMA = {
+    'type': 'OBJECT',
+    'properties': {
+        'visible_abnormalities': {'type': 'ARRAY', 'items': {'type': 'STRING'}},
+        'body_condition': {'type': 'STRING'},
+        'skin_coat_condition': {'type': 'STRING'},
+        'eye_nose_condition': {'type': 'STRING'},
+        'posture_behavior': {'type': 'STRING'},
+        'symptom_correlation': {'type': 'STRING'},
+        'visual_severity': {'type': 'STRING'},
+        'confidence': {'type': 'NUMBER'},
+        'additional_observations': {'type': 'STRING'}
+    },
+    'required': ['visible_abnormalities', 'body_condition', 'symptom_correlation', 'visual_severity']
+}
+
+COMPREHENSIVE_PREDICTION_SCHEMA = {
+    'type': 'OBJECT',
+    'properties': {
+        'primary_diagnosis': {'type': 'STRING'},
+        'confidence_score': {'type': 'NUMBER'},
+        'diagnostic_reasoning': {'type': 'STRING'},
+        'image_symptom_correlation': {'type': 'STRING'},
+        'alternative_diagnoses': {
+            'type': 'ARRAY',
+            'items': {
+                'type': 'OBJECT',
+                'properties': {
+                    'disease': {'type': 'STRING'},
+                    'confidence': {'type': 'NUMBER'},
+                    'reasoning': {'type': 'STRING'}
+                },
+                'required': ['disease']
+            }
+        },
+        'severity_assessment': {'type': 'STRING'},
+        'treatment_recommendations': {
+            'type': 'OBJECT',
+            'properties': {
+                'immediate_actions': {'type': 'ARRAY', 'items': {'type': 'STRING'}},
+                'ongoing_treatment': {'type': 'ARRAY', 'items': {'type': 'STRING'}},
+                'monitoring': {'type': 'STRING'},
+                'veterinary_urgency': {'type': 'STRING'}
+            },
+            'required': ['immediate_actions', 'veterinary_urgency']
+        },
+        'prognosis': {'type': 'STRING'},
+        'risk_factors': {'type': 'ARRAY', 'items': {'type': 'STRING'}},
+        'prevention_advice': {'type': 'STRING'}
+    },
+    'required': ['primary_diagnosis', 'confidence_score', 'diagnostic_reasoning', 'treatment_recommendations']
+}
+
+SINGLE_CALL_PREDICTION_SCHEMA = dict(
+    COMPREHENSIVE_PREDICTION_SCHEMA,
+    properties=dict(COMPREHENSIVE_PREDICTION_SCHEMA['properties'], image_findings=dict(IMAGE_ANALYSIS_SCHEMA, required=[]))
+)
+
+def _estimate_vision_tokens(image):
+    """Token estimate for an image at the size vision preparation sends it"""
+    if image is None:
+        return estimate_image_tokens()
+    width, height = image.size
+    scale = min(1.0, vision_image_preparer.max_side / max(width, height, 1))
+    return estimate_image_tokens(int(width * scale), int(height * scale))
+
+def analyze_image_with_gemini_advanced(image, animal_type, symptoms, image_bytes=None, deadline=None):
     """Advanced image analysis using Gemini Vision API with symptom correlation"""
     try:
         if not GEMINI_AVAILABLE:
             return None
             
-        # Convert PIL image to bytes
-        img_byte_arr = io.BytesIO()
-        image.save(img_byte_arr, format='JPEG')
-        img_byte_arr = img_byte_arr.getvalue()
-        
-        # Prepare the image for Gemini
-        image_parts = [
-            {
-                "mime_type": "image/jpeg",
-                "data": img_byte_arr
-            }
-        ]
+        # Downscale, strip metadata and compress to the byte budget (cached by image digest)
+        image_parts = [vision_image_preparer.prepare_part(image=image, image_bytes=image_bytes)]
         
         # Create detailed prompt for image analysis
         symptoms_text = ', '.join(symptoms) if symptoms else 'No specific symptoms provided'
@@ -3265,19 +3732,22 @@ Provide analysis in JSON format:
     "additional_observations": "Any other relevant visual findings"
 }}"""
 
+        token_budget.note_prompt(prompt, _estimate_vision_tokens(image))
+        
         # Use the robust API call function with disease detection API key
-        response_text, error = call_gemini_with_retry('gemini-2.0-flash-exp', prompt, image_parts, api_key=GEMINI_API_KEY_DISEASE)
+        response_text, error = call_gemini_with_retry('gemini-2.0-flash-exp', prompt, image_parts, deadline=deadline,
+                                                      response_schema=IMAGE_ANALYSIS_SCHEMA)
         
         if error:
             print(f" Gemini image analysis error: {error}")
             return None
             
         if response_text:
-            try:
-                # Try to parse JSON response
-                image_analysis = json.loads(response_text)
+            # Strip fences, extract or repair the JSON and validate it before giving up on it
+            image_analysis, _ = structured_output_parser.parse(response_text, IMAGE_ANALYSIS_SCHEMA, 'image_analysis')
+            if image_analysis is not None:
                 return image_analysis
-            except json.JSONDecodeError:
+            else:
                 # Extract key information from text if JSON fails
                 return {
                     "visible_abnormalities": ["Analysis completed but specific details not structured"],
@@ -3294,19 +3764,86 @@ Provide analysis in JSON format:
         return None
 
 
-def generate_comprehensive_prediction(animal_info, symptoms, duration, severity, recent_changes, previous_treatment, image_analysis, has_image):
+# JSON layout shared by every comprehensive prediction prompt
+COMPREHENSIVE_PREDICTION_JSON_FORMAT = """{
+    "primary_diagnosis": "Most likely specific disease name",
+    "confidence_score": 0.85,
+    "diagnostic_reasoning": "Detailed explanation of how symptoms and image findings lead to this diagnosis",
+    "image_symptom_correlation": "How visual findings correlate with reported symptoms",
+    "alternative_diagnoses": [
+        {
+            "disease": "Alternative disease name",
+            "confidence": 0.65,
+            "reasoning": "Why this is a possibility"
+        }
+    ],
+    "severity_assessment": "mild/moderate/severe with justification",
+    "treatment_recommendations": {
+        "immediate_actions": ["Action 1", "Action 2", "Action 3"],
+        "ongoing_treatment": ["Treatment 1", "Treatment 2"],
+        "monitoring": "What to monitor and when",
+        "veterinary_urgency": "immediate/within 24 hours/within week/routine follow-up"
+    },
+    "prognosis": "Expected outcome with treatment",
+    "risk_factors": ["Risk factor 1", "Risk factor 2"],
+    "prevention_advice": "How to prevent recurrence or similar issues"
+}"""
+
+# Single-call mode also returns the image findings that the two-step mode gets from a separate request
+SINGLE_CALL_PREDICTION_JSON_FORMAT = COMPREHENSIVE_PREDICTION_JSON_FORMAT[:-2] + """,
+    "image_findings": {
+        "visible_abnormalities": ["List of visible abnormalities"],
+        "body_condition": "Overall physical condition assessment",
+        "skin_coat_condition": "Skin and coat/fur appearance",
+        "eye_nose_condition": "Eyes, nose, mouth appearance",
+        "posture_behavior": "Visible posture and behavioral indicators",
+        "symptom_correlation": "How image findings correlate with reported symptoms",
+        "visual_severity": "mild/moderate/severe based on visual indicators",
+        "confidence": 0.85,
+        "additional_observations": "Any other relevant visual findings"
+    }
+}"""
+
+# 'two_step' analyzes the image and then diagnoses; 'single_call' does both in one multimodal request
+INTEGRATED_PREDICTION_MODE = os.getenv('INTEGRATED_PREDICTION_MODE', 'two_step').lower()
+if INTEGRATED_PREDICTION_MODE not in ('two_step', 'single_call'):
+    print(f" Unknown INTEGRATED_PREDICTION_MODE '{INTEGRATED_PREDICTION_MODE}', using two_step")
+    INTEGRATED_PREDICTION_MODE = 'two_step'
+
+def _describe_animal(animal_info):
+    """One-line animal description used in diagnosis prompts"""
+    animal_description = f"{animal_info['type']}"
+    if animal_info.get('breed'):
+        animal_description += f" ({animal_info['breed']})"
+    if animal_info.get('age'):
+        animal_description += f", {animal_info['age']} old"
+    if animal_info.get('weight'):
+        animal_description += f", {animal_info['weight']}"
+    return animal_description
+
+def _clinical_presentation(symptoms, duration, severity, recent_changes, previous_treatment):
+    """Clinical presentation block shared by diagnosis prompts; free-text fields are trimmed to the field budget"""
+    return f"""CLINICAL PRESENTATION:
+- Primary symptoms: {token_budget.trim_field(', '.join(symptoms))}
+- Duration: {token_budget.trim_field(duration) or 'Not specified'}
+- Severity: {severity}
+- Recent changes: {token_budget.trim_field(recent_changes) or 'None reported'}
+- Previous treatment: {token_budget.trim_field(previous_treatment) or 'None administered'}"""
+
+def _tag_analysis_type(prediction, has_image):
+    """Enhance prediction with image correlation info"""
+    if has_image:
+        prediction['analysis_type'] = 'Image + Symptoms Analysis'
+        prediction['image_analyzed'] = True
+    else:
+        prediction['analysis_type'] = 'Symptoms Analysis Only'
+        prediction['image_analyzed'] = False
+    return prediction
+
+def generate_comprehensive_prediction(animal_info, symptoms, duration, severity, recent_changes, previous_treatment, image_analysis, has_image, deadline=None):
     """Generate comprehensive disease prediction combining image and symptom analysis"""
-    
+
     try:
-        # Prepare comprehensive analysis prompt
-        animal_description = f"{animal_info['type']}"
-        if animal_info.get('breed'):
-            animal_description += f" ({animal_info['breed']})"
-        if animal_info.get('age'):
-            animal_description += f", {animal_info['age']} old"
-        if animal_info.get('weight'):
-            animal_description += f", {animal_info['weight']}"
-        
         # Image analysis summary
         image_summary = ""
         if has_image and image_analysis:
@@ -3323,18 +3860,13 @@ IMAGE ANALYSIS FINDINGS:
             image_summary = "\nIMAGE ANALYSIS: Image was provided but analysis was not successful."
         else:
             image_summary = "\nIMAGE ANALYSIS: No image provided for visual assessment."
-        
+
         prompt = f"""You are a veterinary expert providing comprehensive disease diagnosis by combining clinical symptoms with visual image analysis.
 
 ANIMAL INFORMATION:
-- Species: {animal_description}
+- Species: {_describe_animal(animal_info)}
 
-CLINICAL PRESENTATION:
-- Primary symptoms: {', '.join(symptoms)}
-- Duration: {duration or 'Not specified'}
-- Severity: {severity}
-- Recent changes: {recent_changes or 'None reported'}
-- Previous treatment: {previous_treatment or 'None administered'}
+{_clinical_presentation(symptoms, duration, severity, recent_changes, previous_treatment)}
 
 {image_summary}
 
@@ -3342,68 +3874,93 @@ DIAGNOSTIC TASK:
 Provide a comprehensive disease prediction that CORRELATES both the clinical symptoms AND image findings (if available). The diagnosis should be specific and consider how visual indicators support or contradict the reported symptoms.
 
 Respond in JSON format:
-{{
-    "primary_diagnosis": "Most likely specific disease name",
-    "confidence_score": 0.85,
-    "diagnostic_reasoning": "Detailed explanation of how symptoms and image findings lead to this diagnosis",
-    "image_symptom_correlation": "How visual findings correlate with reported symptoms",
-    "alternative_diagnoses": [
-        {{
-            "disease": "Alternative disease name",
-            "confidence": 0.65,
-            "reasoning": "Why this is a possibility"
-        }}
-    ],
-    "severity_assessment": "mild/moderate/severe with justification",
-    "treatment_recommendations": {{
-        "immediate_actions": ["Action 1", "Action 2", "Action 3"],
-        "ongoing_treatment": ["Treatment 1", "Treatment 2"],
-        "monitoring": "What to monitor and when",
-        "veterinary_urgency": "immediate/within 24 hours/within week/routine follow-up"
-    }},
-    "prognosis": "Expected outcome with treatment",
-    "risk_factors": ["Risk factor 1", "Risk factor 2"],
-    "prevention_advice": "How to prevent recurrence or similar issues"
-}}
+{COMPREHENSIVE_PREDICTION_JSON_FORMAT}
 
 Focus on providing the most accurate diagnosis possible by integrating ALL available information."""
 
         if GEMINI_AVAILABLE:
-            # Use the robust API call function with disease detection API key
-            response_text, error = call_gemini_with_retry('gemini-2.0-flash-exp', prompt, api_key=GEMINI_API_KEY_DISEASE)
+            token_budget.note_prompt(prompt)
             
+            # Latency-critical call: hedge across fallback models when enabled
+            response_text, error = call_gemini_hedged('gemini-2.0-flash-exp', prompt, deadline=deadline,
+                                                      response_schema=COMPREHENSIVE_PREDICTION_SCHEMA)
+
             if error:
                 print(f" Gemini AI error: {error}")
                 return generate_fallback_comprehensive_prediction(animal_info, symptoms, severity, has_image)
-                
+
             if response_text:
-                try:
-                    prediction = json.loads(response_text)
-                    
-                    # Enhance prediction with image correlation info
-                    if has_image:
-                        prediction['analysis_type'] = 'Image + Symptoms Analysis'
-                        prediction['image_analyzed'] = True
-                    else:
-                        prediction['analysis_type'] = 'Symptoms Analysis Only'
-                        prediction['image_analyzed'] = False
-                    
-                    return prediction
-                    
-                except json.JSONDecodeError:
-                    # Fallback to text parsing
-                    return parse_comprehensive_prediction_text(response_text, animal_info['type'], has_image)
+                prediction, _ = structured_output_parser.parse(
+                    response_text, COMPREHENSIVE_PREDICTION_SCHEMA, 'comprehensive_prediction'
+                )
+                if prediction is not None:
+                    return _tag_analysis_type(prediction, has_image)
+
+                # Fallback to text parsing
+                return parse_comprehensive_prediction_text(response_text, animal_info['type'], has_image)
             else:
                 return generate_fallback_comprehensive_prediction(animal_info, symptoms, severity, has_image)
-                
+
         else:
             return generate_fallback_comprehensive_prediction(animal_info, symptoms, severity, has_image)
-            
+
     except Exception as e:
         print(f" Error in comprehensive prediction: {e}")
         return generate_fallback_comprehensive_prediction(animal_info, symptoms, severity, has_image)
 
 
+def generate_single_call_prediction(animal_info, symptoms, duration, severity, recent_changes, previous_treatment, image, image_bytes=None, deadline=None):
+    """
+    Diagnose from the image and the full clinical context in one multimodal request.
+    Returns (prediction, image_analysis): prediction follows the generate_comprehensive_prediction
+    schema and image_analysis the analyze_image_with_gemini_advanced one (None when unavailable).
+    """
+    try:
+        if not GEMINI_AVAILABLE:
+            return generate_fallback_comprehensive_prediction(animal_info, symptoms, severity, True), None
+
+        image_parts = [vision_image_preparer.prepare_part(image=image, image_bytes=image_bytes)]
+
+        prompt = f"""You are a veterinary expert providing comprehensive disease diagnosis by combining clinical symptoms with visual analysis of the attached {animal_info['type']} image.
+
+ANIMAL INFORMATION:
+- Species: {_describe_animal(animal_info)}
+
+{_clinical_presentation(symptoms, duration, severity, recent_changes, previous_treatment)}
+
+DIAGNOSTIC TASK:
+1. Examine the image for visible disease indicators: abnormalities, body condition, skin/coat, eyes/nose/mouth and posture.
+2. Provide a comprehensive disease prediction that CORRELATES the clinical symptoms with what you see in the image. The diagnosis should be specific and consider how visual indicators support or contradict the reported symptoms.
+
+Respond in JSON format:
+{SINGLE_CALL_PREDICTION_JSON_FORMAT}
+
+Focus on providing the most accurate diagnosis possible by integrating ALL available information."""
+
+        token_budget.note_prompt(prompt, _estimate_vision_tokens(image))
+        response_text, error = call_gemini_hedged('gemini-2.0-flash-exp', prompt, image_parts, deadline=deadline,
+                                                  response_schema=SINGLE_CALL_PREDICTION_SCHEMA)
+
+        if error or not response_text:
+            print(f" Gemini single-call prediction error: {error}")
+            return generate_fallback_comprehensive_prediction(animal_info, symptoms, severity, True), None
+
+        prediction, _ = structured_output_parser.parse(
+            response_text, SINGLE_CALL_PREDICTION_SCHEMA, 'single_call_prediction'
+        )
+        if prediction is None:
+            return parse_comprehensive_prediction_text(response_text, animal_info['type'], True), None
+
+        image_analysis = prediction.pop('image_findings', None)
+        if not isinstance(image_analysis, dict):
+            image_analysis = None
+        return _tag_analysis_type(prediction, True), image_analysis
+
+    except Exception as e:
+        print(f" Error in single-call prediction: {e}")
+        return generate_fallback_comprehensive_prediction(animal_info, symptoms, severity, True), None
+
+
 def parse_comprehensive_prediction_text(text_response, animal_type, has_image):
     """Parse text response when JSON parsing fails"""
     try:
@@ -3464,99 +4021,101 @@ def parse_comprehensive_prediction_text(text_response, animal_type, has_image):
         )
 
 
-def generate_fallback_comprehensive_prediction(animal_info, symptoms, severity, has_image):
-    """Generate enhanced fallback prediction when AI is not available"""
-    
-    # Comprehensive disease database with detailed symptom matching
-    disease_database = {
-        'cattle': {
-            'bovine_respiratory_disease': {
-                'symptoms': ['coughing', 'difficulty breathing', 'nasal discharge', 'fever', 'lethargy'],
-                'visual_signs': ['labored breathing', 'nasal discharge', 'droopy ears', 'head down posture'],
-                'name': 'Bovine Respiratory Disease Complex',
-                'confidence': 0.88,
-                'urgency': 'immediate'
-            },
-            'mastitis': {
-                'symptoms': ['swollen udder', 'hot udder', 'hard udder', 'abnormal milk', 'fever'],
-                'visual_signs': ['visible udder swelling', 'discolored milk', 'cow discomfort'],
-                'name': 'Mastitis',
-                'confidence': 0.92,
-                'urgency': 'within 24 hours'
-            },
-            'lameness': {
-                'symptoms': ['limping', 'foot problems', 'reluctance to move', 'favoring one leg'],
-                'visual_signs': ['abnormal gait', 'weight shifting', 'hoof problems'],
-                'name': 'Lameness/Foot Problems',
-                'confidence': 0.85,
-                'urgency': 'within week'
-            },
-            'digestive_issues': {
-                'symptoms': ['diarrhea', 'bloating', 'loss of appetite', 'dehydration', 'abdominal pain'],
-                'visual_signs': ['sunken eyes', 'poor coat', 'distended abdomen', 'weakness'],
-                'name': 'Digestive Disorder',
-                'confidence': 0.80,
-                'urgency': 'within 24 hours'
-            }
+# Comprehensive disease database with detailed symptom matching
+FALLBACK_DISEASE_DATABASE = {
+    'cattle': {
+        'bovine_respiratory_disease': {
+            'symptoms': ['coughing', 'difficulty breathing', 'nasal discharge', 'fever', 'lethargy'],
+            'visual_signs': ['labored breathing', 'nasal discharge', 'droopy ears', 'head down posture'],
+            'name': 'Bovine Respiratory Disease Complex',
+            'confidence': 0.88,
+            'urgency': 'immediate'
         },
-        'dog': {
-            'gastroenteritis': {
-                'symptoms': ['vomiting', 'diarrhea', 'loss of appetite', 'lethargy', 'dehydration'],
-                'visual_signs': ['weakness', 'dehydration signs', 'poor posture'],
-                'name': 'Gastroenteritis',
-                'confidence': 0.85,
-                'urgency': 'within 24 hours'
-            },
-            'skin_allergies': {
-                'symptoms': ['scratching', 'itching', 'red skin', 'hair loss', 'hot spots'],
-                'visual_signs': ['visible scratching', 'skin irritation', 'hair loss patches'],
-                'name': 'Allergic Dermatitis',
-                'confidence': 0.87,
-                'urgency': 'within week'
-            },
-            'ear_infection': {
-                'symptoms': ['head shaking', 'ear scratching', 'ear odor', 'discharge', 'balance problems'],
-                'visual_signs': ['head tilting', 'ear discharge', 'scratching behavior'],
-                'name': 'Ear Infection',
-                'confidence': 0.90,
-                'urgency': 'within week'
-            },
-            'kennel_cough': {
-                'symptoms': ['persistent cough', 'retching', 'gagging', 'exercise intolerance'],
-                'visual_signs': ['coughing fits', 'throat irritation signs'],
-                'name': 'Kennel Cough',
-                'confidence': 0.83,
-                'urgency': 'within week'
-            }
+        'mastitis': {
+            'symptoms': ['swollen udder', 'hot udder', 'hard udder', 'abnormal milk', 'fever'],
+            'visual_signs': ['visible udder swelling', 'discolored milk', 'cow discomfort'],
+            'name': 'Mastitis',
+            'confidence': 0.92,
+            'urgency': 'within 24 hours'
         },
-        'cat': {
-            'upper_respiratory': {
-                'symptoms': ['sneezing', 'nasal discharge', 'eye discharge', 'congestion'],
-                'visual_signs': ['nasal discharge', 'squinting', 'mouth breathing'],
-                'name': 'Upper Respiratory Infection',
-                'confidence': 0.85,
-                'urgency': 'within week'
-            },
-            'urinary_issues': {
-                'symptoms': ['frequent urination', 'straining', 'blood in urine', 'inappropriate urination'],
-                'visual_signs': ['straining posture', 'frequent litter box visits'],
-                'name': 'Feline Lower Urinary Tract Disease',
-                'confidence': 0.88,
-                'urgency': 'within 24 hours'
-            },
-            'skin_problems': {
-                'symptoms': ['excessive grooming', 'hair loss', 'skin irritation', 'scratching'],
-                'visual_signs': ['over-groomed areas', 'skin lesions', 'hair loss patches'],
-                'name': 'Feline Dermatitis',
-                'confidence': 0.82,
-                'urgency': 'within week'
-            }
+        'lameness': {
+            'symptoms': ['limping', 'foot problems', 'reluctance to move', 'favoring one leg'],
+            'visual_signs': ['abnormal gait', 'weight shifting', 'hoof problems'],
+            'name': 'Lameness/Foot Problems',
+            'confidence': 0.85,
+            'urgency': 'within week'
+        },
+        'digestive_issues': {
+            'symptoms': ['diarrhea', 'bloating', 'loss of appetite', 'dehydration', 'abdominal pain'],
+            'visual_signs': ['sunken eyes', 'poor coat', 'distended abdomen', 'weakness'],
+            'name': 'Digestive Disorder',
+            'confidence': 0.80,
+            'urgency': 'within 24 hours'
+        }
+    },
+    'dog': {
+        'gastroenteritis': {
+            'symptoms': ['vomiting', 'diarrhea', 'loss of appetite', 'lethargy', 'dehydration'],
+            'visual_signs': ['weakness', 'dehydration signs', 'poor posture'],
+            'name': 'Gastroenteritis',
+            'confidence': 0.85,
+            'urgency': 'within 24 hours'
+        },
+        'skin_allergies': {
+            'symptoms': ['scratching', 'itching', 'red skin', 'hair loss', 'hot spots'],
+            'visual_signs': ['visible scratching', 'skin irritation', 'hair loss patches'],
+            'name': 'Allergic Dermatitis',
+            'confidence': 0.87,
+            'urgency': 'within week'
+        },
+        'ear_infection': {
+            'symptoms': ['head shaking', 'ear scratching', 'ear odor', 'discharge', 'balance problems'],
+            'visual_signs': ['head tilting', 'ear discharge', 'scratching behavior'],
+            'name': 'Ear Infection',
+            'confidence': 0.90,
+            'urgency': 'within week'
+        },
+        'kennel_cough': {
+            'symptoms': ['persistent cough', 'retching', 'gagging', 'exercise intolerance'],
+            'visual_signs': ['coughing fits', 'throat irritation signs'],
+            'name': 'Kennel Cough',
+            'confidence': 0.83,
+            'urgency': 'within week'
+        }
+    },
+    'cat': {
+        'upper_respiratory': {
+            'symptoms': ['sneezing', 'nasal discharge', 'eye discharge', 'congestion'],
+            'visual_signs': ['nasal discharge', 'squinting', 'mouth breathing'],
+            'name': 'Upper Respiratory Infection',
+            'confidence': 0.85,
+            'urgency': 'within week'
+        },
+        'urinary_issues': {
+            'symptoms': ['frequent urination', 'straining', 'blood in urine', 'inappropriate urination'],
+            'visual_signs': ['straining posture', 'frequent litter box visits'],
+            'name': 'Feline Lower Urinary Tract Disease',
+            'confidence': 0.88,
+            'urgency': 'within 24 hours'
+        },
+        'skin_problems': {
+            'symptoms': ['excessive grooming', 'hair loss', 'skin irritation', 'scratching'],
+            'visual_signs': ['over-groomed areas', 'skin lesions', 'hair loss patches'],
+            'name': 'Feline Dermatitis',
+            'confidence': 0.82,
+            'urgency': 'within week'
         }
     }
-    
+}
+
+# Searchable by the chatbot: offline answers and reference passages for Gemini prompts
+knowledge_index.build(veterinary_passages(TREATMENT_DATABASE, MOCK_DISEASE_DATABASE, FALLBACK_DISEASE_DATABASE))
+
+def score_symptoms_against_database(animal_type, symptoms, has_image):
+    """Symptom scorer behind the offline prediction: returns (best_match, best_score)"""
     # Find best match using advanced scoring
     symptom_text = ' '.join(symptoms).lower()
-    animal_diseases = disease_database.get(animal_info['type'], {})
+    animal_diseases = FALLBACK_DISEASE_DATABASE.get(animal_type, {})
     
     best_match = None
     best_score = 0
@@ -3579,6 +4138,14 @@ def generate_fallback_comprehensive_prediction(animal_info, symptoms, severity,
             best_score = total_score
             best_match = disease_data
     
+    return best_match, best_score
+
+
+def generate_fallback_comprehensive_prediction(animal_info, symptoms, severity, has_image):
+    """Generate enhanced fallback prediction when AI is not available"""
+    
+    best_match, best_score = score_symptoms_against_database(animal_info['type'], symptoms, has_image)
+    
     # Fallback if no good match
     if not best_match or best_score < 0.3:
         best_match = {
@@ -3761,11 +4328,12 @@ def chat_endpoint():
     if is_available == "quota_exceeded":
         # Get fallback response from chatbot
         user_message = request.get_json().get('message', '') if request.get_json() else ''
-        fallback_response = chatbot._get_fallback_response(user_message) if chatbot else get_enhanced_fallback_response(user_message)
+        language = request.get_json().get('language', 'en') if request.get_json() else 'en'
+        fallback_response = chatbot._get_fallback_response(user_message, language) if chatbot else get_enhanced_fallback_response(user_message, language)
         
         return jsonify({
             'success': True,
-            'response': f"I've reached my daily usage limit, but here's some helpful guidance:\n\n{fallback_response}",
+            'response': f"{fallback_corpus.text('notice.daily_usage_limit', language)}\n\n{fallback_response}",
             'is_fallback': True,
             'quota_info': {
                 'quota_exceeded': True,
@@ -3824,12 +4392,8 @@ def chat_endpoint():
         print(f" Processing message: {message[:50]}{'...' if len(message) > 50 else ''}")
         print(f" Session key: {session_key}")
         
-        # Load previous conversation history for this session from chatbot
-        if hasattr(chatbot, 'load_session_history'):
-            chatbot.load_session_history(session_key)
-        
-        # Process the query with session context
-        response = chatbot.process_text_query(message, language, session_key)
+        # Process the query with session context (the chatbot looks up this session's history)
+        response = chatbot.process_text_query(message, language, session_key, user_id=session.get('user_id'))
         
         processing_time = time.time() - start_time
         print(f" Response generated in {processing_time:.2f} seconds")
@@ -3847,7 +4411,7 @@ def chat_endpoint():
                     'type': 'text',
                     'processing_time': processing_time
                 }
-                db.conversations.insert_one(conversation_doc)
+                conversation_writer.insert(db.conversations, conversation_doc)  # written behind, off the request path
             except Exception as db_error:
                 print(f"Database error storing conversation: {db_error}")
         
@@ -3866,6 +4430,99 @@ def chat_endpoint():
             'fallback_response': 'I encountered an error processing your request. Please try again or contact support if the problem persists.'
         })
 
+def _sse_event(payload):
+    """Format a payload as a Server-Sent Events data frame"""
+    return f"data: {json.dumps(payload)}\n\n"
+
+@app.route('/api/chat/stream', methods=['POST'])
+def chat_stream_endpoint():
+    """Stream chatbot responses to the browser over Server-Sent Events"""
+    # Check if user is logged in
+    if 'user_id' not in session:
+        return jsonify({
+            'success': False, 
+            'error': 'Please log in to use the chatbot'
+        }), 401
+    
+    data = request.get_json(silent=True)
+    if not data:
+        return jsonify({'success': False, 'error': 'No data received'})
+    
+    message = data.get('message', '').strip()
+    language = data.get('language', 'en')
+    session_key = data.get('session_key', None)
+    
+    if not message:
+        return jsonify({'success': False, 'error': 'Empty message'})
+    
+    user_id = session['user_id']
+    if not session_key:
+        session_key = f"chat_{user_id}_{int(time.time())}"
+    
+    is_available, status_message = get_chatbot_status()
+    
+    def generate():
+        start_time = time.time()
+        yield _sse_event({'type': 'start', 'session_key': session_key})
+        
+        if is_available == "quota_exceeded" or not is_available:
+            fallback_response = chatbot._get_fallback_response(message, language) if chatbot else get_enhanced_fallback_response(message, language)
+            events = iter([
+                {'type': 'chunk', 'text': fallback_response},
+                {'type': 'done', 'response': fallback_response, 'is_fallback': True}
+            ])
+        else:
+            events = chatbot.stream_text_query(message, language, session_key, user_id=user_id)
+        
+        final_event = None
+        try:
+            for event in events:
+                if event.get('type') == 'done':
+                    final_event = event
+                    break
+                yield _sse_event(event)
+        except Exception as e:
+            print(f"Error while streaming chat response: {e}")
+            traceback.print_exc()
+            yield _sse_event({'type': 'error', 'error': f'Server error: {str(e)}'})
+            return
+        
+        if final_event is None:
+            yield _sse_event({'type': 'error', 'error': 'Stream ended unexpectedly'})
+            return
+        
+        processing_time = time.time() - start_time
+        print(f" Streamed response completed in {processing_time:.2f} seconds")
+        
+        # Persist the complete exchange once the stream has finished; a cut-off answer is not kept
+        if db is not None and not final_event.get('incomplete'):
+            try:
+                conversation_writer.insert(db.conversations, {
+                    'user_id': user_id,
+                    'session_key': session_key,
+                    'message': message,
+                    'response': final_event.get('response', ''),
+                    'language': language,
+                    'timestamp': datetime.now(timezone.utc),
+                    'type': 'text',
+                    'streamed': True,
+                    'processing_time': processing_time
+                })
+            except Exception as db_error:
+                print(f"Database error storing streamed conversation: {db_error}")
+        
+        final_event['session_key'] = session_key
+        yield _sse_event(final_event)
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'  # Disable proxy buffering so chunks reach slow clients immediately
+        }
+    )
+
 @app.route('/api/chat/upload', methods=['POST'])
 def upload_for_analysis():
     """Handle file uploads for analysis - optimized for better error handling"""
@@ -3902,6 +4559,7 @@ def upload_for_analysis():
         file = request.files['file']
         question = request.form.get('question', '')
         language = request.form.get('language', 'en')
+        session_key = request.form.get('session_key') or None
         
         if file.filename == '':
             return jsonify({'success': False, 'error': 'No file selected'})
@@ -3915,7 +4573,7 @@ def upload_for_analysis():
         if file_ext in ['png', 'jpg', 'jpeg', 'webp']:
             # Process as image with better error handling
             try:
-                response = chatbot.analyze_image(file, question, language)
+                response = chatbot.analyze_image(file, question, language, user_id=session.get('user_id'))
             except Exception as img_error:
                 print(f"Image analysis error: {img_error}")
                 return jsonify({
@@ -3927,7 +4585,7 @@ def upload_for_analysis():
         elif file_ext == 'pdf':
             # Process as PDF
             try:
-                response = chatbot.process_pdf(file, question, language)
+                response = chatbot.process_pdf(file, question, language, user_id=session.get('user_id'), session_key=session_key)
             except Exception as pdf_error:
                 print(f"PDF analysis error: {pdf_error}")
                 return jsonify({
@@ -3959,7 +4617,7 @@ def upload_for_analysis():
                     'type': 'file_analysis',
                     'processing_time': processing_time
                 }
-                db.conversations.insert_one(conversation_doc)
+                conversation_writer.insert(db.conversations, conversation_doc)  # written behind, off the request path
             except Exception as db_error:
                 print(f"Database error storing conversation: {db_error}")
         
@@ -4077,7 +4735,7 @@ def get_chat_history():
         if not is_available:
             return jsonify({'success': False, 'error': f'Chatbot service unavailable: {status_message}'})
         
-        response = chatbot.get_conversation_history()
+        response = chatbot.get_conversation_history(session_key)
         response['session_key'] = session_key
         return jsonify(response)
         
@@ -4154,9 +4812,14 @@ def clear_conversation():
         if not session_key:
             return jsonify({'success': False, 'error': 'Session key required'})
         
+        # Drop the chatbot's context for the session (and its shared copy)
+        if chatbot is not None:
+            chatbot.clear_conversation(session_key)
+        
         # Clear from database
         if db is not None:
             try:
+                conversation_writer.flush()  # Exchanges still queued would otherwise reappear
                 result = db.conversations.delete_many({
                     'user_id': session['user_id'],
                     'session_key': session_key
@@ -4179,7 +4842,7 @@ def clear_conversation():
         if not is_available:
             return jsonify({'success': False, 'error': f'Chatbot service unavailable: {status_message}'})
         
-        response = chatbot.clear_conversation()
+        response = chatbot.clear_conversation(session_key)
         response['session_key'] = session_key
         return jsonify(response)
         
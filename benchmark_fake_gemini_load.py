@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Load test against the offline fake Gemini backend
+Drives /api/chat, /predict/integrated and /api/chat/upload concurrently through the Flask
+test client with GEMINI_BACKEND=fake, so rate limiting, retries, key failover, fallbacks
+and caching run at realistic concurrency without network access or real quota.
+
+Usage: python benchmark_fake_gemini_load.py [--requests N] [--concurrency C] [--endpoint chat|integrated|upload|all]
+Latency and fault injection come from the GEMINI_FAKE_* variables (see .env.example).
+"""
+
+import os
+import io
+import sys
+import time
+import random
+import tempfile
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+
+# Must be set before the app (and its Gemini import) is loaded
+os.environ['GEMINI_BACKEND'] = 'fake'
+os.environ.setdefault('GEMINI_QUOTA_LEDGER_PATH', os.path.join(tempfile.mkdtemp(), 'fake_gemini_ledger.db'))
+
+from PIL import Image
+
+import app as pashu_app
+import fake_gemini
+
+CHAT_MESSAGES = [
+    "My cow has a fever and is not eating",
+    "How do I treat mastitis in cows?",
+    "My dog has diarrhea since yesterday",
+    "Goat is coughing and has nasal discharge",
+    "What vaccines does a puppy need?",
+]
+
+INTEGRATED_CASES = [
+    {'animal_type': 'cow', 'symptoms[]': ['fever', 'nasal discharge', 'coughing'], 'severity': 'moderate'},
+    {'animal_type': 'dog', 'symptoms[]': ['itching', 'hair loss'], 'severity': 'mild'},
+    {'animal_type': 'sheep', 'symptoms[]': ['lameness', 'drooling'], 'severity': 'severe'},
+]
+
+
+def synthetic_image_bytes(seed):
+    rng = random.Random(seed)
+    image = Image.new('RGB', (640, 480), (rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=85)
+    return buffer.getvalue()
+
+
+def make_client(user_id):
+    client = pashu_app.app.test_client()
+    with client.session_transaction() as flask_session:
+        flask_session['user_id'] = user_id
+    return client
+
+
+def run_request(endpoint, index):
+    client = make_client(f"load-test-{index % 20}")
+    start = time.perf_counter()
+    if endpoint == 'chat':
+        response = client.post('/api/chat', json={
+            'message': f"{CHAT_MESSAGES[index % len(CHAT_MESSAGES)]} (case {index % 7})",
+            'language': 'en',
+            'session_key': f"load_{index % 20}"
+        })
+    elif endpoint == 'integrated':
+        form = dict(INTEGRATED_CASES[index % len(INTEGRATED_CASES)])
+        if index % 2 == 0:
+            form['image'] = (io.BytesIO(synthetic_image_bytes(index)), 'animal.jpg')
+        response = client.post('/predict/integrated', data=form, content_type='multipart/form-data')
+    else:
+        response = client.post('/api/chat/upload', data={
+            'file': (io.BytesIO(synthetic_image_bytes(index)), 'animal.jpg'),
+            'question': 'Is this animal healthy?'
+        }, content_type='multipart/form-data')
+    elapsed = time.perf_counter() - start
+
+    body = response.get_json(silent=True) or {}
+    fallback = bool(body.get('is_fallback') or body.get('fallback_response') or body.get('deadline_fallback')
+                    or (body.get('prediction') or {}).get('analysis_type', '').startswith('Enhanced'))
+    return endpoint, response.status_code, elapsed, fallback
+
+
+def main():
+    args = sys.argv[1:]
+    options = {'--requests': '60', '--concurrency': '8', '--endpoint': 'all'}
+    for flag in options:
+        if flag in args:
+            index = args.index(flag)
+            options[flag] = args[index + 1]
+            del args[index:index + 2]
+
+    total = int(options['--requests'])
+    concurrency = int(options['--concurrency'])
+    endpoints = ['chat', 'integrated', 'upload'] if options['--endpoint'] == 'all' else [options['--endpoint']]
+
+    print("🔬 PashuArogyam - Load Test Against the Fake Gemini Backend")
+    print("=" * 60)
+    print(f"   {total} requests, concurrency {concurrency}, endpoints: {', '.join(endpoints)}")
+
+    fake_gemini.reset_stats()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(lambda i: run_request(endpoints[i % len(endpoints)], i), range(total)))
+    wall_time = time.perf_counter() - started
+
+    print("\n📊 Per endpoint")
+    print("-" * 60)
+    for endpoint in endpoints:
+        rows = [row for row in results if row[0] == endpoint]
+        if not rows:
+            continue
+        latencies = sorted(row[2] for row in rows)
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        statuses = {}
+        for row in rows:
+            statuses[row[1]] = statuses.get(row[1], 0) + 1
+        fallbacks = sum(1 for row in rows if row[3])
+        print(f"   {endpoint:11s} n={len(rows):4d}  median {statistics.median(latencies):6.2f}s  p95 {p95:6.2f}s  "
+              f"fallback {fallbacks / len(rows):5.1%}  status {statuses}")
+
+    backend = fake_gemini.get_stats()
+    print("\n🤖 Fake backend")
+    print("-" * 60)
+    print(f"   Upstream calls: {backend['calls']} ({backend['calls'] / max(1, total):.2f} per request)")
+    print(f"   Outcomes: {backend['outcomes']}")
+    print(f"   Models: {backend['models']}")
+    print(f"   Throughput: {total / wall_time:.1f} requests/s over {wall_time:.1f}s")
+    print(f"   Key pool: {pashu_app.gemini_key_pool.snapshot()['features']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the fallback keyword matcher
+Generates a corpus of farmer messages (English, transliterated Hindi/Marathi and Devanagari)
+and compares the compiled matcher from fallback_matcher.py with the if-chain it replaced
+in get_enhanced_fallback_response and the keyword scan in _get_fallback_response, on
+messages per second and on how often both pick the same answer.
+
+Usage: python benchmark_fallback_matcher.py [--messages 10000] [--seed 7] [--show 10]
+"""
+
+import sys
+import time
+import random
+from collections import Counter
+
+from fallback_matcher import fallback_matcher, FallbackMatcher
+
+ANIMALS = ['cow', 'cattle', 'calf', 'bull', 'dog', 'puppy', 'cat', 'kitten', 'sheep', 'lamb', 'ewe', 'goat',
+           'buffalo', 'gaay', 'गाय', 'kutta', 'बिल्ली', 'bhed']
+SYMPTOMS = ['fever', 'high fever', 'mastitis', 'limping', 'lameness', 'diarrhea', 'loose stools', 'vomiting',
+            'throwing up', 'foot rot', 'coughing', 'bloat', 'a deep wound', 'worms and parasites',
+            'bukhar', 'बुखार', 'dast', 'दस्त', 'ulti', 'thanela', 'not eating']
+OPENERS = ['My', 'Our', 'Help, my', 'Urgent: my', 'Please advise, my', 'Since two days my', 'meri', 'हमारी']
+ENDINGS = ['', ' What should I do?', ' Is it an emergency?', ' Which vaccination schedule helps?',
+           ' Any nutrition advice?', ' The program on TV said to wait.', ' What breed is most resistant?',
+           ' Kya karu?', ' क्या करें?']
+
+LEGACY_KEYWORDS = ['fever', 'diarrhea', 'cough', 'lameness', 'mastitis', 'vaccination', 'bloat', 'wound',
+                   'parasite', 'nutrition', 'breeding']
+
+
+def legacy_template(user_input):
+    """The if-chain get_enhanced_fallback_response used before the compiled matcher"""
+    user_lower = user_input.lower() if user_input else ""
+    if any(word in user_lower for word in ['cow', 'cattle', 'bull', 'calf', 'bovine']):
+        if 'fever' in user_lower:
+            return 'enhanced.cow_fever'
+        elif 'mastitis' in user_lower:
+            return 'enhanced.cow_mastitis'
+        elif 'lameness' in user_lower or 'limp' in user_lower:
+            return 'enhanced.cow_lameness'
+    elif any(word in user_lower for word in ['dog', 'puppy', 'canine']):
+        if 'fever' in user_lower:
+            return 'enhanced.dog_fever'
+        elif 'diarrhea' in user_lower:
+            return 'enhanced.dog_diarrhea'
+    elif any(word in user_lower for word in ['cat', 'kitten', 'feline']):
+        if 'fever' in user_lower:
+            return 'enhanced.cat_fever'
+        elif 'vomit' in user_lower or 'throw up' in user_lower:
+            return 'enhanced.cat_vomiting'
+    elif any(word in user_lower for word in ['sheep', 'lamb', 'ewe', 'ram']):
+        if 'fever' in user_lower:
+            return 'enhanced.sheep_fever'
+        elif 'limp' in user_lower or 'foot rot' in user_lower:
+            return 'enhanced.sheep_foot'
+    if 'emergency' in user_lower or 'urgent' in user_lower:
+        return 'enhanced.emergency'
+    elif 'fever' in user_lower:
+        return 'enhanced.general_fever'
+    elif 'diarrhea' in user_lower or 'loose stool' in user_lower:
+        return 'enhanced.general_diarrhea'
+    return 'enhanced.quota_default'
+
+
+def legacy_topics(user_input):
+    """The keyword scan _get_fallback_response used before the compiled matcher"""
+    user_lower = user_input.lower()
+    return [keyword for keyword in LEGACY_KEYWORDS if keyword in user_lower][:3]
+
+
+def build_corpus(count, seed):
+    rng = random.Random(seed)
+    messages = []
+    for _ in range(count):
+        symptoms = ' and '.join(rng.sample(SYMPTOMS, rng.choice([1, 1, 2])))
+        messages.append(f"{rng.choice(OPENERS)} {rng.choice(ANIMALS)} has {symptoms}.{rng.choice(ENDINGS)}")
+    return messages
+
+
+def grown_table(extra_concepts, seed):
+    """The live rules table plus synthetic concepts, as a bigger rule set would look"""
+    rng = random.Random(seed)
+    table = {'concepts': dict(fallback_matcher.concepts), 'enhanced_rules': [], 'keyword_topics': {}}
+    for index in range(extra_concepts):
+        table['concepts'][f"extra_{index}"] = [''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(7))
+                                              for _ in range(4)]
+    return table
+
+
+def substring_scan(concepts):
+    """Every term tested against the message, the way the if-chain grows with more rules"""
+    terms = [(term.rstrip('*'), concept) for concept, words in concepts.items() for term in words]
+
+    def scan(message):
+        lower = message.lower()
+        return {concept for term, concept in terms if term in lower}
+    return scan
+
+
+def timed(function, messages):
+    start = time.perf_counter()
+    results = [function(message) for message in messages]
+    return results, time.perf_counter() - start
+
+
+def main():
+    args = sys.argv[1:]
+    count = int(args[args.index('--messages') + 1]) if '--messages' in args else 10000
+    seed = int(args[args.index('--seed') + 1]) if '--seed' in args else 7
+    show = int(args[args.index('--show') + 1]) if '--show' in args else 10
+
+    print("🔎 PashuArogyam - Fallback Matcher Benchmark")
+    print("=" * 60)
+    stats = fallback_matcher.get_stats()
+    print(f"   {stats['concepts']} concepts, {stats['rules']} rules, {stats['trie_states']} trie states")
+    messages = build_corpus(count, seed)
+    print(f"   {len(messages)} generated messages (seed {seed})")
+
+    legacy, legacy_time = timed(legacy_template, messages)
+    compiled, compiled_time = timed(fallback_matcher.best_template, messages)
+    legacy_kw, legacy_kw_time = timed(legacy_topics, messages)
+    compiled_kw, compiled_kw_time = timed(fallback_matcher.topics, messages)
+
+    print("\n⏱️ Throughput")
+    print("-" * 60)
+    print(f"   {'engine':<28}{'if-chain':>14}{'compiled':>14}")
+    for name, old, new in [('enhanced templates', legacy_time, compiled_time),
+                           ('keyword topics', legacy_kw_time, compiled_kw_time)]:
+        print(f"   {name:<28}{len(messages) / old:>10,.0f}/s {len(messages) / new:>10,.0f}/s")
+
+    agreement = sum(old == new for old, new in zip(legacy, compiled)) / len(messages)
+    defaulted_old = legacy.count('enhanced.quota_default') / len(messages)
+    defaulted_new = compiled.count('enhanced.quota_default') / len(messages)
+    topics_found_old = sum(bool(topics) for topics in legacy_kw) / len(messages)
+    topics_found_new = sum(bool(topics) for topics in compiled_kw) / len(messages)
+
+    print("\n🎯 Answers")
+    print("-" * 60)
+    print(f"   Same template as the if-chain: {agreement:.1%}")
+    print(f"   Generic default answer:        {defaulted_old:.1%} -> {defaulted_new:.1%}")
+    print(f"   Messages with a keyword topic: {topics_found_old:.1%} -> {topics_found_new:.1%}")
+
+    changes = Counter((old, new) for old, new in zip(legacy, compiled) if old != new)
+    if changes:
+        print("\n🔀 Most common changes (if-chain -> compiled)")
+        print("-" * 60)
+        for (old, new), times in changes.most_common(show):
+            example = next(message for message, a, b in zip(messages, legacy, compiled) if (a, b) == (old, new))
+            print(f"   {times:>5}x {old} -> {new}\n          e.g. {example!r}")
+
+    print("\n📈 Scaling with the size of the rules table (concept matching only)")
+    print("-" * 60)
+    print(f"   {'terms':>8}{'substring scan':>18}{'compiled trie':>18}")
+    sample = messages[:2000]
+    for extra in [0, 250, 1000]:
+        table = grown_table(extra, seed)
+        matcher = FallbackMatcher(table)
+        terms = sum(len(words) for words in table['concepts'].values())
+        _, scan_time = timed(substring_scan(table['concepts']), sample)
+        _, trie_time = timed(matcher.match, sample)
+        print(f"   {terms:>8}{len(sample) / scan_time:>16,.0f}/s{len(sample) / trie_time:>16,.0f}/s")
+
+    print(f"\n✅ Compiled matcher: {len(messages) / compiled_time:,.0f} messages/s, "
+          f"{defaulted_old - defaulted_new:.1%} fewer generic answers than the if-chain")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
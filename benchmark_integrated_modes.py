@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the integrated disease prediction modes
+Compares the two-step flow (image analysis, then diagnosis) with the single multimodal call
+on latency, Gemini quota use and agreement of the resulting diagnoses.
+
+Usage: python benchmark_integrated_modes.py [image ...] [--runs N]
+Without images, the first few uploads in static/uploads are used.
+"""
+
+import os
+import io
+import sys
+import glob
+import time
+import statistics
+
+from PIL import Image
+
+import app as pashu_app
+
+BENCHMARK_CASES = [
+    {
+        "animal_info": {"type": "cow", "age": "4 years", "weight": "500 kg", "breed": "Holstein"},
+        "symptoms": ["fever", "nasal discharge", "coughing", "loss of appetite"],
+        "duration": "3-7 days",
+        "severity": "moderate",
+        "recent_changes": "Recently introduced to new pasture",
+        "previous_treatment": "Isolated animal"
+    },
+    {
+        "animal_info": {"type": "dog", "age": "3 years", "weight": "20 kg", "breed": "Labrador"},
+        "symptoms": ["itching", "hair loss", "red patches on skin"],
+        "duration": "1-2 weeks",
+        "severity": "mild",
+        "recent_changes": "",
+        "previous_treatment": ""
+    },
+    {
+        "animal_info": {"type": "sheep", "age": "2 years", "weight": "", "breed": ""},
+        "symptoms": ["lameness", "blisters in mouth", "drooling"],
+        "duration": "1-3 days",
+        "severity": "severe",
+        "recent_changes": "New animals added to the flock",
+        "previous_treatment": ""
+    },
+]
+
+
+def normalize(value):
+    return ' '.join(str(value or '').lower().replace('-', ' ').split())
+
+
+def diagnoses_agree(first, second):
+    """Loose agreement: one primary diagnosis mentions the other"""
+    a, b = normalize(first.get('primary_diagnosis')), normalize(second.get('primary_diagnosis'))
+    return bool(a and b and (a in b or b in a))
+
+
+def urgency_of(prediction):
+    return normalize((prediction.get('treatment_recommendations') or {}).get('veterinary_urgency'))
+
+
+def run_two_step(case, image, image_bytes):
+    image_analysis = pashu_app.analyze_image_with_gemini_advanced(
+        image, case['animal_info']['type'], case['symptoms'], image_bytes=image_bytes)
+    return pashu_app.generate_comprehensive_prediction(
+        case['animal_info'], case['symptoms'], case['duration'], case['severity'],
+        case['recent_changes'], case['previous_treatment'], image_analysis, True)
+
+
+def run_single_call(case, image, image_bytes):
+    prediction, _ = pashu_app.generate_single_call_prediction(
+        case['animal_info'], case['symptoms'], case['duration'], case['severity'],
+        case['recent_changes'], case['previous_treatment'], image, image_bytes=image_bytes)
+    return prediction
+
+
+def measure(mode_fn, case, image, image_bytes):
+    calls_before = pashu_app.gemini_rate_limiter.daily_calls
+    start = time.perf_counter()
+    prediction = mode_fn(case, image, image_bytes)
+    elapsed = time.perf_counter() - start
+    calls_used = pashu_app.gemini_rate_limiter.daily_calls - calls_before
+    return prediction, elapsed, calls_used
+
+
+def main():
+    args = sys.argv[1:]
+    runs = 1
+    if '--runs' in args:
+        index = args.index('--runs')
+        runs = int(args[index + 1])
+        del args[index:index + 2]
+
+    image_paths = args or sorted(glob.glob(os.path.join('static', 'uploads', '*.jpg')))[:len(BENCHMARK_CASES)]
+    if not image_paths:
+        print("❌ No images found. Pass image paths as arguments.")
+        return 1
+    if not pashu_app.GEMINI_AVAILABLE:
+        print("⚠️  Gemini is not configured; both modes will return fallback predictions.")
+
+    print("🔬 PashuArogyam - Integrated Prediction Mode Benchmark")
+    print("=" * 60)
+
+    results = {'two_step': {'latency': [], 'calls': []}, 'single_call': {'latency': [], 'calls': []}}
+    diagnosis_matches = 0
+    urgency_matches = 0
+    comparisons = 0
+
+    for run in range(runs):
+        for index, image_path in enumerate(image_paths):
+            case = BENCHMARK_CASES[index % len(BENCHMARK_CASES)]
+            with open(image_path, 'rb') as f:
+                image_bytes = f.read()
+            image = Image.open(io.BytesIO(image_bytes)).convert('RGB')
+
+            two_step, two_step_time, two_step_calls = measure(run_two_step, case, image, image_bytes)
+            single, single_time, single_calls = measure(run_single_call, case, image, image_bytes)
+
+            results['two_step']['latency'].append(two_step_time)
+            results['two_step']['calls'].append(two_step_calls)
+            results['single_call']['latency'].append(single_time)
+            results['single_call']['calls'].append(single_calls)
+
+            comparisons += 1
+            diagnosis_matches += diagnoses_agree(two_step, single)
+            urgency_matches += bool(urgency_of(two_step)) and urgency_of(two_step) == urgency_of(single)
+
+            print(f"\n📸 Run {run + 1} - {os.path.basename(image_path)} ({case['animal_info']['type']})")
+            print(f"   two_step:    {two_step_time:6.2f}s, {two_step_calls} calls -> {two_step.get('primary_diagnosis')}")
+            print(f"   single_call: {single_time:6.2f}s, {single_calls} calls -> {single.get('primary_diagnosis')}")
+
+    print("\n📊 Summary")
+    print("-" * 60)
+    for mode, data in results.items():
+        latencies = sorted(data['latency'])
+        p90 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.9))]
+        print(f"   {mode:12s} mean {statistics.mean(latencies):6.2f}s  median {statistics.median(latencies):6.2f}s  "
+              f"p90 {p90:6.2f}s  Gemini calls {sum(data['calls'])}")
+    print(f"   Diagnosis agreement: {diagnosis_matches}/{comparisons} ({diagnosis_matches / comparisons:.0%})")
+    print(f"   Urgency agreement:   {urgency_matches}/{comparisons} ({urgency_matches / comparisons:.0%})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
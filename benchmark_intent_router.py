@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Labelled eval for the chat intent router
+Runs a fixed set of farmer messages through IntentRouter.route() and compares the canned
+intent it picks (or None for "ask Gemini") with the expected label. Urgent messages must
+never get a canned answer, and a topic answer needs the topic's keyword in the message
+and nothing more specific than an animal name; any urgent message that is routed fails
+the run.
+
+Usage: python benchmark_intent_router.py [--verbose]
+"""
+
+import sys
+from collections import Counter
+
+from intent_router import IntentRouter
+
+# (message, expected intent or None when the message must reach Gemini)
+URGENT_CASES = [
+    ("help! cow bleeding heavily", None),
+    ("emergency", None),
+    ("Emergency!!", None),
+    ("urgent help please", None),
+    ("my cow is dying", None),
+    ("calf died suddenly", None),
+    ("dog ate rat poison", None),
+    ("goat ate something toxic", None),
+    ("snake bit my buffalo", None),
+    ("calf can't breathe", None),
+    ("cow not breathing properly", None),
+    ("dog is choking", None),
+    ("cow collapsed in the field", None),
+    ("puppy having seizures", None),
+    ("blood in milk", None),
+    ("bleeding after calving", None),
+    ("गाय को बहुत खून बह रहा है", None),
+    ("मेरी गाय मर रही है", None),
+    ("कुत्ते ने जहर खा लिया", None),
+    ("बछड़ा बेहोश है", None),
+]
+
+ROUTED_CASES = [
+    ("hi", 'greeting'),
+    ("hello", 'greeting'),
+    ("नमस्ते", 'greeting'),
+    ("thanks", 'thanks'),
+    ("thank you so much", 'thanks'),
+    ("bye", 'goodbye'),
+    ("is this free", 'about_platform'),
+    ("what can you do", 'capabilities'),
+    ("fever", 'fever'),
+    ("cow fever", 'fever'),
+    ("बुखार का इलाज", 'fever'),
+    ("loose motion", 'diarrhea'),
+    ("udder infection", 'mastitis'),
+    ("wound care", 'wound'),
+    ("vaccination schedule", 'vaccination'),
+    ("heat cycle", 'breeding'),
+]
+
+# Look like a topic to the character n-grams but name none of its keywords
+NO_KEYWORD_CASES = [
+    ("greeding", None),
+    ("bleating", None),
+    ("boat", None),
+    ("floating", None),
+    ("parasail", None),
+    ("diary", None),
+    ("fees", None),
+]
+
+# A topic keyword plus specifics (a number, a duration, another symptom) the canned answer ignores
+DETAIL_CASES = [
+    ("cow fever 105", None),
+    ("fever since 3 days", None),
+    ("fever for two days", None),
+    ("dog diarrhea after vaccine", None),
+    ("calf loose motion and weak", None),
+    ("mastitis 2 quarters", None),
+    ("गाय को 3 दिन से बुखार", None),
+]
+
+# Real questions that belong with Gemini
+QUESTION_CASES = [
+    ("my cow has fever and is not eating since two days what should i do", None),
+    ("which medicine for mastitis in buffalo and what dose", None),
+    ("dog vomiting yellow foam after eating grass", None),
+]
+
+GROUPS = [('urgent', URGENT_CASES), ('routed', ROUTED_CASES), ('no keyword', NO_KEYWORD_CASES),
+          ('details', DETAIL_CASES), ('questions', QUESTION_CASES)]
+
+
+def main():
+    verbose = '--verbose' in sys.argv[1:]
+    router = IntentRouter(enabled=True)
+
+    print("🧭 PashuArogyam - Intent Router Eval")
+    print("=" * 60)
+    total, correct = 0, 0
+    urgent_routed = []
+    for name, cases in GROUPS:
+        right = 0
+        for message, expected in cases:
+            intent = router.route(message)
+            intent = intent[0] if intent else None
+            ok = intent == expected
+            right += ok
+            if name == 'urgent' and intent is not None:
+                urgent_routed.append((message, intent))
+            if verbose or not ok:
+                mark = '✅' if ok else '❌'
+                print(f"   {mark} {message!r}: expected {expected}, got {intent}")
+        total += len(cases)
+        correct += right
+        print(f"   {name:<12}{right:>3}/{len(cases)}")
+
+    stats = router.get_stats()
+    reasons = Counter({key: stats[key] for key in ('urgent', 'too_long', 'low_confidence', 'no_topic_keyword',
+                                                   'specific_details')})
+    print("\n📊 Passed to Gemini")
+    print("-" * 60)
+    for reason, count in reasons.most_common():
+        print(f"   {reason:<18}{count:>4}")
+
+    print(f"\n🎯 Accuracy: {correct}/{total} ({correct / total:.1%})")
+    if urgent_routed:
+        print(f"❌ {len(urgent_routed)} urgent messages got a canned answer")
+        return 1
+    print("✅ No urgent message got a canned answer")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Calibration for the knowledge index thresholds
+Runs labelled farmer questions against the knowledge passages app.py builds at startup and
+sweeps the score threshold, counting questions answered from the right passage, questions
+missed, and unrelated questions answered anyway. KNOWLEDGE_MIN_SCORE (answering on its own
+when Gemini is unavailable) and KNOWLEDGE_PROMPT_MIN_SCORE (reference notes in the prompt)
+are picked from this table.
+
+Usage: python benchmark_knowledge_index.py [--thresholds 1,2,3,4,5,6] [--verbose]
+"""
+
+import os
+import sys
+import tempfile
+
+# Must be set before the app (and its Gemini import) is loaded
+os.environ['GEMINI_BACKEND'] = 'fake'
+os.environ.setdefault('GEMINI_QUOTA_LEDGER_PATH', os.path.join(tempfile.mkdtemp(), 'fake_gemini_ledger.db'))
+
+import app as pashu_app  # noqa: F401  builds the knowledge index
+from knowledge_index import knowledge_index, without_animals
+
+# (question, passage id that answers it, or None when no passage should)
+CASES = [
+    ("my cow has mastitis what to do", 'cow/mastitis'),
+    ("cow mastitis treatment", 'cow/mastitis'),
+    ("mastitis", 'cow/mastitis'),
+    ("my buffalo udder is swollen and milk has clots", 'cow/mastitis'),
+    ("how to treat foot and mouth disease in cattle", 'cow/foot and mouth disease'),
+    ("lumpy skin disease in cow", 'cow/lumpy skin disease'),
+    ("bloat in cattle treatment", 'cow/bloat'),
+    ("cow with milk fever", 'cow/milk fever'),
+    ("cow is limping", 'cow/lameness/foot problems'),
+    ("cattle respiratory disease", 'cow/bovine respiratory disease'),
+    ("my dog has parvovirus", 'dog/parvovirus'),
+    ("dog has distemper", 'dog/distemper'),
+    ("dog ear infection", 'dog/ear infection'),
+    ("dog hip dysplasia", 'dog/hip dysplasia'),
+    ("dog skin disease itching", 'dog/skin disease'),
+    ("cat urinary infection", 'cat/urinary tract infection'),
+    ("my cat is itching", 'cat/flea allergy'),
+    ("sheep foot rot", 'sheep/foot rot'),
+    ("sheep scrapie", 'sheep/scrapie'),
+    ("goat pneumonia", 'goat/pneumonia'),
+    ("goat ketosis", 'goat/ketosis'),
+    ("cow not eating", None),
+    ("what is the weather today", None),
+    ("my goat is sad", None),
+    ("hello", None),
+    ("best breed of dog", None),
+    ("cow price", None),
+    ("how to register on the app", None),
+    ("dog food brand", None),
+    ("buy a cow", None),
+    ("my dog is cute", None),
+    ("how old can a cat live", None),
+    ("sheep wool price", None),
+    ("goat farming business", None),
+    ("horse riding lessons", None),
+    ("pig farm subsidy", None),
+    ("what to feed my cow", None),
+    ("cat sleeps a lot", None),
+]
+
+
+def evaluate(threshold):
+    right, wrong, missed, unrelated = 0, 0, 0, 0
+    for question, expected in CASES:
+        results = knowledge_index.search(question, limit=1, min_score=threshold)
+        found = results[0][1]['id'] if results else None
+        if expected is None:
+            unrelated += found is not None
+        elif found is None:
+            missed += 1
+        elif found == expected:
+            right += 1
+        else:
+            wrong += 1
+    return right, wrong, missed, unrelated
+
+
+def main():
+    args = sys.argv[1:]
+    thresholds = [float(value) for value in args[args.index('--thresholds') + 1].split(',')] \
+        if '--thresholds' in args else [1.0, 2.0, 2.5, 3.0, 3.5, 4.0, 5.0, 6.0]
+    verbose = '--verbose' in args
+
+    print("📚 PashuArogyam - Knowledge Index Calibration")
+    print("=" * 60)
+    answerable = sum(expected is not None for _, expected in CASES)
+    print(f"   {len(knowledge_index.index)} passages, {answerable} answerable and "
+          f"{len(CASES) - answerable} unrelated questions")
+
+    if verbose:
+        print("\n🔎 Best passage per question")
+        print("-" * 60)
+        for question, expected in CASES:
+            results = knowledge_index.search(question, limit=1, min_score=0.0)
+            found = '-'
+            if results:
+                # The threshold applies to the score without the animal names
+                position = knowledge_index.index.passages.index(results[0][1])
+                topic_score = knowledge_index.index.scores(without_animals(question)).get(position, 0.0)
+                found = f"{results[0][1]['id']} ({topic_score:.1f})"
+            print(f"   {question!r:50} {found}  expected {expected}")
+
+    print("\n🎚️ Threshold sweep")
+    print("-" * 60)
+    print(f"   {'threshold':>10}{'right':>8}{'wrong':>8}{'missed':>8}{'unrelated':>11}")
+    for threshold in thresholds:
+        right, wrong, missed, unrelated = evaluate(threshold)
+        marks = ' '.join(mark for mark, value in (('◀ answer', knowledge_index.min_score),
+                                                  ('◀ prompt', knowledge_index.prompt_min_score))
+                         if value == threshold)
+        print(f"   {threshold:>10.1f}{right:>8}{wrong:>8}{missed:>8}{unrelated:>11}  {marks}")
+
+    right, wrong, missed, unrelated = evaluate(knowledge_index.min_score)
+    print(f"\n✅ KNOWLEDGE_MIN_SCORE={knowledge_index.min_score}: {right}/{answerable} answered from the right "
+          f"passage, {unrelated} unrelated questions answered")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Benchmark for localized chatbot answers
+Compares the translate chain (translate question, answer in English, summarize/translate back)
+with direct single-call answers in the user's language, per language, on end-to-end latency,
+Gemini calls and translation calls.
+
+Usage: python benchmark_localized_answers.py [--runs N] [--languages hi,mr,ta] [--fake]
+--fake uses the offline Gemini backend (translation still goes through Google Translate).
+"""
+
+import os
+import sys
+import time
+import tempfile
+import statistics
+
+if '--fake' in sys.argv:
+    os.environ['GEMINI_BACKEND'] = 'fake'
+    os.environ.setdefault('GEMINI_QUOTA_LEDGER_PATH', os.path.join(tempfile.mkdtemp(), 'localized_ledger.db'))
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import chatbot_service_new
+from chatbot_service_new import AnimalDiseaseChatbot, SUPPORTED_LANGUAGES
+
+QUESTIONS = [
+    "My cow has a fever and is not eating since two days",
+    "How do I treat mastitis in my buffalo?",
+    "My goat has diarrhea and looks weak",
+]
+
+DEFAULT_LANGUAGES = ['hi', 'mr', 'ta', 'te', 'bn', 'gu', 'kn', 'ml', 'pa', 'es', 'fr', 'de']
+
+
+class CallCounter:
+    """Wraps a bound method and counts its calls"""
+
+    def __init__(self, owner, name):
+        self.owner, self.name = owner, name
+        self.original = getattr(owner, name)
+        self.calls = 0
+        setattr(owner, name, self)
+
+    def __call__(self, *args, **kwargs):
+        self.calls += 1
+        return self.original(*args, **kwargs)
+
+    def take(self):
+        calls, self.calls = self.calls, 0
+        return calls
+
+
+def run_mode(chatbot, mode, language, runs, translations, gemini_calls):
+    chatbot.localized_mode = mode
+    latencies = []
+    for run in range(runs):
+        for index, question in enumerate(QUESTIONS):
+            # Fresh cache and conversation so every run pays for the full chain
+            chatbot.rate_limiter.response_cache.clear()
+            chatbot.clear_conversation(f"bench_{mode}_{language}_{run}_{index}")
+            start = time.perf_counter()
+            chatbot.process_text_query(question, language=language, session_key=f"bench_{mode}_{language}_{run}_{index}")
+            latencies.append(time.perf_counter() - start)
+    answers = runs * len(QUESTIONS)
+    return statistics.median(latencies), max(latencies), gemini_calls.take() / answers, translations.take() / answers
+
+
+def main():
+    args = sys.argv[1:]
+    runs = int(args[args.index('--runs') + 1]) if '--runs' in args else 1
+    languages = args[args.index('--languages') + 1].split(',') if '--languages' in args else DEFAULT_LANGUAGES
+    names = {language['code']: language['name'] for language in SUPPORTED_LANGUAGES}
+
+    print("🌐 PashuArogyam - Localized Answer Benchmark")
+    print("=" * 60)
+
+    api_key = os.getenv('GEMINI_API_KEY_CHATBOT') or os.getenv('GEMINI_API_KEY')
+    if not api_key and '--fake' not in args:
+        print("❌ GEMINI_API_KEY_CHATBOT is not set (or run with --fake)")
+        return 1
+    chatbot = AnimalDiseaseChatbot(api_key or 'fake-key')
+    if chatbot.offline_mode or not chatbot.model:
+        print("❌ Chatbot started in offline mode; nothing to benchmark")
+        return 1
+    if not chatbot_service_new.TRANSLATION_AVAILABLE:
+        print("⚠️ deep_translator is not installed; the translate chain will answer in English")
+
+    translations = CallCounter(chatbot, '_translate_text')
+    gemini_calls = CallCounter(chatbot, '_call_gemini_pooled')
+
+    print(f"   {len(QUESTIONS)} questions x {runs} run(s) per language and mode\n")
+    print(f"   {'language':10s} {'translate chain':>26s}   {'direct answer':>26s}   speedup")
+    print(f"   {'':10s} {'median/max s  gemini  trans':>26s}   {'median/max s  gemini  trans':>26s}")
+    print("-" * 84)
+
+    speedups = []
+    for language in languages:
+        if language not in names:
+            print(f"   {language:10s} skipped (unsupported)")
+            continue
+        chain = run_mode(chatbot, 'translate', language, runs, translations, gemini_calls)
+        direct = run_mode(chatbot, 'direct', language, runs, translations, gemini_calls)
+        speedup = chain[0] / direct[0] if direct[0] else 0.0
+        speedups.append(speedup)
+        print(f"   {names[language]:10s} {chain[0]:6.2f}/{chain[1]:5.2f}  {chain[2]:5.2f}  {chain[3]:5.2f}   "
+              f"{direct[0]:6.2f}/{direct[1]:5.2f}  {direct[2]:5.2f}  {direct[3]:5.2f}   {speedup:5.2f}x")
+
+    if speedups:
+        print(f"\n📊 Median speedup of direct answers: {statistics.median(speedups):.2f}x")
+        print("   'trans' above 0 in direct mode means answers came back in English and were translated as a fallback")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
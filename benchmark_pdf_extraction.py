@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Benchmark for PDF text extraction
+Generates herd-record style test PDFs and measures pages per second for the old single-threaded
+extraction loop and for pdf_ingest with one and with several worker processes, then how many
+pages an early-stopping question reads and what asking again about the same file costs.
+
+Usage: python benchmark_pdf_extraction.py [--pages 100,400] [--workers 4] [--range-pages 16]
+"""
+
+import io
+import os
+import sys
+import time
+import random
+
+import PyPDF2
+
+from pdf_ingest import PDFIngestor
+
+ANIMALS = ['Gauri', 'Kapila', 'Nandini', 'Lakshmi', 'Sundari', 'Radha', 'Ganga', 'Shyama']
+ENTRIES = [
+    "{name}: milk yield {litres} litres, feed intake normal, rumination normal.",
+    "{name}: weight {weight} kg recorded, body condition score {score}.",
+    "{name}: deworming done with albendazole, next dose due in 90 days.",
+    "{name}: FMD vaccination given, batch {batch}, no reaction observed.",
+    "{name}: hoof trimming done, mild overgrowth on the hind left claw.",
+]
+FINDING = ("Lab findings for {name}: somatic cell count 900000 cells per ml in the rear left quarter. "
+           "Culture positive for Staphylococcus aureus. Diagnosis: subclinical mastitis.")
+
+
+def make_test_pdf(page_count, lines_per_page=45, finding_page=None, seed=11):
+    """A text-only PDF of herd register pages, built without a PDF library"""
+    rng = random.Random(seed)
+    objects = [b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>", None]
+    kids = []
+    for page in range(1, page_count + 1):
+        lines = [f"Herd register - page {page}"]
+        for _ in range(lines_per_page):
+            lines.append(rng.choice(ENTRIES).format(name=rng.choice(ANIMALS), litres=rng.randint(6, 18),
+                                                     weight=rng.randint(280, 450), score=rng.randint(2, 4),
+                                                     batch=rng.randint(1000, 9999)))
+        if page == finding_page:
+            lines.insert(1, FINDING.format(name=rng.choice(ANIMALS)))
+        stream = "BT /F1 9 Tf 40 800 Td 11 TL " + " ".join(f"({line}) '" for line in lines) + " ET"
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream.encode('latin-1')))
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                       b"/Resources << /Font << /F1 1 0 R >> >> /Contents %d 0 R >>" % (len(objects)))
+        kids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(b"%d 0 R" % kid for kid in kids), len(kids))
+    objects.append(b"<< /Type /Catalog /Pages 2 0 R >>")
+
+    pdf = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(pdf))
+        pdf += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(pdf)
+    pdf += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    pdf += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    pdf += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, len(objects), xref)
+    return bytes(pdf)
+
+
+def legacy_extract(pdf_bytes):
+    """The extraction loop process_pdf used before pdf_ingest"""
+    pdf_reader = PyPDF2.PdfReader(io.BytesIO(pdf_bytes))
+    text_content = ""
+    for page in pdf_reader.pages:
+        text_content += page.extract_text() + "\n"
+    return text_content
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    args = sys.argv[1:]
+    page_counts = [int(count) for count in (args[args.index('--pages') + 1] if '--pages' in args else '100,400').split(',')]
+    workers = int(args[args.index('--workers') + 1]) if '--workers' in args else max(2, min(4, os.cpu_count() or 2))
+    range_pages = int(args[args.index('--range-pages') + 1]) if '--range-pages' in args else 16
+
+    print("📄 PashuArogyam - PDF Extraction Benchmark")
+    print("=" * 60)
+    print(f"   {os.cpu_count()} CPUs, {workers} workers, {range_pages} pages per range")
+
+    for page_count in page_counts:
+        pdf = make_test_pdf(page_count, finding_page=max(1, page_count * 3 // 4))
+        print(f"\n📚 {page_count} pages ({len(pdf) / 1024:.0f} KB)")
+        print("-" * 60)
+
+        _, legacy_time = timed(legacy_extract, pdf)
+        print(f"   {'old loop (one thread)':<34}{page_count / legacy_time:>10.0f} pages/s")
+
+        for count in (1, workers):
+            ingestor = PDFIngestor(workers=count, range_pages=range_pages, cpu_budget=600)
+            if count > 1:
+                ingestor.load(make_test_pdf(range_pages * 2, seed=1))  # start the worker processes outside the timing
+            document, elapsed = timed(ingestor.load, pdf)
+            print(f"   {f'pdf_ingest, {count} worker(s)':<34}{document.pages_read / elapsed:>10.0f} pages/s"
+                  f"   ({len(document.chunks)} chunks)")
+            ingestor.shutdown()
+
+        ingestor = PDFIngestor(workers=workers, range_pages=range_pages, cpu_budget=600)
+        ingestor.load(make_test_pdf(range_pages * 2, seed=1))
+        question = "What was the milk yield and feed intake recorded?"
+        document, elapsed = timed(ingestor.load, pdf, question, 2000)
+        print(f"   {'early stop, common question':<34}{document.pages_read:>6}/{page_count} pages in {elapsed:.2f}s")
+
+        question = "What did the culture and somatic cell count show?"
+        document, elapsed = timed(ingestor.load, pdf, question, 2000)
+        found = '[Page' in document.select(question, 2000)[0] and 'Staphylococcus' in document.select(question, 2000)[0]
+        print(f"   {'rare finding, same file again':<34}{document.pages_read:>6}/{page_count} pages in {elapsed:.2f}s"
+              f"   (finding selected: {'yes' if found else 'no'})")
+
+        _, elapsed = timed(ingestor.load, pdf, question, 2000)
+        print(f"   {'third question, cached':<34}{elapsed * 1000:>9.1f} ms")
+        ingestor.shutdown()
+
+        budgeted = PDFIngestor(workers=workers, range_pages=range_pages, cpu_budget=0.5)
+        document, elapsed = timed(budgeted.load, pdf)
+        print(f"   {'0.5s CPU budget':<34}{document.pages_read:>6}/{page_count} pages in {elapsed:.2f}s")
+        budgeted.shutdown()
+
+    print("\n✅ Done")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
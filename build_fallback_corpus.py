@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Build the multilingual fallback corpus
+Renders every fallback template from fallback_corpus.py into every language returned by
+get_supported_languages() and writes them to a compact JSON file that is loaded at startup,
+so quota-exceeded and offline answers are served in the user's language without a
+translation call. Re-run after changing any fallback template; changed templates are
+served in English until then.
+
+Usage: python build_fallback_corpus.py [--output fallback_corpus.json] [--languages hi,mr]
+"""
+
+import os
+import re
+import sys
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fallback_corpus import english_templates, source_hash, PLACEHOLDERS, create_fallback_corpus
+from translation_service import translation_service, TRANSLATION_AVAILABLE
+from chatbot_service_new import SUPPORTED_LANGUAGES
+
+# Translators tend to pad bold markers ("** Signs **"), which breaks the markdown
+_BOLD = re.compile(r'\*\*[ \t]*([^*\n]+?)[ \t]*\*\*')
+
+
+def repair_markdown(text):
+    return _BOLD.sub(r'**\1**', text)
+
+
+def translate_template(template_id, text, language):
+    translated = translation_service.translate(text, 'en', language, timeout=60)
+    if translated is text:
+        return template_id, language, None, 'translation failed'
+    missing = [placeholder for placeholder in PLACEHOLDERS if placeholder in text and placeholder not in translated]
+    if missing:
+        return template_id, language, None, f"lost {', '.join(missing)}"
+    return template_id, language, repair_markdown(translated), None
+
+
+def main():
+    args = sys.argv[1:]
+    output = args[args.index('--output') + 1] if '--output' in args else create_fallback_corpus().path
+    languages = [language['code'] for language in SUPPORTED_LANGUAGES if language['code'] != 'en']
+    if '--languages' in args:
+        languages = args[args.index('--languages') + 1].split(',')
+
+    print("🌐 PashuArogyam - Fallback Corpus Build")
+    print("=" * 60)
+    if not TRANSLATION_AVAILABLE:
+        print("❌ deep_translator is not installed")
+        return 1
+
+    templates = english_templates()
+    print(f"   {len(templates)} templates x {len(languages)} languages -> {output}")
+
+    started = time.perf_counter()
+    corpus = {language: {} for language in languages}
+    failures = []
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        jobs = [executor.submit(translate_template, template_id, text, language)
+                for language in languages for template_id, text in templates.items()]
+        for job in jobs:
+            template_id, language, translated, problem = job.result()
+            if problem:
+                failures.append((language, template_id, problem))
+            else:
+                corpus[language][template_id] = translated
+
+    data = {
+        'built_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'sources': {template_id: source_hash(text) for template_id, text in templates.items()},
+        'languages': corpus
+    }
+    directory = os.path.dirname(output)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as corpus_file:
+        json.dump(data, corpus_file, ensure_ascii=False, separators=(',', ':'), sort_keys=True)
+
+    print("\n📊 Per language")
+    print("-" * 60)
+    for language in languages:
+        print(f"   {language}: {len(corpus[language])}/{len(templates)} templates")
+    for language, template_id, problem in failures:
+        print(f"   ⚠️ {language} {template_id}: {problem} (served in English)")
+    print(f"\n✅ Wrote {os.path.getsize(output) / 1024:.1f} KB in {time.perf_counter() - started:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
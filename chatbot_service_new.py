@@ -15,7 +15,12 @@ logger = logging.getLogger(__name__)
 
 # Try imports with graceful fallbacks
 try:
-    import google.generativeai as genai
+    if os.getenv('GEMINI_BACKEND', 'google').lower() == 'fake':
+        # Offline stand-in for load and regression testing (see fake_gemini.py)
+        import fake_gemini as genai
+        logger.info(" Using the offline fake Gemini backend (GEMINI_BACKEND=fake)")
+    else:
+        import google.generativeai as genai
     GENAI_AVAILABLE = True
     logger.info(" Google Generative AI imported successfully")
 except ImportError as e:
@@ -34,23 +39,62 @@ try:
     from PIL import Image
     import io
     import base64
+    from image_preparation import vision_image_preparer
     IMAGE_PROCESSING_AVAILABLE = True
     logger.info(" Image processing libraries imported successfully")
 except ImportError as e:
     logger.error(f" Image processing not available: {e}")
     IMAGE_PROCESSING_AVAILABLE = False
 
-try:
-    from deep_translator import GoogleTranslator
-    TRANSLATION_AVAILABLE = True
+from quota_ledger import quota_ledger
+from gemini_key_pool import gemini_key_pool, bind_model, FEATURE_CHAT
+from gemini_dispatch import gemini_dispatcher, CLASS_CHAT, CLASS_SECONDARY
+from prompt_budget import token_budget, estimate_tokens, estimate_image_tokens
+from translation_service import translation_service, TRANSLATION_AVAILABLE
+from fallback_corpus import fallback_corpus, LocalizedText, combine
+from fallback_matcher import fallback_matcher
+from knowledge_index import knowledge_index
+from pdf_ingest import pdf_ingestor
+from conversation_store import create_conversation_store
+from conversation_summary import create_conversation_context
+from intent_router import intent_router, TOPIC_INTENTS
+
+if TRANSLATION_AVAILABLE:
     logger.info(" Translation library imported successfully")
-except ImportError as e:
-    logger.error(f" Translation not available: {e}")
-    TRANSLATION_AVAILABLE = False
+else:
+    logger.error(" Translation not available: deep_translator is not installed")
+
+SUPPORTED_LANGUAGES = [
+    {'code': 'en', 'name': 'English'},
+    {'code': 'hi', 'name': 'Hindi'},
+    {'code': 'mr', 'name': 'Marathi'},
+    {'code': 'te', 'name': 'Telugu'},
+    {'code': 'ta', 'name': 'Tamil'},
+    {'code': 'bn', 'name': 'Bengali'},
+    {'code': 'gu', 'name': 'Gujarati'},
+    {'code': 'kn', 'name': 'Kannada'},
+    {'code': 'ml', 'name': 'Malayalam'},
+    {'code': 'pa', 'name': 'Punjabi'},
+    {'code': 'es', 'name': 'Spanish'},
+    {'code': 'fr', 'name': 'French'},
+    {'code': 'de', 'name': 'German'}
+]
+LANGUAGE_NAMES = {language['code']: language['name'] for language in SUPPORTED_LANGUAGES}
+
+# Languages written in a non-Latin script; used to check that a direct answer is not in English
+INDIC_LANGUAGES = ['mr', 'hi', 'ta', 'te', 'gu', 'kn', 'ml', 'pa', 'bn']
+
+# 'direct' asks Gemini to answer in the user's language in one call; 'translate' translates the
+# question, answers in English and translates (or summarizes and translates) the answer back
+CHATBOT_LOCALIZED_MODE = os.getenv('CHATBOT_LOCALIZED_MODE', 'translate').lower()
+CHATBOT_LOCALIZED_MAX_WORDS = int(os.getenv('CHATBOT_LOCALIZED_MAX_WORDS', '250'))
+CHATBOT_LOCALIZED_MAX_OUTPUT_TOKENS = int(os.getenv('CHATBOT_LOCALIZED_MAX_OUTPUT_TOKENS', '1500'))
 
 # Enhanced Rate limiting for Gemini API with quota management and caching
 class GeminiRateLimiter:
-    def __init__(self):
+    def __init__(self, api_key=None):
+        self.api_key = api_key  # Usage is persisted per key in the quota ledger
+        
         # Load configuration from environment variables
         self.min_interval = float(os.getenv('GEMINI_MIN_INTERVAL', '2.0'))  # Increased default interval
         self.max_retries = int(os.getenv('GEMINI_MAX_RETRIES', '3'))
@@ -62,6 +106,11 @@ class GeminiRateLimiter:
         self.consecutive_failures = 0
         self.quota_exceeded = False
         self.quota_reset_time = 0
+        self.max_daily_calls = int(os.getenv('GEMINI_CHATBOT_DAILY_LIMIT', '1500'))
+        
+        # Lockouts and today's count come from the persistent ledger, so restarts don't reset them
+        quota_ledger.register_key(api_key, 'chatbot', self.max_daily_calls)
+        self._sync_quota_lockout()
         
         # Response caching
         self.response_cache = {}
@@ -70,10 +119,30 @@ class GeminiRateLimiter:
         
         logger.info(f" Rate limiter configured: interval={self.min_interval}s, retries={self.max_retries}, cache_ttl={self.cache_ttl}s")
         
+    def _next_reset_time(self):
+        next_day = datetime.now() + timedelta(days=1)
+        return next_day.replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+    
+    def _sync_quota_lockout(self):
+        """Adopt a daily-quota lockout recorded by any worker"""
+        exhausted_until = quota_ledger.exhausted_until(self.api_key)
+        if exhausted_until:
+            self.quota_exceeded = True
+            self.quota_reset_time = max(self.quota_reset_time, exhausted_until)
+    
     def wait_if_needed(self):
         """Wait if we need to respect rate limits"""
+        self._sync_quota_lockout()
         current_time = time.time()
         
+        # Check the persisted daily call budget
+        if not self.quota_exceeded and quota_ledger.calls_today(self.api_key) >= self.max_daily_calls:
+            self.quota_exceeded = True
+            self.quota_reset_time = self._next_reset_time()
+            quota_ledger.record_rate_limit(self.api_key, exhausted_until=self.quota_reset_time)
+            logger.info(f" Daily chatbot call budget reached ({self.max_daily_calls}).")
+            return True
+        
         # Check if quota is exceeded and we need to wait until reset
         if self.quota_exceeded and current_time < self.quota_reset_time:
             return True  # Don't make any calls if quota exceeded
@@ -97,6 +166,7 @@ class GeminiRateLimiter:
             time.sleep(wait_time)
             
         self.last_call_time = time.time()
+        quota_ledger.record_call(self.api_key)
         return False
         
     def handle_rate_limit_error(self, error_message=""):
@@ -107,15 +177,16 @@ class GeminiRateLimiter:
         if "quota" in error_message.lower() or "50" in error_message:
             self.quota_exceeded = True
             # Set reset time to next day (24 hours from now)
-            from datetime import datetime, timedelta
-            next_day = datetime.now() + timedelta(days=1)
-            self.quota_reset_time = next_day.replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+            self.quota_reset_time = self._next_reset_time()
+            quota_ledger.record_rate_limit(self.api_key, exhausted_until=self.quota_reset_time)
             # Only log if this is a new quota exceed event (not repeated checks)
             if not hasattr(self, '_quota_logged_today') or not self._quota_logged_today:
                 logger.info(f" Daily quota limit reached. Service will use fallback responses until reset.")
                 self._quota_logged_today = True
             return 24 * 3600  # Return 24 hours in seconds
         
+        quota_ledger.record_rate_limit(self.api_key)
+        
         # Regular rate limiting with configurable backoff
         base_wait = min(self.max_backoff, self.base_backoff * (2 ** min(self.consecutive_failures, 6)))
         jitter = random.uniform(0.8, 1.2)  # Add randomness to prevent thundering herd
@@ -127,13 +198,24 @@ class GeminiRateLimiter:
         logger.warning(f" Rate limit hit. Backing off for {wait_time:.1f} seconds...")
         return wait_time
         
+    def record_failure(self):
+        """Count a failed call that was not a rate limit, e.g. a stream cut off mid-answer"""
+        self.consecutive_failures += 1
+    
     def reset_on_success(self):
         """Reset failure count on successful call"""
         self.consecutive_failures = 0
         self.min_interval = max(1.0, self.min_interval * 0.9)  # Gradually reduce interval but keep minimum at 1s
+    
+    def record_usage(self, response):
+        """Persist the token counts of a successful response"""
+        quota_ledger.record_usage_metadata(self.api_key, response)
+        token_budget.observe(response)
+        gemini_dispatcher.record_usage(response)
         
     def clear_quota_exceeded_state(self):
         """Clear quota exceeded state - use when quota should not be exceeded"""
+        quota_ledger.clear_exhausted(self.api_key)
         self.quota_exceeded = False
         self.consecutive_failures = 0
         self.quota_reset_time = 0
@@ -143,6 +225,7 @@ class GeminiRateLimiter:
     
     def is_quota_exceeded(self):
         """Check if quota is currently exceeded"""
+        self._sync_quota_lockout()
         current_time = time.time()
         if self.quota_exceeded and current_time >= self.quota_reset_time:
             self.quota_exceeded = False
@@ -199,13 +282,14 @@ class AnimalDiseaseChatbot:
             self.api_key = api_key or os.getenv('GEMINI_API_KEY')
             self.offline_mode = os.getenv('CHATBOT_OFFLINE_MODE', 'false').lower() == 'true'
             self.enable_fallback = os.getenv('CHATBOT_ENABLE_FALLBACK', 'true').lower() == 'true'
+            self.localized_mode = CHATBOT_LOCALIZED_MODE if CHATBOT_LOCALIZED_MODE in ('direct', 'translate') else 'translate'
             
             self.model = None
             self.vision_model = None
-            self.conversation_history = []
-            self.session_histories = {}  # Store multiple session histories
-            self.current_session_key = None
-            self.rate_limiter = GeminiRateLimiter()  # Add enhanced rate limiter
+            self.sessions = create_conversation_store()  # Per-session histories, each with its own lock
+            self.context_builder = create_conversation_context()  # Rolling summary + recent turns for prompts
+            self.rate_limiter = GeminiRateLimiter(self.api_key)  # Add enhanced rate limiter
+            gemini_key_pool.add_key('chatbot', self.api_key, self.rate_limiter, FEATURE_CHAT)
             
             # Clear any false quota exceeded state from previous runs
             self.clear_false_quota_state()
@@ -225,13 +309,16 @@ class AnimalDiseaseChatbot:
             logger.error(traceback.format_exc())
             # Don't raise exception, allow degraded functionality
     
-    def _call_gemini_with_retry(self, model, prompt, image=None, max_retries=None):
+    def _call_gemini_with_retry(self, model, prompt, image=None, max_retries=None, priority_class=CLASS_CHAT,
+                                generation_config=None, language='en'):
         """
-        Call Gemini API with enhanced error handling, caching, and fallback
+        Call Gemini API with enhanced error handling, caching, and fallback.
+        The call waits for a dispatcher slot of its priority class and may be shed under load.
+        Fallback answers come back as LocalizedText tagged with the language they are in.
         """
         if not GENAI_AVAILABLE or not model:
             if self.enable_fallback:
-                return self._get_fallback_response(prompt), None
+                return self._get_fallback_response(prompt, language), None
             return None, "Gemini AI is not available"
         
         # Use configured max_retries if not specified
@@ -241,7 +328,7 @@ class AnimalDiseaseChatbot:
         # Check offline mode
         if self.offline_mode:
             logger.info(" Operating in offline mode")
-            return self._get_fallback_response(prompt), None
+            return self._get_fallback_response(prompt, language), None
         
         # Check cache first (only for text queries without images)
         if image is None:
@@ -249,35 +336,52 @@ class AnimalDiseaseChatbot:
             if cached_response:
                 return cached_response, None
         
-        # Check if quota is exceeded before making any calls
-        if self.rate_limiter.is_quota_exceeded():
-            fallback_msg = ("I'm currently unable to process requests due to daily quota limits. "
-                          "Please try again tomorrow or contact our veterinarians for immediate assistance.")
+        with gemini_dispatcher.admit(priority_class) as ticket:
+            if ticket.shed:
+                if priority_class == CLASS_SECONDARY:
+                    return None, f"Secondary request shed ({ticket.shed_reason})"
+                return self._localized_notice('high_demand', self._get_fallback_response(prompt, language), language), None
+            return self._call_gemini_pooled(model, prompt, image, max_retries, generation_config, language)
+    
+    def _call_gemini_pooled(self, model, prompt, image, max_retries, generation_config=None, language='en'):
+        """Attempts on pooled keys with failover; runs inside a dispatcher slot"""
+        # Check if quota is exceeded on every key chat may use before making any calls
+        pooled_keys = gemini_key_pool.candidates(FEATURE_CHAT)
+        if not pooled_keys:
             if self.enable_fallback:
-                fallback_response = self._get_fallback_response(prompt)
-                return f"{fallback_msg}\n\n{fallback_response}", None
-            return fallback_msg, None
-            
-        for attempt in range(max_retries):
+                return self._localized_notice('quota_unavailable', self._get_fallback_response(prompt, language), language), None
+            return fallback_corpus.render('notice.quota_unavailable', language), None
+        
+        # Start on the key with the most headroom; the others are failover targets
+        pooled_key = pooled_keys.pop(0)
+        active_model = self._model_for_key(model, pooled_key.api_key)
+        
+        attempt = 0
+        while attempt < max_retries:
+            limiter = pooled_key.limiter
             try:
                 # Small delay for the first attempt to be courteous
                 if attempt == 0:
                     time.sleep(0.2)  # Small initial delay
                 
                 # Wait if rate limited or quota exceeded
-                should_skip = self.rate_limiter.wait_if_needed()
-                if should_skip and self.rate_limiter.is_quota_exceeded():
+                should_skip = limiter.wait_if_needed()
+                if should_skip and limiter.is_quota_exceeded():
+                    if pooled_keys:
+                        pooled_key, active_model = self._fail_over(model, pooled_key, pooled_keys)
+                        continue
                     return ("I'm currently unable to process requests due to daily quota limits. "
                            "Please try again tomorrow or contact our veterinarians."), None
                 
                 # Make request
                 if image:
-                    response = model.generate_content([prompt, image])
+                    response = active_model.generate_content([prompt, image], generation_config=generation_config)
                 else:
-                    response = model.generate_content(prompt)
+                    response = active_model.generate_content(prompt, generation_config=generation_config)
                 
                 if response and response.text:
-                    self.rate_limiter.reset_on_success()
+                    limiter.reset_on_success()
+                    limiter.record_usage(response)
                     response_text = response.text.strip()
                     
                     # Cache successful response (only for text queries)
@@ -293,20 +397,21 @@ class AnimalDiseaseChatbot:
                 
                 # Handle different types of errors
                 if "429" in error_str or "resource exhausted" in error_str or "quota" in error_str:
-                    wait_time = self.rate_limiter.handle_rate_limit_error(str(e))
+                    wait_time = limiter.handle_rate_limit_error(str(e))
+                    gemini_key_pool.record_rate_limited(pooled_key.api_key)
+                    
+                    # Another pooled key may still have headroom: fail over without waiting
+                    if pooled_keys:
+                        pooled_key, active_model = self._fail_over(model, pooled_key, pooled_keys)
+                        continue
                     
                     # If quota exceeded, don't retry - provide helpful fallback
-                    if self.rate_limiter.is_quota_exceeded():
-                        quota_msg = ("I've reached my daily quota limit. This is normal for free tier usage. "
-                                   "Please try again tomorrow, or you can:\n"
-                                   "• Use our disease detection features\n"
-                                   "• Consult with our veterinarians\n"
-                                   "• Browse our health resources")
-                        
+                    if limiter.is_quota_exceeded():
                         if self.enable_fallback:
-                            fallback_response = self._get_fallback_response(prompt)
-                            return f"{quota_msg}\n\nHere's some general guidance:\n{fallback_response}", None
-                        return quota_msg, None
+                            guidance = combine([fallback_corpus.text('notice.general_guidance_intro', language),
+                                                self._get_fallback_response(prompt, language)], language, '\n')
+                            return self._localized_notice('quota_daily', guidance, language), None
+                        return fallback_corpus.render('notice.quota_daily', language), None
                     
                     if attempt < max_retries - 1:
                         logger.info(f" Retrying after rate limit (attempt {attempt + 1}/{max_retries})...")
@@ -314,6 +419,7 @@ class AnimalDiseaseChatbot:
                         retry_wait = min(wait_time, 10)  # Cap at 10 seconds for retries
                         logger.info(f" Waiting {retry_wait:.1f} seconds before retry...")
                         time.sleep(retry_wait)
+                        attempt += 1
                         continue
                     else:
                         # Provide helpful fallback response for rate limit
@@ -325,6 +431,7 @@ class AnimalDiseaseChatbot:
                         wait_time = (attempt + 1) * 2  # Linear backoff for network issues
                         logger.info(f" Network error, retrying in {wait_time}s (attempt {attempt + 1}/{max_retries})...")
                         time.sleep(wait_time)
+                        attempt += 1
                         continue
                     else:
                         return ("I'm having trouble connecting to my AI service. Please check your internet connection and try again. "
@@ -338,12 +445,25 @@ class AnimalDiseaseChatbot:
                         wait_time = (attempt + 1) * 1.0  # Reduced wait time
                         logger.info(f" Gemini error, retrying in {wait_time}s: {str(e)[:100]}...")
                         time.sleep(wait_time)
+                        attempt += 1
                         continue
                     else:
                         return ("I'm currently experiencing technical difficulties. Please try your question again or consult with our veterinarians for immediate assistance."), None
         
         return ("I apologize, but I'm unable to process your request right now due to technical issues. Please try again in a few moments or consult with our veterinarians."), None
     
+    def _model_for_key(self, model, api_key):
+        """The same model bound to another pooled key (the chatbot's own key uses the model as is)"""
+        if api_key == self.api_key:
+            return model
+        return bind_model(genai, model.model_name, api_key)
+    
+    def _fail_over(self, model, pooled_key, pooled_keys):
+        """Move to the next pooled key; returns (pooled_key, model)"""
+        next_key = pooled_keys.pop(0)
+        gemini_key_pool.record_failover(FEATURE_CHAT, pooled_key, next_key)
+        return next_key, self._model_for_key(model, next_key.api_key)
+    
     def _initialize_genai(self):
         """Initialize Google Generative AI"""
         try:
@@ -361,19 +481,19 @@ class AnimalDiseaseChatbot:
             
             # Try to initialize text model with newer model
             try:
-                self.model = genai.GenerativeModel('gemini-2.5-flash')
+                self.model = bind_model(genai, 'gemini-2.5-flash', self.api_key)
                 logger.info(" Text model initialized successfully with gemini-2.5-flash")
             except Exception as e:
                 logger.error(f" Failed to initialize gemini-2.5-flash: {e}")
                 try:
                     # Fallback to older model if available
-                    self.model = genai.GenerativeModel('gemini-1.5-flash')
+                    self.model = bind_model(genai, 'gemini-1.5-flash', self.api_key)
                     logger.info(" Text model initialized with gemini-1.5-flash fallback")
                 except Exception as e2:
                     logger.error(f" Failed to initialize fallback model: {e2}")
                     try:
                         # Last resort - try the basic model
-                        self.model = genai.GenerativeModel('gemini-pro')
+                        self.model = bind_model(genai, 'gemini-pro', self.api_key)
                         logger.info(" Text model initialized with gemini-pro (legacy)")
                     except Exception as e3:
                         logger.error(f" All text model initialization failed: {e3}")
@@ -381,13 +501,13 @@ class AnimalDiseaseChatbot:
             
             # Try to initialize vision model with newer model
             try:
-                self.vision_model = genai.GenerativeModel('gemini-2.5-flash')
+                self.vision_model = bind_model(genai, 'gemini-2.5-flash', self.api_key)
                 logger.info(" Vision model initialized successfully with gemini-2.5-flash")
             except Exception as e:
                 logger.warning(f" Vision model initialization failed: {e}")
                 try:
                     # Fallback to older vision model
-                    self.vision_model = genai.GenerativeModel('gemini-1.5-flash')
+                    self.vision_model = bind_model(genai, 'gemini-1.5-flash', self.api_key)
                     logger.info(" Vision model initialized with gemini-1.5-flash fallback")
                 except Exception as e2:
                     logger.warning(f" Vision model fallback failed: {e2}")
@@ -457,8 +577,59 @@ class AnimalDiseaseChatbot:
                 return True
         return False
     
-    def process_text_query(self, user_input, language='en', session_key=None):
+    def _token_budget_response(self, user_input, feature, response_type='text', language='en'):
+        """Offline answer for a user whose daily Gemini token budget is spent"""
+        token_budget.reject(feature, 'daily token budget exhausted')
+        return {
+            'success': True,
+            'response': self._localized_notice('token_budget', self._get_fallback_response(user_input or '', language), language),
+            'type': response_type,
+            'is_fallback': True,
+            'token_budget_exceeded': True
+        }
+    
+    def process_text_query(self, user_input, language='en', session_key=None, user_id=None):
         """Process text-based queries about animal diseases with session context"""
+        conversation = self.sessions.get(session_key)
+        routed = self._answer_from_intent(user_input, language, conversation)
+        if routed is not None:
+            return routed
+        if user_input and not token_budget.allows_user(user_id, estimate_tokens(user_input)):
+            return self._token_budget_response(user_input, 'chat_text', language=language)
+        with token_budget.scope('chat_text', user_id):
+            return self._answer_text_query(user_input, language, conversation)
+    
+    def _answer_from_intent(self, user_input, language, conversation):
+        """Canned answer for greetings, platform questions and short generic topic questions, without Gemini"""
+        routed = intent_router.route(user_input)
+        if routed is None:
+            return None
+        intent, confidence = routed
+        if intent in TOPIC_INTENTS:
+            response_text = combine([fallback_corpus.text(f'keyword.{intent}', language),
+                                     fallback_corpus.text('keyword_footer', language)], language)
+            # Topic answers are real context for follow-up questions; small talk is not
+            self._remember_exchange(conversation, user_input, response_text, language)
+        else:
+            response_text = fallback_corpus.render(f'intent.{intent}', language)
+        if response_text.language != language:
+            # No corpus translation for this template yet
+            response_text = self._translate_text(response_text, response_text.language, language)
+        logger.info(f" Answered offline as '{intent}' ({confidence:.2f})")
+        return {
+            'success': True,
+            'response': response_text,
+            'type': 'text',
+            'intent': intent,
+            'session_key': conversation.key
+        }
+    
+    def _answer_text_query(self, user_input, language='en', conversation=None, query_language=None,
+                           reference_query=None):
+        """Answer a text query inside the caller's token budget scope.
+        query_language is the language user_input is written in when it is not the answer language
+        (the PDF prompt is already English around the translated question); reference_query is passed
+        on to _build_veterinary_prompt."""
         try:
             # Validate input
             if not user_input or not user_input.strip():
@@ -468,15 +639,9 @@ class AnimalDiseaseChatbot:
                     'type': 'text'
                 }
             
-            # Set current session key
-            if session_key:
-                self.current_session_key = session_key
-                # Load session history if exists
-                if session_key in self.session_histories:
-                    self.conversation_history = self.session_histories[session_key]
-                else:
-                    self.conversation_history = []
-                    self.session_histories[session_key] = self.conversation_history
+            # History comes from the request's own session, never from shared instance state
+            if conversation is None:
+                conversation = self.sessions.get(None)
             
             # Check if model is available
             if not self.model:
@@ -484,16 +649,17 @@ class AnimalDiseaseChatbot:
                 return {
                     'success': False,
                     'error': 'AI model temporarily unavailable - please try again in a few moments',
-                    'fallback_response': self._get_fallback_response(user_input),
+                    'fallback_response': self._get_fallback_response(user_input, language),
                     'type': 'text'
                 }
             
-            # Only translate if absolutely necessary (not English and translation available)
-            should_translate = language != 'en' and TRANSLATION_AVAILABLE
+            # In direct mode Gemini answers in the user's language; otherwise translate around an English answer
+            answer_directly = self._answers_directly(language)
+            should_translate = language != 'en' and TRANSLATION_AVAILABLE and not answer_directly
             
             # Use original input for English or if translation unavailable
             query_text = user_input
-            if should_translate:
+            if should_translate and (query_language or language) != 'en':
                 try:
                     query_text = self._translate_text(user_input, language, 'en')
                 except Exception as trans_error:
@@ -501,55 +667,27 @@ class AnimalDiseaseChatbot:
                     query_text = user_input
                     should_translate = False  # Don't translate response either
             
-            # Build context from conversation history
-            context = ""
-            if self.conversation_history:
-                # Include last few exchanges for context
-                recent_history = self.conversation_history[-6:]  # Last 3 exchanges (6 messages)
-                context_parts = []
-                for hist in recent_history:
-                    if 'user' in hist and 'assistant' in hist:
-                        context_parts.append(f"User: {hist['user']}")
-                        context_parts.append(f"Assistant: {hist['assistant']}")
-                
-                if context_parts:
-                    context = "\nPrevious conversation:\n" + "\n".join(context_parts) + "\n\nCurrent question:\n"
-            
             # Create context-aware veterinary prompt
-            veterinary_prompt = f"""You are a veterinary AI assistant. {context}Answer this question: {query_text}
-
-Provide:
-- Accurate, practical advice
-- Key symptoms or treatments  
-- When to see a vet
-- Prevention tips if relevant
-
-Keep response focused and helpful."""
+            veterinary_prompt = self._build_veterinary_prompt(query_text, language if answer_directly else 'en', conversation,
+                                                              reference_query)
+            token_budget.note_prompt(veterinary_prompt)
             
             try:
                 logger.info(" Generating text response...")
                 
                 # Use the robust API call function
-                response_text, error = self._call_gemini_with_retry(self.model, veterinary_prompt)
+                response_text, error = self._call_gemini_with_retry(
+                    self.model, veterinary_prompt,
+                    generation_config=self._localized_generation_config() if answer_directly else None,
+                    language=language
+                )
                 
                 if error:
                     logger.error(f" Text generation failed: {error}")
                     
                     # Provide a better fallback for rate limit errors
                     if "Rate limit exceeded" in error:
-                        fallback_message = """I'm experiencing high demand right now. Here's some helpful guidance while you wait:
-
-**For immediate animal health concerns:**
-- Monitor vital signs (temperature, breathing, appetite)
-- Ensure animal has access to clean water
-- Contact local veterinarian for urgent issues
-
-**Common Care Tips:**
-- Keep sick animals isolated
-- Maintain clean living conditions  
-- Document symptoms and duration
-
-Please try asking your question again in a few minutes. Thank you for your patience!"""
+                        fallback_message = fallback_corpus.render('notice.rate_limited_guidance', language)
                         
                         return {
                             'success': True,  # Still return success but with fallback
@@ -561,43 +699,27 @@ Please try asking your question again in a few minutes. Thank you for your patie
                     return {
                         'success': False,
                         'error': error,
-                        'fallback_response': self._get_fallback_response(user_input),
+                        'fallback_response': self._get_fallback_response(user_input, language),
                         'type': 'text'
                     }
                 
                 if response_text:
                     # Store in conversation history
-                    try:
-                        conversation_entry = {
-                            'user': user_input,
-                            'assistant': response_text,
-                            'timestamp': datetime.now().isoformat(),
-                            'language': language
-                        }
-                        self.conversation_history.append(conversation_entry)
-                        
-                        # Update session history
-                        if self.current_session_key:
-                            self.session_histories[self.current_session_key] = self.conversation_history
-                            
-                        # Keep only last 20 exchanges to prevent memory issues
-                        if len(self.conversation_history) > 20:
-                            self.conversation_history = self.conversation_history[-20:]
-                            if self.current_session_key:
-                                self.session_histories[self.current_session_key] = self.conversation_history
-                    except:
-                        pass  # Don't fail if history storage fails
+                    self._remember_exchange(conversation, user_input, response_text, language)
                     
-                    # Translate back to original language only if we translated the input
+                    # Translate back to original language only if we translated the input;
+                    # fallback answers already come from the pre-translated corpus
                     final_response = response_text
-                    if should_translate:
+                    if isinstance(response_text, LocalizedText) and response_text.language == language:
+                        logger.info(f" Served pre-translated fallback ({response_text.language})")
+                    elif should_translate:
                         try:
                             # For long responses in regional languages, provide a shorter summary
-                            if len(response_text) > 2000 and language in ['mr', 'hi', 'ta', 'te', 'gu', 'kn', 'ml', 'pa', 'bn']:
+                            if len(response_text) > 2000 and language in INDIC_LANGUAGES:
                                 # Create a shorter summary for translation
                                 summary_prompt = f"Summarize this veterinary advice in 2-3 concise sentences: {response_text[:1000]}"
                                 try:
-                                    summary_text, summary_error = self._call_gemini_with_retry(self.model, summary_prompt)
+                                    summary_text, summary_error = self._call_gemini_with_retry(self.model, summary_prompt, priority_class=CLASS_SECONDARY)
                                     if summary_text and not summary_error:
                                         final_response = self._translate_text(summary_text, 'en', language)
                                         logger.info(f" Provided translated summary for {language}")
@@ -611,19 +733,23 @@ Please try asking your question again in a few minutes. Thank you for your patie
                         except Exception as trans_error:
                             logger.warning(f"Response translation failed, using English: {trans_error}")
                             final_response = response_text
+                    elif answer_directly and TRANSLATION_AVAILABLE and not self._is_in_language(response_text, language):
+                        # The model answered in English anyway: translation is the fallback
+                        logger.info(f" Direct {language} answer came back in English, translating")
+                        final_response = self._translate_text(response_text, 'en', language)
                     
                     logger.info(" Text response generated successfully")
                     return {
                         'success': True,
                         'response': final_response,
                         'type': 'text',
-                        'session_key': self.current_session_key
+                        'session_key': conversation.key
                     }
                 else:
                     return {
                         'success': False,
                         'error': 'No response generated',
-                        'fallback_response': self._get_fallback_response(user_input),
+                        'fallback_response': self._get_fallback_response(user_input, language),
                         'type': 'text'
                     }
                     
@@ -632,7 +758,7 @@ Please try asking your question again in a few minutes. Thank you for your patie
                 return {
                     'success': False,
                     'error': f'Generation failed: {str(generation_error)}',
-                    'fallback_response': self._get_fallback_response(user_input),
+                    'fallback_response': self._get_fallback_response(user_input, language),
                     'type': 'text'
                 }
         
@@ -642,12 +768,229 @@ Please try asking your question again in a few minutes. Thank you for your patie
             return {
                 'success': False,
                 'error': str(e),
-                'fallback_response': self._get_fallback_response(user_input),
+                'fallback_response': self._get_fallback_response(user_input, language),
                 'type': 'text'
             }
     
-    def analyze_image(self, image_data, question=None, language='en'):
+    # Fixed wording of the veterinary prompt, used to size the history budget
+    _VETERINARY_PROMPT_FRAME = (
+        "You are a veterinary AI assistant. Answer this question: Provide: - Accurate, practical advice "
+        "- Key symptoms or treatments - When to see a vet - Prevention tips if relevant "
+        "Keep response focused and helpful."
+    )
+    
+    def _answers_directly(self, language):
+        """Whether a non-English query is answered in its own language in a single call"""
+        return language != 'en' and language in LANGUAGE_NAMES and self.localized_mode == 'direct'
+    
+    @staticmethod
+    def _localized_generation_config():
+        return {'max_output_tokens': CHATBOT_LOCALIZED_MAX_OUTPUT_TOKENS}
+    
+    @staticmethod
+    def _is_in_language(text, language):
+        """Cheap script check: an Indic-language answer should be mostly non-Latin letters"""
+        if language not in INDIC_LANGUAGES:
+            return True
+        letters = [ch for ch in text if ch.isalpha()]
+        return bool(letters) and sum(1 for ch in letters if ord(ch) > 127) / len(letters) >= 0.5
+    
+    def _build_veterinary_prompt(self, query_text, language='en', conversation=None, reference_query=None):
+        """Build the context-aware veterinary prompt from the session's history.
+        Reference notes and document excerpts are looked up with reference_query (the query text when None);
+        an empty one leaves them out, as for PDF prompts, which carry their own document within its budget."""
+        reference_query = query_text if reference_query is None else reference_query
+        # Matching passages from the local knowledge index ground the answer in the app's own treatments
+        reference = ""
+        knowledge = knowledge_index.context(reference_query) if reference_query else ""
+        if knowledge:
+            knowledge_index.count('prompt_injections')
+            reference = (f"\nReference notes from the PashuArogyam knowledge base (build on what fits the question, "
+                         f"do not repeat them word for word):\n{knowledge}\n\n")
+        
+        # Follow-ups on a PDF uploaded earlier in the session get the parts of it that match the question
+        document = pdf_ingestor.cached(conversation.document) if conversation is not None and conversation.document else None
+        if document is not None and reference_query:
+            excerpts, _ = document.select(reference_query, pdf_ingestor.followup_tokens, matching_only=True)
+            if excerpts:
+                reference += f"\nExcerpts from the document the user uploaded earlier:\n{excerpts}\n\n"
+        
+        context = ""
+        if conversation is not None:
+            # Summary of older turns plus the most recent exchanges, within the history budget
+            budget = token_budget.history_budget(query_text + self._VETERINARY_PROMPT_FRAME + reference)
+            context, trimmed = self.context_builder.render(conversation, budget)
+            if trimmed:
+                token_budget.mark_trimmed()
+        
+        return f"""You are a veterinary AI assistant. {reference}{context}Answer this question: {query_text}
+
+Provide:
+- Accurate, practical advice
+- Key symptoms or treatments  
+- When to see a vet
+- Prevention tips if relevant
+
+Keep response focused and helpful.{self._language_instruction(language)}"""
+    
+    @staticmethod
+    def _language_instruction(language):
+        if language == 'en' or language not in LANGUAGE_NAMES:
+            return ""
+        name = LANGUAGE_NAMES[language]
+        return (f"\n\nWrite the whole answer in {name}, using simple words a farmer would use, "
+                f"in at most {CHATBOT_LOCALIZED_MAX_WORDS} words. Keep medicine and disease names "
+                f"in English in brackets where that helps.")
+    
+    def _remember_exchange(self, conversation, user_input, response_text, language):
+        """Append an exchange to the session's history (the ring buffer keeps the last exchanges)"""
+        try:
+            self.sessions.append(conversation, {
+                'user': user_input,
+                'assistant': response_text,
+                'timestamp': datetime.now().isoformat(),
+                'language': language
+            })
+            # Model-mode summaries are rewritten in the background, after the answer is out
+            self.context_builder.schedule_refresh(conversation, self._summarize_for_context)
+        except:
+            pass  # Don't fail if history storage fails
+    
+    def _summarize_for_context(self, prompt):
+        """Deferred, shed-first summary call for the rolling conversation summary"""
+        summary_text, error = self._call_gemini_with_retry(self.model, prompt, priority_class=CLASS_SECONDARY)
+        if error or isinstance(summary_text, LocalizedText):
+            return None
+        return summary_text
+    
+    def stream_text_query(self, user_input, language='en', session_key=None, user_id=None):
+        """
+        Stream a text answer as it is generated.
+        Yields event dicts: {'type': 'chunk', 'text': ...} while tokens arrive and a final
+        {'type': 'done', 'response': ..., 'is_fallback': ...} once the answer is complete
+        ('incomplete': True when the stream broke off part way).
+        """
+        if not user_input or not user_input.strip():
+            yield {'type': 'error', 'error': 'Empty input provided'}
+            return
+        
+        conversation = self.sessions.get(session_key)
+        
+        # Translated answers are translated as a whole, so they cannot be streamed token by token;
+        # direct-mode answers are generated in the user's language and stream like English ones
+        answer_directly = self._answers_directly(language)
+        if (language != 'en' and not answer_directly) or not self.model or self.offline_mode or not GENAI_AVAILABLE:
+            result = self.process_text_query(user_input, language, session_key, user_id=user_id)
+            response_text = result.get('response') or result.get('fallback_response') or result.get('error', '')
+            yield {'type': 'chunk', 'text': response_text}
+            yield {
+                'type': 'done',
+                'response': response_text,
+                'is_fallback': result.get('is_fallback', not result.get('success', False))
+            }
+            return
+        
+        routed = self._answer_from_intent(user_input, language, conversation)
+        if routed is not None:
+            yield {'type': 'chunk', 'text': routed['response']}
+            yield {'type': 'done', 'response': routed['response'], 'is_fallback': False, 'intent': routed['intent']}
+            return
+        
+        if not token_budget.allows_user(user_id, estimate_tokens(user_input)):
+            fallback_response = self._token_budget_response(user_input, 'chat_stream', language=language)['response']
+            yield {'type': 'chunk', 'text': fallback_response}
+            yield {'type': 'done', 'response': fallback_response, 'is_fallback': True}
+            return
+        
+        prompt = self._build_veterinary_prompt(user_input, language, conversation)
+        
+        cached_response = self.rate_limiter.get_cached_response(prompt, has_image=False)
+        if cached_response:
+            self._remember_exchange(conversation, user_input, cached_response, language)
+            yield {'type': 'chunk', 'text': cached_response}
+            yield {'type': 'done', 'response': cached_response, 'is_fallback': False}
+            return
+        
+        # Stream on the pooled key with the most headroom
+        pooled_keys = gemini_key_pool.candidates(FEATURE_CHAT)
+        limiter = pooled_keys[0].limiter if pooled_keys else self.rate_limiter
+        
+        # Hold a chat-class dispatcher slot until the stream ends (or the client disconnects); as in
+        # _call_gemini_with_retry the limiter only waits and counts the call once the slot is granted
+        ticket = gemini_dispatcher.acquire(CLASS_CHAT)
+        if not pooled_keys or ticket.shed or (limiter.wait_if_needed() and limiter.is_quota_exceeded()):
+            gemini_dispatcher.release(ticket)
+            fallback_response = self._get_fallback_response(user_input, language)
+            yield {'type': 'chunk', 'text': fallback_response}
+            yield {'type': 'done', 'response': fallback_response, 'is_fallback': True}
+            return
+        
+        parts = []
+        failed = False
+        try:
+            logger.info(" Streaming text response...")
+            stream_model = self._model_for_key(self.model, pooled_keys[0].api_key)
+            stream_response = stream_model.generate_content(
+                prompt, stream=True, generation_config=self._localized_generation_config() if answer_directly else None
+            )
+            for chunk in stream_response:
+                try:
+                    chunk_text = chunk.text
+                except ValueError:
+                    continue  # Chunk without text parts (e.g. safety metadata only)
+                if chunk_text:
+                    parts.append(chunk_text)
+                    yield {'type': 'chunk', 'text': chunk_text}
+        except Exception as e:
+            failed = True
+            error_str = str(e).lower()
+            if "429" in error_str or "resource exhausted" in error_str or "quota" in error_str:
+                limiter.handle_rate_limit_error(str(e))
+                gemini_key_pool.record_rate_limited(pooled_keys[0].api_key)
+            else:
+                limiter.record_failure()
+            logger.error(f" Streaming generation failed: {e}")
+            if not parts:
+                fallback_response = self._get_fallback_response(user_input, language)
+                yield {'type': 'chunk', 'text': fallback_response}
+                yield {'type': 'done', 'response': fallback_response, 'is_fallback': True}
+                return
+        finally:
+            gemini_dispatcher.release(ticket)
+        
+        response_text = "".join(parts).strip()
+        if not response_text:
+            fallback_response = self._get_fallback_response(user_input, language)
+            yield {'type': 'chunk', 'text': fallback_response}
+            yield {'type': 'done', 'response': fallback_response, 'is_fallback': True}
+            return
+        
+        if failed:
+            # A cut-off answer is shown as it stands but never cached or remembered as a complete one
+            logger.warning(f" Stream cut off after {len(response_text)} characters")
+            yield {'type': 'done', 'response': response_text, 'is_fallback': False, 'incomplete': True,
+                   'error': 'The answer was cut off before it finished. Please ask again.'}
+            return
+        
+        limiter.reset_on_success()
+        limiter.record_usage(stream_response)
+        gemini_dispatcher.record_usage(stream_response, CLASS_CHAT)
+        # The stream spans generator yields, so its usage is charged here rather than in a scope
+        token_budget.record('chat_stream', user_id, stream_response, estimate_tokens(prompt))
+        self.rate_limiter.cache_response(prompt, response_text, has_image=False)
+        self._remember_exchange(conversation, user_input, response_text, language)
+        logger.info(" Streamed text response completed")
+        yield {'type': 'done', 'response': response_text, 'is_fallback': False}
+    
+    def analyze_image(self, image_data, question=None, language='en', user_id=None):
         """Analyze uploaded images for disease detection"""
+        if not token_budget.allows_user(user_id, estimate_image_tokens() + estimate_tokens(question)):
+            return self._token_budget_response(question, 'chat_image', 'image_analysis', language)
+        with token_budget.scope('chat_image', user_id):
+            return self._analyze_image(image_data, question, language)
+    
+    def _analyze_image(self, image_data, question=None, language='en'):
+        """Analyze an image inside the caller's token budget scope"""
         try:
             # Check if vision model is available
             if not self.vision_model:
@@ -683,18 +1026,15 @@ Please try asking your question again in a few minutes. Thank you for your patie
                     # Assume bytes
                     image_bytes = image_data
                 
-                # Validate image format
+                # Validate image format and shrink it to the vision model's useful resolution
                 try:
                     image = Image.open(io.BytesIO(image_bytes))
-                    # Convert to RGB if needed
-                    if image.mode not in ['RGB', 'RGBA']:
-                        image = image.convert('RGB')
+                    image.load()
                     
-                    # Resize if too large (max 2048x2048)
-                    if image.width > 2048 or image.height > 2048:
-                        image.thumbnail((2048, 2048), Image.Resampling.LANCZOS)
+                    image_data, image_info = vision_image_preparer.prepare(image=image, image_bytes=image_bytes)
+                    image = {"mime_type": image_info['mime_type'], "data": image_data}
                     
-                    logger.info(f" Image processed: {image.width}x{image.height}, mode: {image.mode}")
+                    logger.info(f" Image processed: {image_info['width']}x{image_info['height']}, {image_info['bytes'] // 1024} KB")
                     
                 except Exception as img_process_error:
                     logger.error(f" Image format validation failed: {img_process_error}")
@@ -735,6 +1075,7 @@ Provide:
 4. When to see a vet
 
 Be specific but concise."""
+            token_budget.note_prompt(image_prompt, estimate_image_tokens(image_info['width'], image_info['height']))
             
             try:
                 logger.info(" Generating image analysis...")
@@ -800,7 +1141,7 @@ Be specific but concise."""
                 'type': 'image_analysis'
             }
     
-    def process_pdf(self, pdf_data, question=None, language='en'):
+    def process_pdf(self, pdf_data, question=None, language='en', user_id=None, session_key=None):
         """Process PDF documents and answer questions about them"""
         try:
             # Check if PDF processing is available
@@ -812,6 +1153,24 @@ Be specific but concise."""
                     'type': 'pdf_analysis'
                 }
             
+            # Default question if none provided
+            if not question:
+                question = "Summarize the key information in this document related to animal health and diseases."
+            
+            # Translate question to English if needed
+            translated_question = self._translate_text(question, language, 'en')
+            
+            if not token_budget.allows_user(user_id, estimate_tokens(translated_question)):
+                return self._token_budget_response(question, 'chat_pdf', 'pdf_analysis', language)
+            
+            query_frame = f"""Based on the following document content, please answer: {translated_question}
+
+Document content:
+{{document}}
+
+Please provide a comprehensive answer based on the document content."""
+            document_budget = token_budget.document_budget(query_frame)
+            
             # Extract text from PDF
             try:
                 if hasattr(pdf_data, 'read'):
@@ -821,19 +1180,21 @@ Be specific but concise."""
                 else:
                     pdf_bytes = pdf_data
                 
-                pdf_reader = PyPDF2.PdfReader(io.BytesIO(pdf_bytes))
-                text_content = ""
-                
-                for page in pdf_reader.pages:
-                    text_content += page.extract_text() + "\n"
+                # Read in worker processes only as far as the question needs; another question
+                # about the same upload reuses what was read and carries on from there
+                document = pdf_ingestor.load(pdf_bytes, translated_question, document_budget)
                 
-                if not text_content.strip():
+                if not document.chunks:
                     return {
                         'success': False,
                         'error': 'No text found in PDF',
                         'type': 'pdf_analysis'
                     }
                 
+                # Follow-up questions in the chat session can draw on the document's matching chunks
+                if session_key:
+                    self.sessions.get(session_key).document = document.digest
+                
             except Exception as pdf_error:
                 logger.error(f" PDF extraction failed: {pdf_error}")
                 return {
@@ -842,23 +1203,17 @@ Be specific but concise."""
                     'type': 'pdf_analysis'
                 }
             
-            # Default question if none provided
-            if not question:
-                question = "Summarize the key information in this document related to animal health and diseases."
-            
-            # Translate question to English if needed
-            translated_question = self._translate_text(question, language, 'en')
-            
-            # Create combined query
-            combined_query = f"""Based on the following document content, please answer: {translated_question}
-
-Document content:
-{text_content[:4000]}  # Limit content to avoid token limits
-
-Please provide a comprehensive answer based on the document content."""
+            # The chunks most relevant to the question, within what the per-call budget leaves after the frame
+            document_text, trimmed = document.select(translated_question, document_budget)
+            combined_query = query_frame.replace('{document}', document_text)
             
             # Process as text query
-            return self.process_text_query(combined_query, language)
+            with token_budget.scope('chat_pdf', user_id):
+                if trimmed:
+                    token_budget.mark_trimmed()
+                    logger.info(f" PDF selected ~{estimate_tokens(document_text)} of ~{document.tokens} tokens "
+                                f"from {document.pages_read}/{document.pages} pages read for the question")
+                return self._answer_text_query(combined_query, language, query_language='en', reference_query='')
         
         except Exception as e:
             logger.error(f" Error processing PDF: {str(e)}")
@@ -870,7 +1225,7 @@ Please provide a comprehensive answer based on the document content."""
             }
     
     def _translate_text(self, text, source_lang, target_lang):
-        """Translate text between languages - optimized for speed"""
+        """Translate text between languages through the shared cached, pooled translation service"""
         try:
             # Quick checks to avoid unnecessary translation
             if source_lang == target_lang:
@@ -882,179 +1237,100 @@ Please provide a comprehensive answer based on the document content."""
             if not text or not text.strip() or len(text.strip()) < 3:
                 return text
             
-            # For Indian languages like Marathi, allow longer text translation
-            max_length = 2000 if target_lang in ['mr', 'hi', 'ta', 'te', 'gu', 'kn', 'ml', 'pa', 'bn'] else 1000
-            
-            # Skip translation for very long texts to save time
-            if len(text) > max_length:
-                logger.info(f"⚡ Skipping translation for long text ({len(text)} chars > {max_length}) to improve speed")
-                return text
-            
-            # Create translator and translate with timeout
-            import threading
-            import time
-            
-            result = {'translated': None, 'error': None}
-            
-            def translate_with_timeout():
-                try:
-                    translator = GoogleTranslator(source=source_lang, target=target_lang)
-                    result['translated'] = translator.translate(text)
-                except Exception as e:
-                    result['error'] = str(e)
-            
-            # Run translation with 5 second timeout
-            translation_thread = threading.Thread(target=translate_with_timeout)
-            translation_thread.daemon = True
-            translation_thread.start()
-            translation_thread.join(timeout=5)
-            
-            if translation_thread.is_alive():
-                logger.warning(" Translation timed out, using original text")
-                return text
-            
-            if result['error']:
-                logger.warning(f" Translation failed ({source_lang} → {target_lang}): {result['error']}")
-                return text
-            
-            if result['translated']:
+            # Long texts are split into sentence chunks and translated in parallel
+            translated = translation_service.translate(text, source_lang, target_lang)
+            if translated is not text:
                 logger.info(f" Translation completed: {source_lang} → {target_lang}")
-                return result['translated']
-            else:
-                return text
+            return translated
             
         except Exception as e:
             logger.warning(f" Translation error ({source_lang} → {target_lang}): {e}")
             return text  # Return original text if translation fails
     
-    def _get_fallback_response(self, user_input):
-        """Provide helpful fallback response when AI is unavailable"""
+    def _get_fallback_response(self, user_input, language='en'):
+        """Provide helpful fallback response when AI is unavailable, in the user's language without a translation call"""
         if not user_input:
             user_input = ""
+        
+        # A clear match in the local knowledge base beats the generic templates
+        knowledge_answer = self._knowledge_answer(user_input, language)
+        if knowledge_answer is not None:
+            return knowledge_answer
             
         # Use the enhanced fallback system from app.py
         # Import the function to avoid duplication
         try:
             import app
             if hasattr(app, 'get_enhanced_fallback_response'):
-                return app.get_enhanced_fallback_response(user_input)
+                return app.get_enhanced_fallback_response(user_input, language)
         except:
             pass
             
-        user_lower = user_input.lower()
-        
-        # Enhanced keyword responses with more detail
-        keywords_responses = {
-            'fever': '🌡️ **Fever Management**: Monitor temperature (normal: 101-103F). Provide shade, cool water, electrolytes. Contact vet if >104F or lethargic.',
-            'diarrhea': '💧 **Diarrhea Treatment**: Ensure hydration, withhold food 12-24 hours, provide electrolytes, probiotics. Vet needed if bloody or persistent >2 days.',
-            'cough': '😷 **Cough Care**: Check for respiratory distress, isolate animal, ensure good ventilation, avoid dust. Vet consultation for persistent coughing.',
-            'lameness': '🦵 **Lameness Assessment**: Rest the animal, check for swelling/cuts, limit movement, cold compress for swelling. Vet exam within 24-48 hours.',
-            'mastitis': '🥛 **Mastitis Treatment**: Frequent milking, warm compresses, check for hard udder quarters. Antibiotic treatment often needed - contact vet.',
-            'vaccination': '💉 **Vaccination Schedule**: Follow local vet recommendations, maintain cold chain, record dates. Core vaccines: FMD, BVD, IBR for cattle.',
-            'bloat': '🫃 **Bloat Emergency**: Remove from feed immediately, keep animal moving, massage left flank, contact vet URGENTLY - can be fatal.',
-            'wound': '🩹 **Wound Care**: Clean with saline, apply antiseptic, bandage if needed, monitor for infection signs. Deep wounds need vet attention.',
-            'parasite': '🐛 **Parasite Control**: Regular deworming schedule, fecal testing, pasture rotation, check for anemia. Consult vet for resistance issues.',
-            'nutrition': '🌾 **Nutrition Guidelines**: Balanced feed, clean water, age-appropriate diet, avoid sudden changes. Consult nutritionist for optimal feeding.',
-            'breeding': '🐄 **Breeding Management**: Monitor heat cycles, proper timing, nutrition during pregnancy, vaccination before breeding. Vet for AI/pregnancy checks.'
-        }
-        
-        matched_keywords = [keyword for keyword in keywords_responses.keys() if keyword in user_lower]
+        # Enhanced keyword responses with more detail, most mentioned topics first
+        matched_keywords = fallback_matcher.topics(user_input, limit=3)
         
         if matched_keywords:
-            responses = [keywords_responses[keyword] for keyword in matched_keywords[:3]]  # Limit to 3 matches
-            return "\n\n".join(responses) + "\n\n**Always consult a qualified veterinarian for proper diagnosis and treatment.**"
+            responses = [fallback_corpus.text(f"keyword.{keyword}", language) for keyword in matched_keywords]
+            responses.append(fallback_corpus.text('keyword_footer', language))
+            return combine(responses, language)
         
         # Simplified fallback response (avoiding quota messaging here)
-        current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        return f"""🩺 **Animal Health Guidance** ({current_time})
-
-**Emergency Signs - Contact Veterinarian Immediately:**
-- Difficulty breathing, severe bleeding, unable to stand
-- High fever (>104F/40C), seizures, severe pain
-
-**General Care Tips:**
-- Monitor appetite, behavior, and vital signs daily
-- Ensure clean water and appropriate nutrition
-- Maintain clean, dry living conditions
-- Isolate sick animals to prevent spread
-
-**Common Treatments:**
-- **Fever**: Cool water, shade, electrolytes
-- **Minor cuts**: Clean, disinfect, monitor healing
-- **Digestive issues**: Withhold food briefly, provide water
-
-**Always consult a qualified veterinarian for proper diagnosis and treatment.**"""
+        return fallback_corpus.render('general_guidance', language)
+    
+    def _knowledge_answer(self, user_input, language='en'):
+        """Answer from the local knowledge index when Gemini is unavailable; None without a clear match"""
+        results = knowledge_index.search(user_input, limit=2)
+        if not results:
+            return None
+        header = fallback_corpus.text('knowledge_header', language)
+        footer = fallback_corpus.text('keyword_footer', language)
+        passages = [passage['text'] for _, passage in results]
+        if language != 'en':
+            # Gemini is out, so no waiting on the translation API either: only passages translated before are
+            # served, and the pre-translated templates answer until the background translation is cached
+            passages = [translation_service.cached(text, 'en', language) for text in passages]
+            if None in passages or header.language != language or footer.language != language:
+                return None
+        knowledge_index.count('offline_answers')
+        logger.info(f" Answered from the knowledge base ({', '.join(passage['id'] for _, passage in results)})")
+        return combine([header] + [LocalizedText(text, language) for text in passages] + [footer], language)
+    
+    def _localized_notice(self, notice, fallback_text, language='en'):
+        """A pre-translated notice followed by a fallback answer, e.g. quota messages"""
+        return combine([fallback_corpus.text(f'notice.{notice}', language), fallback_text], language)
     
     def get_supported_languages(self):
         """Get list of supported languages"""
-        return [
-            {'code': 'en', 'name': 'English'},
-            {'code': 'hi', 'name': 'Hindi'},
-            {'code': 'mr', 'name': 'Marathi'},
-            {'code': 'te', 'name': 'Telugu'},
-            {'code': 'ta', 'name': 'Tamil'},
-            {'code': 'bn', 'name': 'Bengali'},
-            {'code': 'gu', 'name': 'Gujarati'},
-            {'code': 'kn', 'name': 'Kannada'},
-            {'code': 'ml', 'name': 'Malayalam'},
-            {'code': 'pa', 'name': 'Punjabi'},
-            {'code': 'es', 'name': 'Spanish'},
-            {'code': 'fr', 'name': 'French'},
-            {'code': 'de', 'name': 'German'}
-        ]
+        return [dict(language) for language in SUPPORTED_LANGUAGES]
     
     def clear_conversation(self, session_key=None):
-        """Clear conversation history for a specific session or current session"""
-        if session_key:
-            if session_key in self.session_histories:
-                del self.session_histories[session_key]
-                logger.info(f" Session {session_key} conversation history cleared")
-            if self.current_session_key == session_key:
-                self.conversation_history = []
-                self.current_session_key = None
-        else:
-            # Clear current session
-            if self.current_session_key and self.current_session_key in self.session_histories:
-                del self.session_histories[self.current_session_key]
-            self.conversation_history = []
-            self.current_session_key = None
-            logger.info(" Current conversation history cleared")
+        """Clear conversation history for a specific session"""
+        if session_key and self.sessions.discard(session_key):
+            logger.info(f" Session {session_key} conversation history cleared")
         
         return {'success': True, 'message': 'Conversation cleared'}
     
     def get_conversation_history(self, session_key=None):
-        """Get conversation history for a specific session or current session"""
-        if session_key:
-            history = self.session_histories.get(session_key, [])
-        else:
-            history = self.conversation_history
-            
+        """Get conversation history for a specific session"""
+        conversation = self.sessions.peek(session_key)
         return {
             'success': True,
-            'history': history[-10:],  # Return last 10 exchanges
-            'session_key': session_key or self.current_session_key
+            'history': conversation.recent(10) if conversation is not None else [],  # Return last 10 exchanges
+            'session_key': session_key
         }
     
     def load_session_history(self, session_key):
-        """Load conversation history for a specific session"""
-        if session_key in self.session_histories:
-            self.conversation_history = self.session_histories[session_key]
-            self.current_session_key = session_key
-            logger.info(f" Loaded conversation history for session {session_key}")
-        else:
-            self.conversation_history = []
-            self.session_histories[session_key] = self.conversation_history
-            self.current_session_key = session_key
-            logger.info(f" Created new conversation history for session {session_key}")
-        
+        """Make sure a session exists and mark it as recently used"""
+        conversation = self.sessions.get(session_key)
+        logger.info(f" Using conversation history for session {session_key} ({len(conversation)} exchanges)")
         return {'success': True, 'session_key': session_key}
     
     def get_all_sessions(self):
         """Get all available session keys"""
         return {
             'success': True,
-            'sessions': list(self.session_histories.keys()),
-            'current_session': self.current_session_key
+            'sessions': self.sessions.keys(),
+            'store': self.sessions.get_stats()
         }
     
     def health_check(self):
@@ -1073,5 +1349,12 @@ Please provide a comprehensive answer based on the document content."""
             'success': True,
             'healthy': overall_health,
             'services': status,
+            'translation_cache': translation_service.get_stats(),
+            'fallback_corpus': fallback_corpus.get_stats(),
+            'fallback_matcher': fallback_matcher.get_stats(),
+            'knowledge_index': knowledge_index.get_stats(),
+            'pdf_ingest': pdf_ingestor.get_stats(),
+            'conversation_context': self.context_builder.get_stats(),
+            'intent_router': intent_router.get_stats(),
             'message': 'Service operational' if overall_health else 'Limited functionality'
         }
\ No newline at end of file
@@ -0,0 +1,463 @@
+import os
+import json
+import time
+import queue
+import atexit
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict, deque
+from typing import Any, Dict, List, Optional
+
+try:
+    from pymongo import DeleteOne, InsertOne, UpdateOne
+    PYMONGO_AVAILABLE = True
+except ImportError:
+    DeleteOne = InsertOne = UpdateOne = None
+    PYMONGO_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# memory (per worker), sqlite (shared on one node) or mongo (shared across nodes)
+SESSION_BACKEND = os.getenv('CHATBOT_SESSION_BACKEND', 'memory').lower()
+
+
+def _entry_size(entry: Dict[str, Any]) -> int:
+    """Approximate memory held by one exchange"""
+    return sum(len(str(value)) for value in entry.values()) + 200
+
+
+class ConversationSession:
+    """History of one chat session: a ring buffer of exchanges guarded by its own lock"""
+
+    def __init__(self, key: Optional[str], max_turns: int):
+        self.key = key
+        self.lock = threading.RLock()
+        self.history: deque = deque(maxlen=max_turns)
+        self.size = 0
+        self.last_access = time.time()
+        self.synced_at = 0.0
+        # Rolling summary of turns older than the raw window (see conversation_summary)
+        self.summary_text = ''
+        self.summary_covers = ''
+        self.model_summary_covers: Optional[str] = None
+        # Local appends a write-behind backend may not show yet, with the time they were made
+        self.pending: List[tuple] = []
+        # Turns the backend showed at the last sync; zero after having some means it was cleared elsewhere
+        self.backend_turns = 0
+        # Content hash of the last PDF uploaded in the session, for follow-up questions (see pdf_ingest)
+        self.document: Optional[str] = None
+
+    def append(self, entry: Dict[str, Any], shared: bool = False) -> int:
+        """Add an exchange; returns the change in approximate size"""
+        with self.lock:
+            before = self.size
+            if len(self.history) == self.history.maxlen:
+                self.size -= _entry_size(self.history[0])
+            self.history.append(entry)
+            self.size += _entry_size(entry)
+            self.last_access = time.time()
+            if shared:
+                self.pending.append((self.last_access, entry))
+            return self.size - before
+
+    def merge(self, entries: List[Dict[str, Any]], pending_grace: float = 30.0) -> int:
+        """Replace the history with the backend's, keeping recent local appends it does not show yet.
+
+        The backend is authoritative, so sessions cleared by another worker are
+        cleared here too. Returns the change in size.
+        """
+        identity = lambda entry: (entry.get('timestamp'), entry.get('user'))
+        with self.lock:
+            before = self.size
+            if not entries and self.backend_turns:
+                # The backend had this session and now has nothing: it was cleared on another worker
+                self.pending = []
+            stored = {identity(entry) for entry in entries}
+            cutoff = time.time() - pending_grace
+            self.pending = [(appended_at, entry) for appended_at, entry in self.pending
+                            if appended_at >= cutoff and identity(entry) not in stored]
+            self.backend_turns = len(entries)
+            merged = list(entries) + [entry for _, entry in self.pending]
+            ordered = sorted(merged, key=lambda entry: entry.get('timestamp') or '')
+            self.history.clear()
+            self.history.extend(ordered[-self.history.maxlen:])
+            self.size = sum(_entry_size(entry) for entry in self.history)
+            self.synced_at = time.time()
+            if self.summary_covers and all(entry.get('timestamp') != self.summary_covers for entry in self.history):
+                # The summarized turns are gone (cleared or replaced elsewhere), so the summary is too
+                self.reset_summary()
+            return self.size - before
+
+    def reset_summary(self):
+        with self.lock:
+            self.summary_text = ''
+            self.summary_covers = ''
+            self.model_summary_covers = None
+
+    def recent(self, count: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Copy of the last `count` exchanges (all when None), oldest first"""
+        with self.lock:
+            items = list(self.history)
+        return items if count is None else items[-count:]
+
+    def __len__(self):
+        return len(self.history)
+
+
+class WriteBehindWriter:
+    """Batches MongoDB writes on a background thread so requests never wait on an insert.
+
+    Operations are queued per collection and flushed with one bulk_write every
+    ``interval`` seconds or ``batch_size`` operations. When the queue is full
+    the operation is dropped and counted rather than blocking the request.
+    """
+
+    def __init__(self, batch_size: int = 50, interval: float = 1.0, max_queue: int = 5000):
+        self.batch_size = batch_size
+        self.interval = interval
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._stats = {'queued': 0, 'written': 0, 'batches': 0, 'dropped': 0, 'errors': 0}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, stat: str, amount: int = 1):
+        with self._stats_lock:
+            self._stats[stat] += amount
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='conversation-writer', daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+
+    def submit(self, collection, operation) -> bool:
+        """Queue a pymongo InsertOne/UpdateOne/DeleteOne for the collection"""
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((collection, operation))
+        except queue.Full:
+            self._count('dropped')
+            logger.warning(" Conversation write queue full, dropping write")
+            return False
+        self._count('queued')
+        return True
+
+    def insert(self, collection, document: Dict[str, Any]) -> bool:
+        if not PYMONGO_AVAILABLE or collection is None:
+            return False
+        return self.submit(collection, InsertOne(document))
+
+    def _take_batch(self, first) -> List[tuple]:
+        batch = [first]
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch: List[tuple]):
+        # Keep the queue order within each collection (session updates must apply in order)
+        grouped: 'OrderedDict[int, tuple]' = OrderedDict()
+        for collection, operation in batch:
+            grouped.setdefault(id(collection), (collection, []))[1].append(operation)
+        for collection, operations in grouped.values():
+            try:
+                collection.bulk_write(operations, ordered=True)
+                self._count('written', len(operations))
+                self._count('batches')
+            except Exception as e:
+                self._count('errors')
+                logger.warning(f" Conversation write-behind failed ({len(operations)} operations): {e}")
+
+    def _run(self):
+        while True:
+            try:
+                first = self._queue.get(timeout=self.interval)
+            except queue.Empty:
+                continue
+            self._write(self._take_batch(first))
+
+    def flush(self):
+        """Write everything queued so far on the calling thread (used at exit)"""
+        while True:
+            try:
+                first = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            self._write(self._take_batch(first))
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return dict(self._stats, pending=self._queue.qsize())
+
+
+class SQLiteSessionBackend:
+    """Session histories in a local SQLite file, shared by every worker on the node"""
+
+    name = 'sqlite'
+    # Writes are visible to every worker as soon as append() returns
+    write_behind = False
+
+    def __init__(self, path: str, idle_ttl: float = 3600):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        connection = self._connection()
+        connection.executescript("""
+            CREATE TABLE IF NOT EXISTS chat_turns (
+                session_key TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                entry TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS chat_turns_session ON chat_turns (session_key, created_at);
+        """)
+        # Sessions nobody has touched within the idle TTL are gone for every worker
+        connection.execute("DELETE FROM chat_turns WHERE created_at < ?", (time.time() - idle_ttl,))
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+        return connection
+
+    def load(self, session_key: str, limit: int) -> List[Dict[str, Any]]:
+        rows = self._connection().execute(
+            "SELECT entry FROM chat_turns WHERE session_key = ? ORDER BY created_at DESC LIMIT ?",
+            (session_key, limit)
+        ).fetchall()
+        return [json.loads(row[0]) for row in reversed(rows)]
+
+    def append(self, session_key: str, entry: Dict[str, Any], max_turns: int):
+        connection = self._connection()
+        connection.execute(
+            "INSERT INTO chat_turns (session_key, created_at, entry) VALUES (?, ?, ?)",
+            (session_key, time.time(), json.dumps(entry, ensure_ascii=False, default=str))
+        )
+        # Keep only the newest max_turns of the session, as the in-memory ring buffer does
+        connection.execute(
+            "DELETE FROM chat_turns WHERE session_key = ? AND rowid NOT IN "
+            "(SELECT rowid FROM chat_turns WHERE session_key = ? ORDER BY created_at DESC LIMIT ?)",
+            (session_key, session_key, max_turns)
+        )
+
+    def delete(self, session_key: str):
+        self._connection().execute("DELETE FROM chat_turns WHERE session_key = ?", (session_key,))
+
+
+class MongoSessionBackend:
+    """Session histories in a MongoDB collection (one document per session), written behind"""
+
+    name = 'mongo'
+    # Appends are queued on the WriteBehindWriter and show up a moment later
+    write_behind = True
+
+    def __init__(self, collection, writer: WriteBehindWriter):
+        self.collection = collection
+        self.writer = writer
+
+    def load(self, session_key: str, limit: int) -> List[Dict[str, Any]]:
+        document = self.collection.find_one({'_id': session_key}, {'turns': {'$slice': -limit}})
+        return list(document.get('turns', [])) if document else []
+
+    def append(self, session_key: str, entry: Dict[str, Any], max_turns: int):
+        self.writer.submit(self.collection, UpdateOne(
+            {'_id': session_key},
+            {'$push': {'turns': {'$each': [entry], '$slice': -max_turns}}, '$set': {'updated_at': time.time()}},
+            upsert=True
+        ))
+
+    def delete(self, session_key: str):
+        # Queued behind the session's own appends; deleting directly would let those recreate it
+        self.writer.submit(self.collection, DeleteOne({'_id': session_key}))
+
+
+class ConversationStore:
+    """Chat session histories keyed by session key.
+
+    Each session has its own lock, so concurrent requests only contend on the
+    same session. Sessions idle for longer than ``idle_ttl`` are dropped, and
+    the least recently used ones are evicted when there are more than
+    ``max_sessions`` or their histories exceed ``max_bytes``. Each history
+    keeps at most ``max_turns`` exchanges.
+
+    With a shared ``backend`` (SQLite for one node, MongoDB across nodes) the
+    local sessions act as a read-through cache: a session is reloaded from the
+    backend when it is first used on this worker or was last synced more than
+    ``refresh_seconds`` ago, so consecutive messages handled by different
+    workers keep their context. Appends go to both.
+    """
+
+    def __init__(self, max_sessions: int = 1000, idle_ttl: float = 3600, max_bytes: int = 50 * 1024 * 1024,
+                 max_turns: int = 20, backend=None, refresh_seconds: float = 2.0):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.max_bytes = max_bytes
+        self.max_turns = max_turns
+        self.backend = backend
+        self.refresh_seconds = refresh_seconds
+        self._backend_errors = 0
+        self._sessions: 'OrderedDict[str, ConversationSession]' = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._evictions = {'idle': 0, 'lru': 0, 'memory': 0}
+
+    def get(self, session_key: Optional[str]) -> ConversationSession:
+        """The session for a key, created on first use; without a key, a throwaway session"""
+        if not session_key:
+            return ConversationSession(None, self.max_turns)
+        with self._lock:
+            self._evict_idle()
+            conversation = self._sessions.get(session_key)
+            if conversation is None:
+                conversation = self._sessions[session_key] = ConversationSession(session_key, self.max_turns)
+                self._evict_over_capacity()
+            else:
+                self._sessions.move_to_end(session_key)
+            conversation.last_access = time.time()
+        if self.backend is not None and time.time() - conversation.synced_at > self.refresh_seconds:
+            self._refresh(conversation)
+        return conversation
+
+    def use_backend(self, backend):
+        """Switch to a shared backend (e.g. once MongoDB is connected); cached sessions resync on next use"""
+        self.backend = backend
+        with self._lock:
+            for conversation in self._sessions.values():
+                conversation.synced_at = 0.0
+        logger.info(f" Chat sessions use the {backend.name} backend")
+
+    def _refresh(self, conversation: ConversationSession):
+        try:
+            entries = self.backend.load(conversation.key, self.max_turns)
+        except Exception as e:
+            self._backend_errors += 1
+            logger.warning(f" Chat session backend read failed, using local history: {e}")
+            return
+        growth = conversation.merge(entries)
+        with self._lock:
+            if self._sessions.get(conversation.key) is conversation:
+                self._bytes += growth
+
+    def peek(self, session_key: Optional[str]) -> Optional[ConversationSession]:
+        """The session if it exists, without creating it or refreshing its position"""
+        with self._lock:
+            return self._sessions.get(session_key) if session_key else None
+
+    def append(self, conversation: ConversationSession, entry: Dict[str, Any]):
+        # Only a write-behind backend can lag behind this worker's own appends
+        write_behind = self.backend is not None and getattr(self.backend, 'write_behind', False)
+        growth = conversation.append(entry, shared=write_behind and conversation.key is not None)
+        if conversation.key is None:
+            return
+        if self.backend is not None:
+            try:
+                self.backend.append(conversation.key, entry, self.max_turns)
+            except Exception as e:
+                self._backend_errors += 1
+                logger.warning(f" Chat session backend write failed: {e}")
+        with self._lock:
+            if self._sessions.get(conversation.key) is conversation:
+                self._bytes += growth
+                self._evict_over_capacity()
+
+    def discard(self, session_key: str) -> bool:
+        if self.backend is not None:
+            try:
+                self.backend.delete(session_key)
+            except Exception as e:
+                self._backend_errors += 1
+                logger.warning(f" Chat session backend delete failed: {e}")
+        with self._lock:
+            conversation = self._sessions.pop(session_key, None)
+            if conversation is not None:
+                self._bytes -= conversation.size
+            if self.backend is not None and getattr(self.backend, 'write_behind', False):
+                # Until the queued delete lands the backend still has the turns; don't load them back
+                cleared = self._sessions[session_key] = ConversationSession(session_key, self.max_turns)
+                cleared.synced_at = time.time()
+            return conversation is not None
+
+    def keys(self) -> List[str]:
+        with self._lock:
+            return list(self._sessions.keys())
+
+    def _drop(self, session_key: str, reason: str):
+        conversation = self._sessions.pop(session_key)
+        self._bytes -= conversation.size
+        self._evictions[reason] += 1
+
+    def _evict_idle(self):
+        cutoff = time.time() - self.idle_ttl
+        # Oldest access first, so stop at the first session still in use
+        while self._sessions:
+            session_key, conversation = next(iter(self._sessions.items()))
+            if conversation.last_access >= cutoff:
+                break
+            self._drop(session_key, 'idle')
+
+    def _evict_over_capacity(self):
+        while len(self._sessions) > self.max_sessions:
+            self._drop(next(iter(self._sessions)), 'lru')
+        while self._bytes > self.max_bytes and len(self._sessions) > 1:
+            self._drop(next(iter(self._sessions)), 'memory')
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'sessions': len(self._sessions),
+                'max_sessions': self.max_sessions,
+                'approx_bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'evictions': dict(self._evictions),
+                'backend': self.backend.name if self.backend is not None else 'memory',
+                'backend_errors': self._backend_errors
+            }
+
+
+def create_conversation_store() -> ConversationStore:
+    """Create the store from environment configuration.
+
+    CHATBOT_SESSION_BACKEND=sqlite shares sessions between the workers on one
+    node; 'mongo' is attached by the app once MongoDB is connected.
+    """
+    idle_ttl = float(os.getenv('CHATBOT_SESSION_IDLE_TTL', '3600'))
+    backend = None
+    if SESSION_BACKEND == 'sqlite':
+        path = os.getenv('CHATBOT_SESSION_SQLITE_PATH', os.path.join('instance', 'chat_sessions.db'))
+        try:
+            backend = SQLiteSessionBackend(path, idle_ttl)
+            logger.info(f" Chat sessions shared through {path}")
+        except (sqlite3.Error, OSError) as e:
+            logger.warning(f" Chat session database unavailable at {path}, keeping sessions per worker: {e}")
+    return ConversationStore(
+        max_sessions=int(os.getenv('CHATBOT_MAX_SESSIONS', '1000')),
+        idle_ttl=idle_ttl,
+        max_bytes=int(float(os.getenv('CHATBOT_SESSION_MEMORY_MB', '50')) * 1024 * 1024),
+        max_turns=int(os.getenv('CHATBOT_HISTORY_TURNS', '20')),
+        backend=backend,
+        refresh_seconds=float(os.getenv('CHATBOT_SESSION_REFRESH_SECONDS', '2'))
+    )
+
+
+def create_conversation_writer() -> WriteBehindWriter:
+    """Create the write-behind writer from environment configuration"""
+    return WriteBehindWriter(
+        batch_size=int(os.getenv('CONVERSATION_WRITE_BATCH', '50')),
+        interval=float(os.getenv('CONVERSATION_WRITE_INTERVAL', '1.0')),
+        max_queue=int(os.getenv('CONVERSATION_WRITE_QUEUE', '5000'))
+    )
+
+
+# Shared by every route that records chat exchanges in db.conversations
+conversation_writer = create_conversation_writer()
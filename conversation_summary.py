@@ -0,0 +1,182 @@
+import os
+import re
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from prompt_budget import estimate_tokens, trim_to_tokens, fit_recent
+
+logger = logging.getLogger(__name__)
+
+_SENTENCE_END = re.compile(r'(?<=[.!?।])\s+|\n+')
+_MARKDOWN = re.compile(r'[*#_`>]+|^\s*[-•]\s*', re.MULTILINE)
+_WORD = re.compile(r'\w+', re.UNICODE)
+
+# Sentences carrying advice are worth keeping over descriptive ones
+_ADVICE_WORDS = {'vet', 'veterinarian', 'give', 'isolate', 'monitor', 'treat', 'treatment', 'vaccine', 'vaccinate',
+                 'avoid', 'provide', 'contact', 'dose', 'antibiotic', 'urgent', 'emergency', 'diagnosis', 'likely'}
+
+
+def _words(text: str) -> List[str]:
+    return [word.lower() for word in _WORD.findall(text)]
+
+
+def _clip_words(text: str, max_words: int) -> str:
+    words = text.split()
+    return text if len(words) <= max_words else ' '.join(words[:max_words]) + '…'
+
+
+def summarize_turn(entry: Dict[str, Any], max_words: int = 40) -> str:
+    """One line for an exchange: the question and the answer's most relevant sentences"""
+    question = _clip_words(' '.join(_MARKDOWN.sub('', entry.get('user', '')).split()), 25)
+    answer = _MARKDOWN.sub('', entry.get('assistant', ''))
+    sentences = [' '.join(sentence.split()) for sentence in _SENTENCE_END.split(answer) if len(sentence.split()) >= 3]
+    if not sentences:
+        return f"- Farmer asked: {question}"
+
+    topic = set(_words(question))
+    scored = []
+    for position, sentence in enumerate(sentences):
+        words = set(_words(sentence))
+        score = 2 * len(words & topic) + len(words & _ADVICE_WORDS) - 0.1 * position
+        scored.append((score, position, sentence))
+    # The opening sentence usually states the assessment; add the best-scoring others in answer order
+    chosen = {0}
+    for _, position, _ in sorted(scored, reverse=True):
+        if len(chosen) >= 3:
+            break
+        chosen.add(position)
+    advice = _clip_words(' '.join(sentences[position] for position in sorted(chosen)), max_words)
+    return f"- Farmer asked: {question} | Advice: {advice}"
+
+
+class ConversationContext:
+    """Prompt context for a chat session: a rolling summary of older turns plus the last raw turns.
+
+    Turns older than the last ``raw_turns`` are folded into the session's
+    summary as they age out, so the summary also remembers turns the history
+    ring buffer has already dropped. Folding is extractive and local; with
+    ``mode='model'`` a low-priority model call rewrites the summary in the
+    background after the answer has been sent, and the next prompt uses it.
+    The summary is held under ``summary_tokens`` by dropping its oldest lines.
+    """
+
+    def __init__(self, raw_turns: int = 2, summary_tokens: int = 300, raw_answer_tokens: int = 400,
+                 mode: str = 'extractive'):
+        self.raw_turns = raw_turns
+        self.summary_tokens = summary_tokens
+        self.raw_answer_tokens = raw_answer_tokens
+        self.mode = mode
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='chat-summary') if mode == 'model' else None
+        self._lock = threading.Lock()
+        self._stats = {'prompts': 0, 'verbatim_tokens': 0, 'context_tokens': 0, 'folded_turns': 0,
+                       'model_summaries': 0, 'model_failures': 0}
+
+    def _count(self, stat: str, amount: int = 1):
+        with self._lock:
+            self._stats[stat] += amount
+
+    def _keep_tail(self, summary: str) -> str:
+        """Drop the oldest summary lines until the rest fits the budget"""
+        lines = summary.splitlines()
+        while len(lines) > 1 and estimate_tokens('\n'.join(lines)) > self.summary_tokens:
+            lines.pop(0)
+        return trim_to_tokens('\n'.join(lines), self.summary_tokens, marker='…')
+
+    def _fold(self, conversation, older: List[Dict[str, Any]]) -> str:
+        """Bring the session summary up to date with the turns that left the raw window"""
+        with conversation.lock:
+            covered = conversation.summary_covers
+            new_turns = [entry for entry in older if (entry.get('timestamp') or '') > covered]
+            if not new_turns:
+                return conversation.summary_text
+            lines = [conversation.summary_text] if conversation.summary_text else []
+            lines.extend(summarize_turn(entry) for entry in new_turns)
+            conversation.summary_text = self._keep_tail('\n'.join(lines))
+            conversation.summary_covers = new_turns[-1].get('timestamp') or covered
+            self._count('folded_turns', len(new_turns))
+            return conversation.summary_text
+
+    def render(self, conversation, budget: int, verbatim_turns: int = 6) -> Tuple[str, bool]:
+        """Context text for the prompt within `budget` tokens, and whether anything was left out"""
+        history = [entry for entry in conversation.recent() if 'user' in entry and 'assistant' in entry] \
+            if conversation is not None else []
+        if not history:
+            return "", False
+
+        raw = history[-self.raw_turns:] if self.raw_turns else []
+        older = history[:len(history) - len(raw)]
+        summary = self._fold(conversation, older) if older else ''
+
+        render_turn = lambda entry: (f"User: {entry['user']}\n"
+                                     f"Assistant: {trim_to_tokens(entry['assistant'], self.raw_answer_tokens, marker=' …')}")
+        summary_block = f"\nSummary of earlier conversation:\n{summary}\n" if summary else ""
+        recent = fit_recent(raw, max(0, budget - estimate_tokens(summary_block)), render_turn)
+        if not recent and summary_block and estimate_tokens(summary_block) > budget:
+            summary_block = ""
+
+        context = summary_block
+        if recent:
+            context += "\nPrevious conversation:\n" + "\n".join(render_turn(entry) for entry in recent)
+        if context:
+            context += "\n\nCurrent question:\n"
+
+        # What the old prompt would have carried: the last turns verbatim
+        verbatim = sum(estimate_tokens(f"User: {entry['user']}\nAssistant: {entry['assistant']}")
+                       for entry in history[-verbatim_turns:])
+        used = estimate_tokens(context)
+        self._count('prompts')
+        self._count('verbatim_tokens', verbatim)
+        self._count('context_tokens', used)
+        logger.info(f" Chat context ~{verbatim} -> ~{used} tokens "
+                    f"({len(older)} older turns summarized, {len(recent)} recent kept)")
+        return context, len(recent) < len(raw)
+
+    def schedule_refresh(self, conversation, summarize: Callable[[str], Optional[str]]):
+        """In model mode, rewrite the session summary with a deferred low-priority call"""
+        if self._executor is None or conversation is None or conversation.key is None:
+            return
+        with conversation.lock:
+            draft, covers = conversation.summary_text, conversation.summary_covers
+        if not draft or covers == conversation.model_summary_covers:
+            return
+        self._executor.submit(self._refresh, conversation, draft, covers, summarize)
+
+    def _refresh(self, conversation, draft: str, covers: str, summarize: Callable[[str], Optional[str]]):
+        max_words = max(40, int(self.summary_tokens * 0.7))
+        prompt = (f"Summarize this earlier part of a conversation between a farmer and a veterinary assistant "
+                  f"in at most {max_words} words. Keep the animals, symptoms, suspected diseases and advice "
+                  f"already given; drop greetings and repetition.\n\n{draft}")
+        try:
+            summary = summarize(prompt)
+        except Exception as e:
+            summary = None
+            logger.warning(f" Conversation summary call failed: {e}")
+        if not summary:
+            self._count('model_failures')
+            return
+        with conversation.lock:
+            # Only replace the draft it was made from; newer folds keep the extractive text
+            if conversation.summary_covers == covers:
+                conversation.summary_text = self._keep_tail(summary.strip())
+                conversation.model_summary_covers = covers
+                self._count('model_summaries')
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        stats['mode'] = self.mode
+        stats['avg_saving'] = (round(1 - stats['context_tokens'] / stats['verbatim_tokens'], 3)
+                               if stats['verbatim_tokens'] else 0.0)
+        return stats
+
+
+def create_conversation_context() -> ConversationContext:
+    """Create the context builder from environment configuration"""
+    return ConversationContext(
+        raw_turns=int(os.getenv('CHATBOT_CONTEXT_RAW_TURNS', '2')),
+        summary_tokens=int(os.getenv('CHATBOT_CONTEXT_SUMMARY_TOKENS', '300')),
+        raw_answer_tokens=int(os.getenv('CHATBOT_CONTEXT_RAW_ANSWER_TOKENS', '400')),
+        mode=os.getenv('CHATBOT_CONTEXT_SUMMARY_MODE', 'extractive').lower()
+    )
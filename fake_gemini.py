@@ -0,0 +1,290 @@
+"""
+Offline stand-in for google.generativeai, selected with GEMINI_BACKEND=fake.
+
+Implements the parts of the SDK this app uses - configure() and
+GenerativeModel(name).generate_content(contents, generation_config=...,
+request_options=..., stream=...) - with configurable latency, injected
+429/404/timeout failures and canned answers shaped like our prompts, so the
+rate limiter, retry, failover, fallback and caching layers can be load-tested
+without network access or real quota.
+"""
+import os
+import json
+import math
+import time
+import random
+import hashlib
+import threading
+from typing import Any, Dict, List, Optional
+
+from prompt_budget import estimate_tokens, IMAGE_TILE_TOKENS
+
+
+class FakeGeminiError(Exception):
+    """Base class; messages mirror the real API errors so error classification behaves the same"""
+
+
+class ResourceExhausted(FakeGeminiError):
+    pass
+
+
+class NotFound(FakeGeminiError):
+    pass
+
+
+class DeadlineExceeded(FakeGeminiError):
+    pass
+
+
+def _parse_latency(spec: str):
+    """'fixed:S', 'uniform:A,B' or 'lognormal:MEDIAN,SIGMA' (seconds) -> sampler"""
+    kind, _, args = spec.partition(':')
+    values = [float(value) for value in args.split(',') if value.strip()]
+    kind = kind.strip().lower()
+    if kind == 'fixed':
+        return lambda: values[0]
+    if kind == 'uniform':
+        return lambda: random.uniform(values[0], values[1])
+    if kind == 'lognormal':
+        median, sigma = values[0], values[1] if len(values) > 1 else 0.5
+        return lambda: random.lognormvariate(math.log(median), sigma)
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+class FakeBackendConfig:
+    def __init__(self):
+        self.latency = _parse_latency(os.getenv('GEMINI_FAKE_LATENCY', 'lognormal:1.2,0.5'))
+        self.rate_limit_rate = float(os.getenv('GEMINI_FAKE_429_RATE', '0.05'))
+        self.quota_exhausted_rate = float(os.getenv('GEMINI_FAKE_QUOTA_RATE', '0'))
+        self.not_found_rate = float(os.getenv('GEMINI_FAKE_404_RATE', '0'))
+        self.timeout_rate = float(os.getenv('GEMINI_FAKE_TIMEOUT_RATE', '0.02'))
+        self.timeout_seconds = float(os.getenv('GEMINI_FAKE_TIMEOUT_SECONDS', '30'))
+        self.malformed_rate = float(os.getenv('GEMINI_FAKE_MALFORMED_RATE', '0.05'))
+        self.missing_models = {name.strip() for name in os.getenv('GEMINI_FAKE_MISSING_MODELS', '').split(',') if name.strip()}
+        self.stream_chunk_chars = int(os.getenv('GEMINI_FAKE_STREAM_CHUNK_CHARS', '40'))
+        self.stream_chunk_delay = float(os.getenv('GEMINI_FAKE_STREAM_CHUNK_DELAY', '0.05'))
+        seed = os.getenv('GEMINI_FAKE_SEED')
+        if seed:
+            random.seed(int(seed))
+
+
+config = FakeBackendConfig()
+
+_stats_lock = threading.Lock()
+_stats: Dict[str, Any] = {'calls': 0, 'streams': 0, 'outcomes': {}, 'models': {}, 'keys': {}}
+_configured_key: Optional[str] = None
+
+
+def configure(api_key: Optional[str] = None, **kwargs):
+    global _configured_key
+    _configured_key = api_key
+
+
+class _KeyClient:
+    def __init__(self, api_key: Optional[str]):
+        self.api_key = api_key
+
+
+class _ClientManager:
+    """Per-key client manager, as google.generativeai.client._ClientManager"""
+
+    def __init__(self):
+        self.api_key = None
+
+    def configure(self, api_key: Optional[str] = None, **kwargs):
+        self.api_key = api_key
+
+    def get_default_client(self, name: str) -> _KeyClient:
+        return _KeyClient(self.api_key)
+
+
+class client:
+    _ClientManager = _ClientManager
+
+
+def get_stats() -> Dict[str, Any]:
+    with _stats_lock:
+        return json.loads(json.dumps(_stats))
+
+
+def reset_stats():
+    with _stats_lock:
+        _stats.update({'calls': 0, 'streams': 0, 'outcomes': {}, 'models': {}, 'keys': {}})
+
+
+def _record(model_name: str, outcome: str, stream: bool, api_key: Optional[str] = None):
+    key = hashlib.sha256((api_key or _configured_key or '').encode('utf-8')).hexdigest()[:12]
+    with _stats_lock:
+        _stats['calls'] += 1
+        _stats['streams'] += int(stream)
+        _stats['outcomes'][outcome] = _stats['outcomes'].get(outcome, 0) + 1
+        _stats['models'][model_name] = _stats['models'].get(model_name, 0) + 1
+        _stats['keys'][key] = _stats['keys'].get(key, 0) + 1
+
+
+# Canned answers shaped like the app's JSON prompts
+_IMAGE_FINDINGS = {
+    "visible_abnormalities": ["Mild nasal discharge", "Slightly dull coat"],
+    "body_condition": "Fair body condition, mildly underweight",
+    "skin_coat_condition": "Coat dull with no visible lesions",
+    "eye_nose_condition": "Clear eyes, serous nasal discharge",
+    "posture_behavior": "Standing, alert but slightly lethargic",
+    "symptom_correlation": "Nasal discharge and lethargy are consistent with the reported respiratory signs",
+    "visual_severity": "mild",
+    "confidence": 0.72,
+    "additional_observations": "No visible wounds or swelling"
+}
+
+_DIAGNOSIS = {
+    "primary_diagnosis": "Upper Respiratory Infection",
+    "confidence_score": 0.78,
+    "diagnostic_reasoning": "Fever, nasal discharge and reduced appetite together point to an upper respiratory infection.",
+    "image_symptom_correlation": "Visible nasal discharge supports the reported respiratory symptoms",
+    "alternative_diagnoses": [
+        {"disease": "Pneumonia", "confidence": 0.35, "reasoning": "Possible if breathing becomes laboured"}
+    ],
+    "severity_assessment": "moderate - systemic signs without respiratory distress",
+    "treatment_recommendations": {
+        "immediate_actions": ["Isolate the animal", "Provide clean water and shade", "Monitor temperature twice daily"],
+        "ongoing_treatment": ["Supportive care", "Antibiotics only if prescribed by a veterinarian"],
+        "monitoring": "Temperature, breathing rate and appetite every 12 hours",
+        "veterinary_urgency": "within 24 hours"
+    },
+    "prognosis": "Good with early supportive care",
+    "risk_factors": ["Crowded housing", "Recent transport"],
+    "prevention_advice": "Improve ventilation and keep vaccinations up to date"
+}
+
+_CHAT_ANSWER = """Based on what you describe, here is practical guidance:
+
+**Likely causes:** common infections or dietary upsets are the usual reasons for these signs.
+
+**What to do now:**
+- Keep the animal in a clean, quiet, shaded place with fresh water
+- Check temperature, appetite and droppings twice a day
+- Separate it from the rest of the herd if it may be contagious
+
+**See a veterinarian** if there is high fever, laboured breathing, blood in droppings or no improvement within 24-48 hours.
+
+**Prevention:** regular deworming, vaccination and clean housing reduce the risk."""
+
+
+def _value_from_schema(schema: Dict[str, Any]) -> Any:
+    """Minimal valid value for a Gemini-style response schema"""
+    schema_type = str(schema.get('type', '')).upper()
+    if schema_type == 'OBJECT':
+        return {key: _value_from_schema(sub) for key, sub in schema.get('properties', {}).items()}
+    if schema_type == 'ARRAY':
+        return [_value_from_schema(schema['items'])] if schema.get('items') else []
+    if schema_type in ('NUMBER', 'INTEGER'):
+        return 0.7 if schema_type == 'NUMBER' else 1
+    if schema_type == 'BOOLEAN':
+        return False
+    return "Not assessed"
+
+
+def _canned_answer(prompt: str, schema: Optional[Dict[str, Any]]) -> str:
+    if '"image_findings"' in prompt:
+        answer = json.dumps(dict(_DIAGNOSIS, image_findings=_IMAGE_FINDINGS), indent=2)
+    elif '"primary_diagnosis"' in prompt:
+        answer = json.dumps(_DIAGNOSIS, indent=2)
+    elif '"visible_abnormalities"' in prompt:
+        answer = json.dumps(_IMAGE_FINDINGS, indent=2)
+    elif schema is not None:
+        answer = json.dumps(_value_from_schema(schema), indent=2)
+    elif prompt.lstrip().lower().startswith('summarize'):
+        return ("Keep the animal isolated with water and shade, monitor its temperature and appetite, "
+                "and call a veterinarian if it does not improve within a day.")
+    else:
+        return _CHAT_ANSWER
+
+    if schema is None and random.random() < config.malformed_rate:
+        # Prompt-only JSON sometimes comes back fenced or cut off, like the real model's
+        if random.random() < 0.5:
+            return f"Here is the analysis:\n```json\n{answer}\n```"
+        return answer[:int(len(answer) * 0.8)]
+    return answer
+
+
+class _UsageMetadata:
+    def __init__(self, prompt_token_count: int, candidates_token_count: int):
+        self.prompt_token_count = prompt_token_count
+        self.candidates_token_count = candidates_token_count
+        self.total_token_count = prompt_token_count + candidates_token_count
+
+
+class FakeResponse:
+    def __init__(self, text: str, prompt_tokens: int):
+        self.text = text
+        self.usage_metadata = _UsageMetadata(prompt_tokens, estimate_tokens(text))
+
+
+class FakeStreamResponse:
+    """Iterable of chunks with .text; usage_metadata is complete once iteration ends"""
+
+    def __init__(self, text: str, prompt_tokens: int):
+        self._text = text
+        self.usage_metadata = _UsageMetadata(prompt_tokens, 0)
+
+    def __iter__(self):
+        size = max(1, config.stream_chunk_chars)
+        for start in range(0, len(self._text), size):
+            time.sleep(config.stream_chunk_delay)
+            chunk = self._text[start:start + size]
+            self.usage_metadata.candidates_token_count += estimate_tokens(chunk)
+            yield FakeResponse(chunk, 0)
+
+    @property
+    def text(self):
+        return self._text
+
+
+def _prompt_parts(contents) -> List[Any]:
+    return contents if isinstance(contents, (list, tuple)) else [contents]
+
+
+class GenerativeModel:
+    def __init__(self, model_name: str = 'gemini-2.5-flash', **kwargs):
+        self.model_name = model_name if model_name.startswith('models/') else f"models/{model_name}"
+        self._short_name = self.model_name.split('/', 1)[1]
+        self._client: Optional[_KeyClient] = None
+
+    def _record(self, outcome: str, stream: bool):
+        _record(self._short_name, outcome, stream, self._client.api_key if self._client else None)
+
+    def generate_content(self, contents, generation_config=None, request_options=None, stream=False, **kwargs):
+        parts = _prompt_parts(contents)
+        prompt = '\n'.join(part for part in parts if isinstance(part, str))
+        image_count = sum(1 for part in parts if not isinstance(part, str))
+        prompt_tokens = estimate_tokens(prompt) + image_count * IMAGE_TILE_TOKENS
+        timeout = (request_options or {}).get('timeout') or config.timeout_seconds
+
+        if self._short_name in config.missing_models or random.random() < config.not_found_rate:
+            time.sleep(min(0.1, timeout))
+            self._record('not_found', stream)
+            raise NotFound(f"404 models/{self._short_name} is not found for API version v1beta, "
+                           f"or is not supported for generateContent.")
+
+        roll = random.random()
+        if roll < config.quota_exhausted_rate:
+            time.sleep(min(0.1, timeout))
+            self._record('quota_exhausted', stream)
+            raise ResourceExhausted("429 Resource has been exhausted (e.g. check quota).")
+        if roll < config.quota_exhausted_rate + config.rate_limit_rate:
+            time.sleep(min(0.1, timeout))
+            self._record('rate_limited', stream)
+            raise ResourceExhausted("429 Too Many Requests")
+
+        latency = max(0.0, config.latency())
+        if random.random() < config.timeout_rate or latency > timeout:
+            time.sleep(timeout)
+            self._record('timeout', stream)
+            raise DeadlineExceeded("504 Deadline Exceeded")
+
+        time.sleep(latency)
+        schema = (generation_config or {}).get('response_schema') if isinstance(generation_config, dict) else None
+        answer = _canned_answer(prompt, schema)
+        self._record('ok', stream)
+        if stream:
+            return FakeStreamResponse(answer, prompt_tokens)
+        return FakeResponse(answer, prompt_tokens)
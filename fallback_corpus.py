@@ -0,0 +1,350 @@
+"""
+Fallback answers served when Gemini is unavailable (quota exhausted, offline, shed).
+
+The English templates live here. build_fallback_corpus.py renders every
+template into every supported language once, into a compact JSON file that
+is loaded at startup, so fallback answers reach the user in their own
+language with no translation call on the request path. Templates with no
+translation (no corpus yet, or English text changed since it was built)
+are tagged as English, so the chatbot translates them as it does Gemini
+answers.
+"""
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+ENHANCED_FALLBACKS = {
+    'cow_fever': """🐄 **Cow Fever Management**
+**Normal Temperature**: 101.5-103.5°F (38.6-39.7°C)
+**Action Steps**:
+• Provide shade and cool, fresh water
+• Check for respiratory distress
+• Monitor appetite and milk production
+• Contact vet if fever >104°F or persists >24h
+• Consider electrolyte solutions""",
+    'cow_mastitis': """🥛 **Mastitis in Cows**
+**Signs**: Hot, swollen udder quarters, abnormal milk
+**Immediate Care**:
+• Frequent milking every 2-3 hours
+• Apply warm compresses before milking
+• Strip affected quarters completely
+• **Veterinary consultation required for antibiotics**
+• Monitor for systemic illness""",
+    'cow_lameness': """🦶 **Cow Lameness Assessment**
+**Common Causes**: Hoof problems, stones, injuries
+**Action Steps**:
+• Examine hooves for cuts/stones
+• Clean and trim if experienced
+• Provide soft, dry bedding
+• Limit movement
+• **Vet needed if no improvement in 24-48h**""",
+    'dog_fever': """🐕 **Dog Fever Care**
+**Normal Temperature**: 101-102.5°F (38.3-39.2°C)
+**Action Steps**:
+• Ensure adequate water intake
+• Cool environment, avoid overheating
+• Monitor for lethargy, loss of appetite
+• **Emergency if fever >104°F**
+• Consider wet towels on paws and belly""",
+    'dog_diarrhea': """💧 **Dog Diarrhea Treatment**
+**Immediate Care**:
+• Withhold food for 12-24 hours (not water)
+• Bland diet: boiled rice with chicken
+• Small, frequent water offerings
+• **Vet needed if**: Blood, severe dehydration, persists >2 days
+• Watch for signs of bloat""",
+    'cat_fever': """🐱 **Cat Fever Management**
+**Normal Temperature**: 100.5-102.5°F (38.1-39.2°C)
+**Action Steps**:
+• Quiet, cool environment
+• Encourage water intake
+• Monitor breathing and appetite
+• **Emergency if fever >104°F or lethargic**
+• Wet food may help hydration""",
+    'cat_vomiting': """🤢 **Cat Vomiting Care**
+**Immediate Steps**:
+• Withhold food for 12 hours (not water)
+• Small amounts of water frequently
+• **Emergency signs**: Blood, continuous retching, dehydration
+• Return to bland diet gradually
+• **Vet needed if persists >24h**""",
+    'sheep_fever': """🐑 **Sheep Fever Care**
+**Normal Temperature**: 102-104°F (38.9-40°C)
+**Action Steps**:
+• Provide shade and ventilation
+• Fresh water access
+• Check for respiratory issues
+• **Emergency if >105°F or difficulty breathing**
+• Isolate from flock if contagious suspected""",
+    'sheep_foot': """🦶 **Sheep Foot Problems**
+**Common Issues**: Foot rot, stones, injuries
+**Care Steps**:
+• Examine hooves for lesions/smell
+• Trim overgrown hooves if experienced
+• Clean, dry environment essential
+• **Foot rot requires antibiotic treatment**
+• Zinc supplements may help prevention""",
+    'emergency': """🚨 **EMERGENCY SIGNS - Contact Veterinarian IMMEDIATELY**
+• **Breathing difficulties** - Open mouth breathing, gasping
+• **Severe bleeding** - Continuous, won't stop with pressure
+• **Cannot stand or walk** - Paralysis, extreme weakness
+• **High fever** - >104°F (40°C) for most animals
+• **Seizures or convulsions**
+• **Severe pain** - Crying, restlessness, rigid posture
+• **Bloated abdomen** - Especially in ruminants
+• **Eye injuries** - Any trauma to eyes""",
+    'general_fever': """🌡️ **General Fever Management**
+**Recognition**: Lethargy, warm nose/ears, shivering
+**Immediate Care**:
+• Cool, quiet environment with good ventilation
+• Fresh water access - encourage drinking
+• Light, easily digestible food
+• Monitor temperature if possible
+• **Call vet if fever >104°F or lasts >24h**""",
+    'general_diarrhea': """💧 **Diarrhea Management**
+**Immediate Steps**:
+• Ensure hydration - offer water/electrolytes frequently
+• Withhold food 12-24h (keep water available)
+• Gradual return to bland diet
+• **Warning signs**: Blood, severe dehydration, fever
+• **Vet needed**: Persists >2 days, animal becomes weak""",
+    'quota_default': """🩺 **PashuArogyam - Animal Health Guidance** (2025-11-19 {clock})
+    
+I've reached my daily quota limit. This is normal for free tier usage. Please try again tomorrow, or you can:
+
+• **Use our disease detection features**
+• **Consult with our veterinarians** 
+• **Browse our health resources**
+
+Here's some general guidance:
+
+**🩺 Animal Health Guidance ({timestamp})**
+I'm currently unable to provide AI-powered responses, but here's some general guidance:
+
+**Emergency Signs - Contact Veterinarian Immediately:**
+• Difficulty breathing, severe bleeding, unable to stand
+• High fever (>104°F/40°C), seizures, severe pain
+
+**General Care Tips:**
+• Monitor appetite, behavior, and vital signs daily
+• Ensure clean water and appropriate nutrition  
+• Maintain clean, dry living conditions
+• Isolate sick animals to prevent spread
+
+**Common Treatments:**
+• **Fever**: Cool water, shade, electrolytes
+• **Minor cuts**: Clean, disinfect, monitor healing
+• **Digestive issues**: Withhold food briefly, provide water
+
+Always consult a qualified veterinarian for proper diagnosis and treatment.""",
+}
+
+# Matched in order against the user's message; up to three are combined
+KEYWORD_FALLBACKS = {
+    'fever': '🌡️ **Fever Management**: Monitor temperature (normal: 101-103F). Provide shade, cool water, electrolytes. Contact vet if >104F or lethargic.',
+    'diarrhea': '💧 **Diarrhea Treatment**: Ensure hydration, withhold food 12-24 hours, provide electrolytes, probiotics. Vet needed if bloody or persistent >2 days.',
+    'cough': '😷 **Cough Care**: Check for respiratory distress, isolate animal, ensure good ventilation, avoid dust. Vet consultation for persistent coughing.',
+    'lameness': '🦵 **Lameness Assessment**: Rest the animal, check for swelling/cuts, limit movement, cold compress for swelling. Vet exam within 24-48 hours.',
+    'mastitis': '🥛 **Mastitis Treatment**: Frequent milking, warm compresses, check for hard udder quarters. Antibiotic treatment often needed - contact vet.',
+    'vaccination': '💉 **Vaccination Schedule**: Follow local vet recommendations, maintain cold chain, record dates. Core vaccines: FMD, BVD, IBR for cattle.',
+    'bloat': '🫃 **Bloat Emergency**: Remove from feed immediately, keep animal moving, massage left flank, contact vet URGENTLY - can be fatal.',
+    'wound': '🩹 **Wound Care**: Clean with saline, apply antiseptic, bandage if needed, monitor for infection signs. Deep wounds need vet attention.',
+    'parasite': '🐛 **Parasite Control**: Regular deworming schedule, fecal testing, pasture rotation, check for anemia. Consult vet for resistance issues.',
+    'nutrition': '🌾 **Nutrition Guidelines**: Balanced feed, clean water, age-appropriate diet, avoid sudden changes. Consult nutritionist for optimal feeding.',
+    'breeding': '🐄 **Breeding Management**: Monitor heat cycles, proper timing, nutrition during pregnancy, vaccination before breeding. Vet for AI/pregnancy checks.'
+}
+
+KEYWORD_FOOTER = '**Always consult a qualified veterinarian for proper diagnosis and treatment.**'
+
+# Heads answers built from knowledge_index passages
+KNOWLEDGE_HEADER = '📚 **From the PashuArogyam knowledge base**'
+
+GENERAL_GUIDANCE = """🩺 **Animal Health Guidance** ({timestamp})
+
+**Emergency Signs - Contact Veterinarian Immediately:**
+- Difficulty breathing, severe bleeding, unable to stand
+- High fever (>104F/40C), seizures, severe pain
+
+**General Care Tips:**
+- Monitor appetite, behavior, and vital signs daily
+- Ensure clean water and appropriate nutrition
+- Maintain clean, dry living conditions
+- Isolate sick animals to prevent spread
+
+**Common Treatments:**
+- **Fever**: Cool water, shade, electrolytes
+- **Minor cuts**: Clean, disinfect, monitor healing
+- **Digestive issues**: Withhold food briefly, provide water
+
+**Always consult a qualified veterinarian for proper diagnosis and treatment.**"""
+
+NOTICES = {
+    'quota_unavailable': ("I'm currently unable to process requests due to daily quota limits. "
+                          "Please try again tomorrow or contact our veterinarians for immediate assistance."),
+    'quota_daily': ("I've reached my daily quota limit. This is normal for free tier usage. "
+                    "Please try again tomorrow, or you can:\n"
+                    "• Use our disease detection features\n"
+                    "• Consult with our veterinarians\n"
+                    "• Browse our health resources"),
+    'general_guidance_intro': "Here's some general guidance:",
+    'high_demand': "I'm currently experiencing high demand. Here's some general guidance while you wait:",
+    'daily_usage_limit': "I've reached my daily usage limit, but here's some helpful guidance:",
+    'token_budget': ("You have reached today's AI usage limit. Here is some general guidance; "
+                     "full answers will be available again tomorrow."),
+    'rate_limited_guidance': """I'm experiencing high demand right now. Here's some helpful guidance while you wait:
+
+**For immediate animal health concerns:**
+- Monitor vital signs (temperature, breathing, appetite)
+- Ensure animal has access to clean water
+- Contact local veterinarian for urgent issues
+
+**Common Care Tips:**
+- Keep sick animals isolated
+- Maintain clean living conditions  
+- Document symptoms and duration
+
+Please try asking your question again in a few minutes. Thank you for your patience!"""
+}
+
+# Canned answers for the intents the offline router handles without Gemini (see intent_router)
+INTENT_ANSWERS = {
+    'greeting': ("🙏 Namaste! I'm the PashuArogyam veterinary assistant. Tell me which animal you are worried about "
+                 "and what symptoms you see (for example fever, not eating, swelling, diarrhea), and I'll help."),
+    'thanks': ("You're welcome! 🐄 Keep watching the animal's appetite, temperature and behaviour, and ask me again "
+               "any time. Contact a veterinarian if the condition gets worse."),
+    'goodbye': "Goodbye, and take care of your animals! 🙏 I'm here whenever you need animal health advice.",
+    'about_platform': """🩺 **About PashuArogyam**
+PashuArogyam helps farmers and pet owners look after animal health:
+• **AI disease detection** for cows, dogs, cats and sheep from a photo and symptoms
+• **Veterinary chatbot** for questions about symptoms, treatment and prevention
+• **Consultations** with registered veterinarians
+Answers are available in English and 12 Indian and foreign languages.""",
+    'capabilities': """🤖 **What I can help with**
+• Explain symptoms and their likely causes
+• First-aid and home care steps while you wait for a vet
+• Vaccination, deworming, feeding and breeding guidance
+• Analyse a photo of your animal or a veterinary report (use the upload button)
+For an examination or prescription, please consult a veterinarian.""",
+    'disease_detection_help': """📷 **How to check your animal for disease**
+1. Open **Disease Detection** from the menu and choose the animal (cow, dog, cat or sheep)
+2. Upload a clear, well-lit photo of the affected area or the whole animal
+3. Select the symptoms you have noticed and how long they have lasted
+4. Submit to get the likely disease, severity and recommended care
+You can also upload a photo here in the chat and ask a question about it.""",
+    'consult_vet': """👩‍⚕️ **Talk to a veterinarian**
+• Open **Consultation Request** from the menu, describe the animal and its symptoms, and submit
+• A registered veterinarian will review it and reply in **My Consultations**
+• For emergencies (breathing difficulty, heavy bleeding, animal cannot stand), call your nearest veterinary hospital immediately."""
+}
+
+# Placeholders filled in at render time; the corpus build keeps a translation only if they survive
+PLACEHOLDERS = ('{timestamp}', '{clock}')
+
+
+def english_templates() -> Dict[str, str]:
+    """Every fallback template by id"""
+    templates = {f"enhanced.{key}": text for key, text in ENHANCED_FALLBACKS.items()}
+    templates.update({f"keyword.{key}": text for key, text in KEYWORD_FALLBACKS.items()})
+    templates.update({f"notice.{key}": text for key, text in NOTICES.items()})
+    templates.update({f"intent.{key}": text for key, text in INTENT_ANSWERS.items()})
+    templates['keyword_footer'] = KEYWORD_FOOTER
+    templates['knowledge_header'] = KNOWLEDGE_HEADER
+    templates['general_guidance'] = GENERAL_GUIDANCE
+    return templates
+
+
+def source_hash(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:12]
+
+
+class LocalizedText(str):
+    """Fallback text tagged with the language it is actually in; callers translate it only when that is not the user's"""
+
+    def __new__(cls, text: str, language: str):
+        value = super().__new__(cls, text)
+        value.language = language
+        return value
+
+
+def combine(parts, language: str, separator: str = '\n\n') -> LocalizedText:
+    """Join fallback pieces; tagged with `language` only when every piece is in it, otherwise as English"""
+    served = language if all(getattr(part, 'language', None) == language for part in parts) else 'en'
+    return LocalizedText(separator.join(parts), served)
+
+
+class FallbackCorpus:
+    """Pre-translated fallback templates, looked up by (template id, language)"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.templates = english_templates()
+        self.translations: Dict[str, Dict[str, str]] = {}
+        self.stale = 0
+        self._lock = threading.Lock()
+        self._served: Dict[str, int] = {}
+        self._english_fallbacks = 0
+        self.load(path)
+
+    def load(self, path: Optional[str]):
+        if not path or not os.path.exists(path):
+            logger.warning(" No fallback corpus found (run build_fallback_corpus.py); "
+                           "fallback answers will be translated on request")
+            return
+        try:
+            with open(path, 'r', encoding='utf-8') as corpus_file:
+                data = json.load(corpus_file)
+        except (OSError, ValueError) as e:
+            logger.warning(f" Could not load fallback corpus {path}: {e}")
+            return
+        current = {template_id: source_hash(text) for template_id, text in self.templates.items()}
+        sources = data.get('sources', {})
+        fresh = {template_id for template_id, digest in sources.items() if current.get(template_id) == digest}
+        self.stale = len(set(sources) - fresh)
+        self.translations = {
+            language: {template_id: text for template_id, text in entries.items() if template_id in fresh}
+            for language, entries in data.get('languages', {}).items()
+        }
+        logger.info(f" Fallback corpus loaded: {len(self.translations)} languages, "
+                    f"{len(fresh)} templates ({self.stale} stale)")
+
+    def text(self, template_id: str, language: str = 'en') -> LocalizedText:
+        """Template text in the language, or English (tagged 'en') when it has no translation"""
+        translated = self.translations.get(language, {}).get(template_id) if language != 'en' else None
+        with self._lock:
+            self._served[language] = self._served.get(language, 0) + 1
+            if translated is None and language != 'en':
+                self._english_fallbacks += 1
+        if translated is None:
+            return LocalizedText(self.templates[template_id], 'en')
+        return LocalizedText(translated, language)
+
+    def render(self, template_id: str, language: str = 'en') -> LocalizedText:
+        text = self.text(template_id, language)
+        rendered = text.replace('{timestamp}', time.strftime('%Y-%m-%d %H:%M:%S')).replace('{clock}', time.strftime('%H:%M:%S'))
+        return LocalizedText(rendered, text.language)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'languages': sorted(self.translations),
+                'templates': len(self.templates),
+                'stale_templates': self.stale,
+                'served': dict(self._served),
+                'english_fallbacks': self._english_fallbacks
+            }
+
+
+def create_fallback_corpus() -> FallbackCorpus:
+    """Load the corpus from environment configuration"""
+    default_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fallback_corpus.json')
+    return FallbackCorpus(os.getenv('FALLBACK_CORPUS_PATH', default_path))
+
+
+# Loaded once at startup, shared by app.py and the chatbot
+fallback_corpus = create_fallback_corpus()
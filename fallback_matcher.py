@@ -0,0 +1,210 @@
+"""
+Keyword matching for the fallback answer engines.
+
+The trigger words and the rules that turn them into fallback templates are
+data in fallback_rules.json. At startup every trigger term is compiled into
+one trie over normalized tokens, so a message is matched against all terms
+in a single pass no matter how many rules there are. Terms match whole
+words; a term ending in ``*`` also matches words that start with it
+("vomit*" matches "vomiting"), and plain terms accept a plural "s" or "es".
+Terms can be English, transliterated Hindi/Marathi or Devanagari.
+"""
+import os
+import re
+import json
+import logging
+import threading
+import unicodedata
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Word characters: letters and digits, plus the Indic blocks whose vowel signs and viramas are marks
+_WORD_CHARS = r'0-9a-z\u00c0-\u024f\u0900-\u0dff'
+_NON_WORD = re.compile(f'[^{_WORD_CHARS}]+')
+
+
+def normalize(text: str) -> str:
+    """Lowercase, NFKC-fold and reduce everything but words to single spaces"""
+    text = (text or '').lower()
+    if not text.isascii():
+        text = unicodedata.normalize('NFKC', text)
+    return _NON_WORD.sub(' ', text).strip()
+
+
+class _Node:
+    __slots__ = ('children', 'outputs', 'prefixes', 'head')
+
+    def __init__(self):
+        self.children: Dict[str, '_Node'] = {}
+        self.outputs: List[Any] = []
+        # Prefix stems bucketed by their first `head` characters, so a token costs one lookup
+        self.prefixes: Dict[str, List[Tuple[str, Any]]] = {}
+        self.head = 0
+
+
+class KeywordTrie:
+    """A trie over normalized tokens, reporting whole-word and word-prefix matches.
+
+    Terms of several words ("loose stool*", "throw up") are paths of tokens;
+    a trailing ``*`` makes the last token a prefix. Scanning a message walks
+    the trie from every token, one dictionary lookup per token in the common
+    case, so the cost follows the length of the message, not the number of
+    terms.
+    """
+
+    def __init__(self):
+        self._root = _Node()
+        self._states = 1
+
+    def add(self, term: str, payload: Any):
+        prefix = term.endswith('*')
+        tokens = normalize(term.rstrip('*')).split()
+        if not tokens:
+            return
+        node = self._root
+        for token in tokens[:-1] if prefix else tokens:
+            child = node.children.get(token)
+            if child is None:
+                child = node.children[token] = _Node()
+                self._states += 1
+            node = child
+        if prefix:
+            stems = [(stem, stem_payload) for bucket in node.prefixes.values() for stem, stem_payload in bucket]
+            stems.append((tokens[-1], payload))
+            node.head = min(len(stem) for stem, _ in stems)
+            node.prefixes = {}
+            for stem, stem_payload in stems:
+                node.prefixes.setdefault(stem[:node.head], []).append((stem, stem_payload))
+        else:
+            node.outputs.append(payload)
+
+    @property
+    def states(self) -> int:
+        return self._states
+
+    @staticmethod
+    def _child(node: _Node, token: str) -> Optional[_Node]:
+        child = node.children.get(token)
+        # Allow plurals: "cows", "fevers", "buses"
+        if child is None and token[-1:] == 's':
+            child = node.children.get(token[:-1])
+            if child is None and token[-2:] == 'es':
+                child = node.children.get(token[:-2])
+        return child
+
+    def scan(self, text: str, normalized: bool = False) -> List[Tuple[Any, int, int]]:
+        """(payload, first token, token after the last) for every match in the text, in one left-to-right pass"""
+        tokens = (text if normalized else normalize(text)).split()
+        root, matches = self._root, []
+        for start, token in enumerate(tokens):
+            node, position = root, start
+            while True:
+                if node.prefixes:
+                    for stem, payload in node.prefixes.get(token[:node.head], ()):
+                        if token.startswith(stem):
+                            matches.append((payload, start, position + 1))
+                node = self._child(node, token)
+                if node is None:
+                    break
+                matches.extend((payload, start, position + 1) for payload in node.outputs)
+                position += 1
+                if position == len(tokens) or not (node.children or node.prefixes):
+                    break
+                token = tokens[position]
+        return matches
+
+
+class FallbackMatcher:
+    """Concept matching and rule ranking for the fallback engines, loaded from a rules table"""
+
+    def __init__(self, table: Dict[str, Any]):
+        self.concepts = table.get('concepts', {})
+        self.rules = [(rule['template'], frozenset(rule['all'])) for rule in table.get('enhanced_rules', [])]
+        self.default_template = table.get('enhanced_default', 'enhanced.quota_default')
+        self.keyword_topics = {topic: tuple(concepts) for topic, concepts in table.get('keyword_topics', {}).items()}
+        self.trie = KeywordTrie()
+        for concept, terms in self.concepts.items():
+            for term in terms:
+                self.trie.add(term, concept)
+        self._lock = threading.Lock()
+        self._stats = {'matches': 0, 'defaulted': 0}
+        self._templates: Dict[str, int] = {}
+
+    @classmethod
+    def load(cls, path: str) -> 'FallbackMatcher':
+        try:
+            with open(path, 'r', encoding='utf-8') as rules_file:
+                table = json.load(rules_file)
+        except (OSError, ValueError) as e:
+            logger.warning(f" Could not load fallback rules {path}: {e}; every fallback will use the default answer")
+            table = {}
+        matcher = cls(table)
+        logger.info(f" Fallback matcher compiled: {len(matcher.concepts)} concepts, {len(matcher.rules)} rules, "
+                    f"{matcher.trie.states} trie states")
+        return matcher
+
+    def match(self, text: str) -> Dict[str, Tuple[int, int]]:
+        """Matched concepts with their (hit count, first offset), in one pass over the text"""
+        found: Dict[str, Tuple[int, int]] = {}
+        for concept, start, _ in self.trie.scan(text):
+            hits, first = found.get(concept, (0, start))
+            found[concept] = (hits + 1, min(first, start))
+        return found
+
+    def rank(self, text: str) -> List[str]:
+        """Templates of every satisfied rule, most specific first, then in table order"""
+        found = self.match(text).keys()
+        satisfied = [(-len(concepts), position, template)
+                     for position, (template, concepts) in enumerate(self.rules) if concepts <= found]
+        ranked = []
+        for _, _, template in sorted(satisfied):
+            if template not in ranked:
+                ranked.append(template)
+        return ranked
+
+    def best_template(self, text: str) -> str:
+        ranked = self.rank(text)
+        template = ranked[0] if ranked else self.default_template
+        with self._lock:
+            self._stats['matches'] += 1
+            self._stats['defaulted'] += 0 if ranked else 1
+            self._templates[template] = self._templates.get(template, 0) + 1
+        return template
+
+    def unmatched_words(self, text: str) -> List[str]:
+        """Words of the text that are not part of any concept term"""
+        tokens = normalize(text).split()
+        covered = set()
+        for _, start, end in self.trie.scan(' '.join(tokens), normalized=True):
+            covered.update(range(start, end))
+        return [token for position, token in enumerate(tokens) if position not in covered]
+
+    def topics(self, text: str, limit: int = 3) -> List[str]:
+        """Keyword topics mentioned in the text, most mentioned first, ties by first mention"""
+        found = self.match(text)
+        mentioned = []
+        for topic, concepts in self.keyword_topics.items():
+            hits = [found[concept] for concept in concepts if concept in found]
+            if hits:
+                mentioned.append((-sum(count for count, _ in hits), min(first for _, first in hits), topic))
+        return [topic for _, _, topic in sorted(mentioned)[:limit]]
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['templates'] = dict(self._templates)
+        stats['concepts'] = len(self.concepts)
+        stats['rules'] = len(self.rules)
+        stats['trie_states'] = self.trie.states
+        return stats
+
+
+def create_fallback_matcher() -> FallbackMatcher:
+    """Compile the matcher from the rules table named in the environment"""
+    default_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fallback_rules.json')
+    return FallbackMatcher.load(os.getenv('FALLBACK_RULES_PATH', default_path))
+
+
+# Compiled once at startup, shared by app.py and the chatbot
+fallback_matcher = create_fallback_matcher()
@@ -0,0 +1,212 @@
+import os
+import time
+import logging
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+from gemini_key_pool import gemini_key_pool, FEATURE_DISEASE, FEATURE_CHAT
+
+logger = logging.getLogger(__name__)
+
+# Priority classes, most important first
+CLASS_DIAGNOSIS = 'diagnosis'
+CLASS_CHAT = 'chat'
+CLASS_SECONDARY = 'secondary'  # summaries and other optional follow-up calls
+
+
+class PriorityClass:
+    def __init__(self, name: str, rank: int, feature: str, max_wait: float, reserved_for_higher: int = 0,
+                 shed_below_headroom: float = 0.0, preemptible: bool = False):
+        self.name = name
+        self.rank = rank
+        self.feature = feature
+        self.max_wait = max_wait
+        # Concurrency slots this class must leave free for more important classes
+        self.reserved_for_higher = reserved_for_higher
+        # Shed up front when the feature's best key has less than this share of its daily quota left
+        self.shed_below_headroom = shed_below_headroom
+        # Queued requests of this class are dropped when a more important request is waiting
+        self.preemptible = preemptible
+
+
+class Ticket:
+    def __init__(self, priority_class: PriorityClass):
+        self.priority_class = priority_class
+        self.enqueued_at = time.time()
+        self.queue_wait = 0.0
+        self.admitted = False
+        self.shed_reason: Optional[str] = None
+
+    @property
+    def shed(self) -> bool:
+        return self.shed_reason is not None
+
+
+_current_class: contextvars.ContextVar = contextvars.ContextVar('gemini_priority_class', default=None)
+
+
+class GeminiDispatcher:
+    """Admission control for Gemini calls by priority class.
+
+    Requests wait for a concurrency slot in priority order. Less important
+    classes must leave ``reserved_for_higher`` slots free, so chat and
+    summaries can never take the last slots from a diagnosis. Near quota,
+    classes with a ``shed_below_headroom`` threshold are shed before they
+    queue; preemptible waiters (summaries) are dropped as soon as a more
+    important request is waiting. Per class it records queue wait, sheds and
+    the calls/tokens consumed.
+    """
+
+    def __init__(self, max_concurrent: int, classes: List[PriorityClass], wait_window: int = 200):
+        self.max_concurrent = max_concurrent
+        self.classes = {priority_class.name: priority_class for priority_class in classes}
+        self._condition = threading.Condition()
+        self._waiting: List[Ticket] = []
+        self._running = 0
+        self._stats = {name: {
+            'admitted': 0, 'shed': {}, 'running': 0, 'total_wait': 0.0,
+            'waits': deque(maxlen=wait_window), 'calls': 0, 'input_tokens': 0, 'output_tokens': 0
+        } for name in self.classes}
+
+    def _is_next(self, ticket: Ticket) -> bool:
+        """No more important (or earlier equally important) request is waiting"""
+        rank = ticket.priority_class.rank
+        return not any(
+            other is not ticket and (other.priority_class.rank, other.enqueued_at) < (rank, ticket.enqueued_at)
+            for other in self._waiting
+        )
+
+    def _can_run(self, ticket: Ticket) -> bool:
+        slots = self.max_concurrent - ticket.priority_class.reserved_for_higher
+        return self._running < slots and self._is_next(ticket)
+
+    def _preempt(self, arriving: Ticket):
+        for waiter in self._waiting:
+            if waiter.priority_class.preemptible and waiter.priority_class.rank > arriving.priority_class.rank:
+                waiter.shed_reason = 'preempted'
+        self._condition.notify_all()
+
+    def acquire(self, class_name: str, max_wait: Optional[float] = None) -> Ticket:
+        """Wait for a slot; check ticket.shed before calling Gemini and always release()"""
+        ticket = Ticket(self.classes[class_name])
+        priority_class = ticket.priority_class
+
+        if priority_class.shed_below_headroom and gemini_key_pool.headroom(priority_class.feature) < priority_class.shed_below_headroom:
+            ticket.shed_reason = 'low_quota'
+            self._record(ticket)
+            return ticket
+
+        wait_limit = priority_class.max_wait if max_wait is None else min(max_wait, priority_class.max_wait)
+        give_up_at = ticket.enqueued_at + wait_limit
+        with self._condition:
+            self._waiting.append(ticket)
+            self._preempt(ticket)
+            while not ticket.shed and not self._can_run(ticket):
+                remaining = give_up_at - time.time()
+                if remaining <= 0:
+                    ticket.shed_reason = 'queue_timeout' if wait_limit > 0 else 'no_capacity'
+                    break
+                self._condition.wait(remaining)
+            self._waiting.remove(ticket)
+            if not ticket.shed:
+                ticket.admitted = True
+                self._running += 1
+            # A shed or admitted waiter may unblock the next one in line
+            self._condition.notify_all()
+
+        ticket.queue_wait = time.time() - ticket.enqueued_at
+        self._record(ticket)
+        return ticket
+
+    def release(self, ticket: Ticket):
+        if not ticket.admitted:
+            return
+        ticket.admitted = False
+        with self._condition:
+            self._running -= 1
+            self._stats[ticket.priority_class.name]['running'] -= 1
+            self._condition.notify_all()
+
+    def _record(self, ticket: Ticket):
+        with self._condition:
+            stats = self._stats[ticket.priority_class.name]
+            if ticket.shed:
+                stats['shed'][ticket.shed_reason] = stats['shed'].get(ticket.shed_reason, 0) + 1
+                logger.info(f" Shed {ticket.priority_class.name} Gemini request ({ticket.shed_reason})")
+                return
+            stats['admitted'] += 1
+            stats['running'] += 1
+            stats['total_wait'] += ticket.queue_wait
+            stats['waits'].append(ticket.queue_wait)
+
+    @contextmanager
+    def admit(self, class_name: str, max_wait: Optional[float] = None):
+        """Hold a slot for the block; Gemini usage inside it is charged to the class"""
+        ticket = self.acquire(class_name, max_wait)
+        token = _current_class.set(class_name)
+        try:
+            yield ticket
+        finally:
+            _current_class.reset(token)
+            self.release(ticket)
+
+    def record_usage(self, response, class_name: Optional[str] = None):
+        """Charge a response's calls and tokens to the active (or given) class"""
+        class_name = class_name or _current_class.get()
+        if class_name not in self._stats:
+            return
+        usage = getattr(response, 'usage_metadata', None)
+        with self._condition:
+            stats = self._stats[class_name]
+            stats['calls'] += 1
+            if usage is not None:
+                stats['input_tokens'] += getattr(usage, 'prompt_token_count', 0) or 0
+                stats['output_tokens'] += getattr(usage, 'candidates_token_count', 0) or 0
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._condition:
+            classes = {}
+            for name, stats in self._stats.items():
+                waits = sorted(stats['waits'])
+                classes[name] = {
+                    'admitted': stats['admitted'],
+                    'running': stats['running'],
+                    'waiting': sum(1 for ticket in self._waiting if ticket.priority_class.name == name),
+                    'shed': dict(stats['shed']),
+                    'avg_queue_wait': round(stats['total_wait'] / stats['admitted'], 3) if stats['admitted'] else 0.0,
+                    'p90_queue_wait': round(waits[min(len(waits) - 1, int(len(waits) * 0.9))], 3) if waits else 0.0,
+                    'quota_consumed': {
+                        'calls': stats['calls'],
+                        'input_tokens': stats['input_tokens'],
+                        'output_tokens': stats['output_tokens']
+                    }
+                }
+            return {'max_concurrent': self.max_concurrent, 'running': self._running, 'classes': classes}
+
+
+def create_gemini_dispatcher() -> GeminiDispatcher:
+    """Create the dispatcher from environment configuration"""
+    reserved = int(os.getenv('GEMINI_DISPATCH_DIAGNOSIS_RESERVED', '2'))
+    return GeminiDispatcher(
+        max_concurrent=int(os.getenv('GEMINI_DISPATCH_MAX_CONCURRENT', '8')),
+        classes=[
+            PriorityClass(CLASS_DIAGNOSIS, 0, FEATURE_DISEASE,
+                          max_wait=float(os.getenv('GEMINI_DISPATCH_DIAGNOSIS_MAX_WAIT', '20'))),
+            PriorityClass(CLASS_CHAT, 1, FEATURE_CHAT,
+                          max_wait=float(os.getenv('GEMINI_DISPATCH_CHAT_MAX_WAIT', '10')),
+                          reserved_for_higher=reserved,
+                          shed_below_headroom=float(os.getenv('GEMINI_SHED_CHAT_BELOW', '0'))),
+            PriorityClass(CLASS_SECONDARY, 2, FEATURE_CHAT,
+                          max_wait=float(os.getenv('GEMINI_DISPATCH_SECONDARY_MAX_WAIT', '2')),
+                          reserved_for_higher=reserved + int(os.getenv('GEMINI_DISPATCH_CHAT_RESERVED', '2')),
+                          shed_below_headroom=float(os.getenv('GEMINI_SHED_SECONDARY_BELOW', '0.5')),
+                          preemptible=True),
+        ]
+    )
+
+
+# Shared by the disease-detection and chatbot call paths
+gemini_dispatcher = create_gemini_dispatcher()
@@ -0,0 +1,231 @@
+import os
+import time
+import importlib
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+
+from gemini_resilience import key_fingerprint
+from quota_ledger import quota_ledger
+
+logger = logging.getLogger(__name__)
+
+# Features that draw on the pool
+FEATURE_DISEASE = 'disease_prediction'
+FEATURE_CHAT = 'chat'
+
+# Lower number = more important; less important features leave reserved capacity to the others
+DEFAULT_FEATURE_PRIORITIES = {FEATURE_DISEASE: 0, FEATURE_CHAT: 1}
+
+
+class PooledKey:
+    """One API key with its rate limiter and per-feature weights"""
+
+    def __init__(self, label: str, api_key: str, limiter, weights: Dict[str, float]):
+        self.label = label
+        self.api_key = api_key
+        self.fingerprint = key_fingerprint(api_key)
+        self.limiter = limiter
+        self.weights = dict(weights)
+        self.cool_until = 0.0
+
+    @property
+    def daily_limit(self) -> int:
+        return getattr(self.limiter, 'max_daily_calls', 0) or 0
+
+    def calls_today(self) -> int:
+        # The ledger is shared by every limiter and worker using this key
+        return max(getattr(self.limiter, 'daily_calls', 0), quota_ledger.calls_today(self.api_key))
+
+    def remaining_calls(self) -> int:
+        return max(0, self.daily_limit - self.calls_today()) if self.daily_limit else 0
+
+    def remaining_fraction(self) -> float:
+        return self.remaining_calls() / self.daily_limit if self.daily_limit else 0.0
+
+    def cooling(self) -> bool:
+        return time.time() < max(self.cool_until, getattr(self.limiter, 'rate_limit_until', 0))
+
+
+class GeminiKeyPool:
+    """Weighted pool of Gemini API keys shared by disease prediction and the chatbot.
+
+    Each key keeps its own limiter and ledger entry. Callers ask for candidates
+    for a feature and get keys ordered by remaining daily headroom times the
+    key's weight for that feature; keys cooling down after a 429 go last and
+    exhausted keys are left out. Less important features may not use the last
+    ``reserve_fraction`` of a key that a more important feature can also use.
+    """
+
+    def __init__(self, reserve_fraction: float = 0.2, cross_feature_weight: float = 0.5,
+                 cooldown_seconds: float = 30.0, priorities: Optional[Dict[str, int]] = None):
+        self.reserve_fraction = reserve_fraction
+        self.cross_feature_weight = cross_feature_weight
+        self.cooldown_seconds = cooldown_seconds
+        self.priorities = dict(priorities or DEFAULT_FEATURE_PRIORITIES)
+        self._keys: List[PooledKey] = []
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, Any]] = {}
+
+    def add_key(self, label: str, api_key: Optional[str], limiter, owner_feature: str,
+                weights: Optional[Dict[str, float]] = None) -> Optional[PooledKey]:
+        """Add a key; by default it serves its owner at full weight and other features at cross_feature_weight"""
+        if not api_key:
+            return None
+        if weights is None:
+            weights = {feature: (1.0 if feature == owner_feature else self.cross_feature_weight)
+                       for feature in self.priorities}
+        fingerprint = key_fingerprint(api_key)
+        with self._lock:
+            for entry in self._keys:
+                if entry.fingerprint == fingerprint:
+                    # Same key configured for several features: one entry, the larger weights win
+                    for feature, weight in weights.items():
+                        entry.weights[feature] = max(entry.weights.get(feature, 0.0), weight)
+                    return entry
+            entry = PooledKey(label, api_key, limiter, weights)
+            self._keys.append(entry)
+        logger.info(f" Gemini key pool: added '{label}' ({fingerprint})")
+        return entry
+
+    def entry(self, api_key: Optional[str]) -> Optional[PooledKey]:
+        if not api_key:
+            return None
+        fingerprint = key_fingerprint(api_key)
+        with self._lock:
+            return next((entry for entry in self._keys if entry.fingerprint == fingerprint), None)
+
+    def limiter_for(self, api_key: Optional[str], default=None):
+        entry = self.entry(api_key)
+        return entry.limiter if entry is not None else default
+
+    def _reserved_for_others(self, entry: PooledKey, feature: str) -> bool:
+        """True when a more important feature can use this key and its headroom is down to the reserve"""
+        priority = self.priorities.get(feature, max(self.priorities.values(), default=0) + 1)
+        more_important = [other for other, other_priority in self.priorities.items()
+                          if other_priority < priority and entry.weights.get(other, 0) > 0]
+        return bool(more_important) and entry.remaining_fraction() <= self.reserve_fraction
+
+    def _rank(self, feature: str):
+        """(ordered keys, keys held back for reserve)"""
+        ranked = []
+        reserved = 0
+        with self._lock:
+            keys = list(self._keys)
+        for entry in keys:
+            weight = entry.weights.get(feature, 0)
+            if weight <= 0 or entry.limiter.is_quota_exceeded() or entry.remaining_calls() <= 0:
+                continue
+            if self._reserved_for_others(entry, feature):
+                reserved += 1
+                continue
+            ranked.append((entry.cooling(), -entry.remaining_fraction() * weight, entry))
+        ranked.sort(key=lambda item: item[:2])
+        return [entry for _, _, entry in ranked], reserved
+
+    def available(self, feature: str) -> bool:
+        return bool(self._rank(feature)[0])
+
+    def candidates(self, feature: str) -> List[PooledKey]:
+        """Keys to try for a request, best first; empty when the feature has no capacity left"""
+        ranked, reserved = self._rank(feature)
+        with self._lock:
+            stats = self._feature_stats(feature)
+            stats['requests'] += 1
+            if ranked:
+                stats['picks'][ranked[0].label] = stats['picks'].get(ranked[0].label, 0) + 1
+            else:
+                stats['no_capacity'] += 1
+            if reserved:
+                stats['held_for_reserve'] += 1
+        return ranked
+
+    def headroom(self, feature: str) -> float:
+        """Best remaining daily share among keys that can serve the feature (0 when none can)"""
+        ranked, _ = self._rank(feature)
+        return max((entry.remaining_fraction() for entry in ranked), default=0.0)
+
+    def has_headroom(self, api_key: Optional[str], reserve: int = 0) -> bool:
+        """Check if more than `reserve` calls remain on a key"""
+        entry = self.entry(api_key)
+        if entry is None or entry.limiter.is_quota_exceeded():
+            return False
+        return entry.remaining_calls() > reserve
+
+    def record_rate_limited(self, api_key: Optional[str]):
+        """Move a key to the back of the order for a cooldown after a 429"""
+        entry = self.entry(api_key)
+        if entry is not None:
+            entry.cool_until = time.time() + self.cooldown_seconds
+
+    def record_failover(self, feature: str, from_key: PooledKey, to_key: PooledKey):
+        logger.info(f" {feature}: key '{from_key.label}' rate limited, failing over to '{to_key.label}'")
+        with self._lock:
+            self._feature_stats(feature)['failovers'] += 1
+
+    def _feature_stats(self, feature: str) -> Dict[str, Any]:
+        return self._stats.setdefault(feature, {
+            'requests': 0, 'failovers': 0, 'no_capacity': 0, 'held_for_reserve': 0, 'picks': {}
+        })
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            keys = list(self._keys)
+            features = {feature: dict(stats, picks=dict(stats['picks'])) for feature, stats in self._stats.items()}
+        return {
+            'reserve_fraction': self.reserve_fraction,
+            'priorities': dict(self.priorities),
+            'keys': [{
+                'label': entry.label,
+                'fingerprint': entry.fingerprint,
+                'weights': dict(entry.weights),
+                'calls_today': entry.calls_today(),
+                'daily_limit': entry.daily_limit,
+                'remaining_fraction': round(entry.remaining_fraction(), 3),
+                'quota_exceeded': entry.limiter.is_quota_exceeded(),
+                'cooling': entry.cooling()
+            } for entry in keys],
+            'features': features
+        }
+
+
+def create_gemini_key_pool() -> GeminiKeyPool:
+    """Create the pool from environment configuration"""
+    return GeminiKeyPool(
+        reserve_fraction=float(os.getenv('GEMINI_POOL_RESERVE_FRACTION', '0.2')),
+        cross_feature_weight=float(os.getenv('GEMINI_POOL_CROSS_FEATURE_WEIGHT', '0.5')),
+        cooldown_seconds=float(os.getenv('GEMINI_POOL_COOLDOWN_SECONDS', '30'))
+    )
+
+
+# Shared by the disease-detection and chatbot call paths
+gemini_key_pool = create_gemini_key_pool()
+
+_clients: Dict[str, Any] = {}
+_clients_lock = threading.Lock()
+
+
+def _generative_client(genai_module, api_key: str):
+    """One SDK client per key, configured on its own client manager rather than the global one"""
+    fingerprint = key_fingerprint(api_key)
+    with _clients_lock:
+        client = _clients.get(fingerprint)
+        if client is None:
+            # google.generativeai does not re-export its client module; fake_gemini defines a stand-in
+            client_module = getattr(genai_module, 'client', None) or importlib.import_module(f"{genai_module.__name__}.client")
+            manager = client_module._ClientManager()
+            manager.configure(api_key=api_key)
+            client = _clients[fingerprint] = manager.get_default_client('generative')
+        return client
+
+
+def bind_model(genai_module, model_name: str, api_key: Optional[str], **kwargs):
+    """A GenerativeModel whose calls always go out on api_key.
+
+    genai.configure() swaps the process-wide default client, so a model relying on it can
+    send a request on whichever key another thread configured last.
+    """
+    model = genai_module.GenerativeModel(model_name, **kwargs)
+    if api_key:
+        model._client = _generative_client(genai_module, api_key)
+    return model
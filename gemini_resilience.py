@@ -0,0 +1,647 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Optional, Tuple, Dict, Any, Callable
+
+logger = logging.getLogger(__name__)
+
+
+def make_request_key(model_name: str, prompt: str, image_parts=None) -> str:
+    """Build a stable key for a Gemini request from model, prompt and image digests"""
+    digest = hashlib.sha256()
+    digest.update(str(model_name).encode('utf-8'))
+    digest.update(b'\x00')
+    digest.update(str(prompt).encode('utf-8'))
+    for part in image_parts or []:
+        digest.update(b'\x00')
+        data = part.get('data') if isinstance(part, dict) else part
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        if isinstance(data, (bytes, bytearray)):
+            digest.update(hashlib.sha256(data).digest())
+        else:
+            digest.update(repr(data).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class _InFlightCall:
+    """A single upstream call that other identical requests can wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class FileLockStore:
+    """Shared lock store on a local directory so gunicorn workers can coalesce calls.
+
+    The leader creates ``<key>.lock`` with O_EXCL and publishes its result to
+    ``<key>.result``. Followers in other processes poll for the result while the
+    lock is held; a lock older than ``lock_timeout`` is treated as stale.
+    """
+
+    def __init__(self, directory: str, lock_timeout: float = 60.0, result_ttl: float = 10.0,
+                 poll_interval: float = 0.05):
+        self.directory = directory
+        self.lock_timeout = lock_timeout
+        self.result_ttl = result_ttl
+        self.poll_interval = poll_interval
+        os.makedirs(directory, exist_ok=True)
+
+    def _lock_path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.lock")
+
+    def _result_path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.result")
+
+    def try_acquire(self, key: str) -> bool:
+        """Try to become the leader for ``key`` across processes"""
+        path = self._lock_path(key)
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(path) > self.lock_timeout:
+                    # Leader died without releasing - break the stale lock and retry once
+                    os.remove(path)
+                    return self.try_acquire(key)
+            except OSError:
+                pass
+            return False
+        with os.fdopen(fd, 'w') as lock_file:
+            lock_file.write(str(os.getpid()))
+        # Drop any stale result from an earlier flight with the same key
+        try:
+            os.remove(self._result_path(key))
+        except OSError:
+            pass
+        return True
+
+    def publish(self, key: str, result):
+        """Publish the leader's result and release the lock"""
+        path = self._result_path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as result_file:
+                json.dump({'result': result, 'timestamp': time.time()}, result_file)
+            os.replace(tmp_path, path)
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning(f" Could not publish coalesced result: {e}")
+        finally:
+            self.release(key)
+
+    def release(self, key: str):
+        try:
+            os.remove(self._lock_path(key))
+        except OSError:
+            pass
+
+    def wait_for_result(self, key: str, timeout: float):
+        """Wait for another worker's result. Returns (found, result)."""
+        deadline = time.time() + timeout
+        lock_path = self._lock_path(key)
+        result_path = self._result_path(key)
+        while time.time() < deadline:
+            try:
+                with open(result_path, 'r', encoding='utf-8') as result_file:
+                    payload = json.load(result_file)
+                if time.time() - payload.get('timestamp', 0) <= self.result_ttl:
+                    return True, payload.get('result')
+            except (OSError, ValueError):
+                pass
+            if not os.path.exists(lock_path):
+                # Leader finished (or failed) without a fresh result for us
+                return False, None
+            time.sleep(self.poll_interval)
+        return False, None
+
+    def cleanup(self):
+        """Remove expired result files"""
+        now = time.time()
+        try:
+            for name in os.listdir(self.directory):
+                if name.endswith('.result'):
+                    path = os.path.join(self.directory, name)
+                    try:
+                        if now - os.path.getmtime(path) > self.result_ttl:
+                            os.remove(path)
+                    except OSError:
+                        pass
+        except OSError:
+            pass
+
+
+class SingleFlight:
+    """Coalesce concurrent identical Gemini requests onto one upstream call.
+
+    Within a process, followers block on the leader's event and share its
+    result. When a shared ``lock_store`` is configured, followers in other
+    worker processes wait on the leader's published result instead.
+    """
+
+    def __init__(self, lock_store: Optional[FileLockStore] = None, wait_timeout: float = 60.0):
+        self.lock_store = lock_store
+        self.wait_timeout = wait_timeout
+        self.enabled = os.getenv('GEMINI_SINGLEFLIGHT_ENABLED', 'true').lower() == 'true'
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _InFlightCall] = {}
+        self.stats = {
+            'leader_calls': 0,
+            'coalesced_local': 0,
+            'coalesced_shared': 0,
+            'shared_wait_misses': 0,
+            'max_waiters': 0
+        }
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Run ``fn`` once per in-flight ``key``. Returns (result, was_shared)."""
+        if not self.enabled:
+            return fn(), False
+
+        with self._lock:
+            call = self._calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = _InFlightCall()
+                self._calls[key] = call
+            else:
+                call.waiters += 1
+                self.stats['coalesced_local'] += 1
+                self.stats['max_waiters'] = max(self.stats['max_waiters'], call.waiters)
+
+        if not is_leader:
+            if not call.done.wait(self.wait_timeout):
+                logger.warning(" Coalesced request timed out waiting for leader, calling upstream directly")
+                return fn(), False
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result, was_shared = self._run_as_leader(key, fn)
+            return call.result, was_shared
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def _run_as_leader(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        if self.lock_store is None:
+            with self._lock:
+                self.stats['leader_calls'] += 1
+            return fn(), False
+
+        if not self.lock_store.try_acquire(key):
+            found, result = self.lock_store.wait_for_result(key, self.wait_timeout)
+            if found:
+                with self._lock:
+                    self.stats['coalesced_shared'] += 1
+                return (tuple(result) if isinstance(result, list) else result), True
+            with self._lock:
+                self.stats['shared_wait_misses'] += 1
+            # The other worker gave up without a result - take over as leader if we can
+            if not self.lock_store.try_acquire(key):
+                with self._lock:
+                    self.stats['leader_calls'] += 1
+                return fn(), False
+
+        with self._lock:
+            self.stats['leader_calls'] += 1
+        try:
+            result = fn()
+        except Exception:
+            self.lock_store.release(key)
+            raise
+        self.lock_store.publish(key, list(result) if isinstance(result, tuple) else result)
+        return result, False
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+            stats['in_flight'] = len(self._calls)
+        total = stats['leader_calls'] + stats['coalesced_local'] + stats['coalesced_shared']
+        stats['coalesced_ratio'] = round((stats['coalesced_local'] + stats['coalesced_shared']) / total, 3) if total else 0.0
+        stats['enabled'] = self.enabled
+        stats['shared_store'] = self.lock_store is not None
+        return stats
+
+
+def create_single_flight() -> SingleFlight:
+    """Create the single-flight layer from environment configuration"""
+    shared_dir = os.getenv('GEMINI_SINGLEFLIGHT_DIR', '').strip()
+    wait_timeout = float(os.getenv('GEMINI_SINGLEFLIGHT_TIMEOUT', '60'))
+    lock_store = None
+    if shared_dir:
+        try:
+            lock_store = FileLockStore(shared_dir, lock_timeout=wait_timeout)
+            lock_store.cleanup()
+            logger.info(f" Cross-worker request coalescing enabled at {shared_dir}")
+        except OSError as e:
+            logger.warning(f" Shared coalescing store unavailable ({e}), coalescing within this process only")
+    return SingleFlight(lock_store=lock_store, wait_timeout=wait_timeout)
+
+
+def key_fingerprint(api_key: Optional[str]) -> str:
+    """Short, non-reversible label for an API key so it can be shown in status output"""
+    if not api_key:
+        return 'none'
+    return hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:8]
+
+
+class CircuitBreaker:
+    """Circuit breaker with a rolling error-rate window and latency EWMA for one (key, model)"""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, window_seconds: float = 300.0, min_requests: int = 4, error_threshold: float = 0.5,
+                 open_seconds: float = 60.0, max_open_seconds: float = 3600.0, not_found_open_seconds: float = 6 * 3600.0,
+                 ewma_alpha: float = 0.3, latency_samples: int = 50):
+        self.window_seconds = window_seconds
+        self.min_requests = min_requests
+        self.error_threshold = error_threshold
+        self.open_seconds = open_seconds
+        self.max_open_seconds = max_open_seconds
+        self.not_found_open_seconds = not_found_open_seconds
+        self.ewma_alpha = ewma_alpha
+
+        self.state = self.CLOSED
+        self.outcomes = deque()  # (timestamp, success)
+        self.latencies = deque(maxlen=latency_samples)
+        self.latency_ewma: Optional[float] = None
+        self.opened_until = 0.0
+        self.consecutive_opens = 0
+        self.probe_in_flight = False
+        self.last_error = None
+        self.last_error_kind = None
+        self.total_successes = 0
+        self.total_failures = 0
+
+    def _trim(self, now: float):
+        while self.outcomes and now - self.outcomes[0][0] > self.window_seconds:
+            self.outcomes.popleft()
+
+    def error_rate(self, now: Optional[float] = None) -> float:
+        self._trim(now or time.time())
+        if not self.outcomes:
+            return 0.0
+        failures = sum(1 for _, ok in self.outcomes if not ok)
+        return failures / len(self.outcomes)
+
+    def allow_request(self, now: Optional[float] = None) -> bool:
+        """Whether a call may be attempted; half-open admits a single probe"""
+        now = now or time.time()
+        if self.state == self.OPEN:
+            if now < self.opened_until:
+                return False
+            self.state = self.HALF_OPEN
+            self.probe_in_flight = False
+        if self.state == self.HALF_OPEN:
+            if self.probe_in_flight:
+                return False
+            self.probe_in_flight = True
+        return True
+
+    def release_probe(self):
+        """Give back a half-open probe that was admitted but never sent"""
+        self.probe_in_flight = False
+
+    def record_success(self, latency: float, now: Optional[float] = None):
+        now = now or time.time()
+        self.outcomes.append((now, True))
+        self._trim(now)
+        self.latencies.append(latency)
+        if self.latency_ewma is None:
+            self.latency_ewma = latency
+        else:
+            self.latency_ewma = self.ewma_alpha * latency + (1 - self.ewma_alpha) * self.latency_ewma
+        self.total_successes += 1
+        if self.state == self.HALF_OPEN:
+            self.consecutive_opens = 0
+        self.state = self.CLOSED
+        self.probe_in_flight = False
+
+    def record_failure(self, kind: str = 'error', message: str = '', now: Optional[float] = None):
+        """Record a failed call. ``kind`` is one of 'not_found', 'rate_limit', 'timeout' or 'error'."""
+        now = now or time.time()
+        self.outcomes.append((now, False))
+        self._trim(now)
+        self.total_failures += 1
+        self.last_error = message[:200]
+        self.last_error_kind = kind
+        self.probe_in_flight = False
+
+        if kind == 'not_found':
+            # A missing model will not come back within minutes
+            self._open(now, self.not_found_open_seconds)
+        elif self.state == self.HALF_OPEN:
+            self._open(now)
+        elif len(self.outcomes) >= self.min_requests and self.error_rate(now) >= self.error_threshold:
+            self._open(now)
+
+    def _open(self, now: float, duration: Optional[float] = None):
+        self.consecutive_opens += 1
+        if duration is None:
+            duration = min(self.max_open_seconds, self.open_seconds * (2 ** (self.consecutive_opens - 1)))
+        self.state = self.OPEN
+        self.opened_until = now + duration
+        logger.warning(f" Circuit opened for {duration:.0f}s after {self.last_error_kind} error: {self.last_error}")
+
+    def p90_latency(self) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(round(0.9 * (len(ordered) - 1))))]
+
+    def health_score(self, reference_latency: float = 5.0, now: Optional[float] = None) -> float:
+        """0..1 score combining success rate and latency; unknown models score as neutral"""
+        now = now or time.time()
+        if self.state == self.OPEN and now < self.opened_until:
+            return 0.0
+        success_rate = 1.0 - self.error_rate(now)
+        latency = self.latency_ewma if self.latency_ewma is not None else reference_latency
+        score = success_rate / (1.0 + latency / reference_latency)
+        if self.state == self.HALF_OPEN:
+            score *= 0.5
+        return score
+
+    def snapshot(self, now: Optional[float] = None) -> Dict[str, Any]:
+        now = now or time.time()
+        state = self.state
+        if state == self.OPEN and now >= self.opened_until:
+            state = self.HALF_OPEN  # Next request will be admitted as a probe
+        return {
+            'state': state,
+            'error_rate': round(self.error_rate(now), 3),
+            'requests_in_window': len(self.outcomes),
+            'latency_ewma': round(self.latency_ewma, 3) if self.latency_ewma is not None else None,
+            'latency_p90': round(self.p90_latency(), 3) if self.latencies else None,
+            'health_score': round(self.health_score(now=now), 3),
+            'open_until': self.opened_until if self.state == self.OPEN else None,
+            'consecutive_opens': self.consecutive_opens,
+            'last_error_kind': self.last_error_kind,
+            'last_error': self.last_error,
+            'total_successes': self.total_successes,
+            'total_failures': self.total_failures
+        }
+
+
+class CircuitBreakerRegistry:
+    """Circuit breakers keyed by (API key, model) with health-based model ordering"""
+
+    def __init__(self):
+        self.enabled = os.getenv('GEMINI_CIRCUIT_BREAKER_ENABLED', 'true').lower() == 'true'
+        self.window_seconds = float(os.getenv('GEMINI_BREAKER_WINDOW', '300'))
+        self.min_requests = int(os.getenv('GEMINI_BREAKER_MIN_REQUESTS', '4'))
+        self.error_threshold = float(os.getenv('GEMINI_BREAKER_ERROR_RATE', '0.5'))
+        self.open_seconds = float(os.getenv('GEMINI_BREAKER_OPEN_SECONDS', '60'))
+        self.reference_latency = float(os.getenv('GEMINI_BREAKER_REFERENCE_LATENCY', '5.0'))
+        self._lock = threading.Lock()
+        self._breakers: Dict[Tuple[str, str], CircuitBreaker] = {}
+        self.skipped_open = 0
+
+    def get(self, api_key: Optional[str], model_name: str) -> CircuitBreaker:
+        breaker_key = (key_fingerprint(api_key), model_name)
+        with self._lock:
+            breaker = self._breakers.get(breaker_key)
+            if breaker is None:
+                breaker = CircuitBreaker(
+                    window_seconds=self.window_seconds,
+                    min_requests=self.min_requests,
+                    error_threshold=self.error_threshold,
+                    open_seconds=self.open_seconds
+                )
+                self._breakers[breaker_key] = breaker
+            return breaker
+
+    def ordered_models(self, api_key: Optional[str], models) -> list:
+        """Drop models whose circuit is open and order the rest by health.
+
+        Scores are bucketed to one decimal so small latency differences keep the
+        configured preference order.
+        """
+        if not self.enabled:
+            return list(models)
+        now = time.time()
+        fingerprint = key_fingerprint(api_key)
+        candidates = []
+        with self._lock:
+            for index, model_name in enumerate(models):
+                breaker = self._breakers.get((fingerprint, model_name))
+                if breaker is None:
+                    # No history yet: same score as a healthy model at reference latency
+                    score = 0.5
+                elif breaker.state == CircuitBreaker.OPEN and now < breaker.opened_until:
+                    self.skipped_open += 1
+                    continue
+                else:
+                    score = breaker.health_score(self.reference_latency, now)
+                candidates.append((-round(score, 1), index, model_name))
+        candidates.sort()
+        return [model_name for _, _, model_name in candidates]
+
+    def allow_request(self, api_key: Optional[str], model_name: str) -> bool:
+        if not self.enabled:
+            return True
+        breaker = self.get(api_key, model_name)
+        with self._lock:
+            return breaker.allow_request()
+
+    def release_probe(self, api_key: Optional[str], model_name: str):
+        breaker = self.get(api_key, model_name)
+        with self._lock:
+            breaker.release_probe()
+
+    def record_success(self, api_key: Optional[str], model_name: str, latency: float):
+        breaker = self.get(api_key, model_name)
+        with self._lock:
+            breaker.record_success(latency)
+
+    def record_failure(self, api_key: Optional[str], model_name: str, kind: str, message: str = ''):
+        breaker = self.get(api_key, model_name)
+        with self._lock:
+            breaker.record_failure(kind, message)
+
+    def p90_latency(self, api_key: Optional[str], model_name: str) -> Optional[float]:
+        breaker = self.get(api_key, model_name)
+        with self._lock:
+            return breaker.p90_latency()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            breakers = {
+                f"{fingerprint}/{model_name}": breaker.snapshot()
+                for (fingerprint, model_name), breaker in self._breakers.items()
+            }
+        return {'enabled': self.enabled, 'skipped_open_circuits': self.skipped_open, 'breakers': breakers}
+
+
+def classify_gemini_error(error) -> str:
+    """Map a Gemini exception to a circuit breaker failure kind"""
+    error_str = str(error).lower()
+    if "404" in error_str or "not found" in error_str:
+        return 'not_found'
+    if "429" in error_str or "quota" in error_str or "resource exhausted" in error_str or "resource_exhausted" in error_str:
+        return 'rate_limit'
+    if "timeout" in error_str or "deadline" in error_str or "timed out" in error_str:
+        return 'timeout'
+    return 'error'
+
+
+class Deadline:
+    """Absolute per-request deadline that can be passed down through call layers"""
+
+    def __init__(self, seconds: Optional[float]):
+        self.started = time.time()
+        self.expires_at = self.started + seconds if seconds else None
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left, or None when there is no deadline"""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.time())
+
+    def expired(self) -> bool:
+        return self.expires_at is not None and time.time() >= self.expires_at
+
+    def cap(self, timeout: Optional[float]) -> Optional[float]:
+        """Limit a timeout so it never runs past the deadline"""
+        remaining = self.remaining()
+        if remaining is None:
+            return timeout
+        if timeout is None:
+            return remaining
+        return min(timeout, remaining)
+
+
+class HedgedCaller:
+    """Run a call against the primary model and hedge onto the next model if it is slow.
+
+    If the primary has not answered within ``hedge_delay`` seconds, the same
+    request is fired at the next candidate in parallel and whichever succeeds
+    first wins; the loser is cancelled if it has not started, otherwise its
+    result is ignored. Failed attempts fall through to the next candidate
+    without waiting for the hedge delay.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None):
+        self.max_workers = max_workers or int(os.getenv('GEMINI_HEDGE_WORKERS', '8'))
+        self._executor = None
+        self._lock = threading.Lock()
+        self.stats = {
+            'requests': 0,
+            'hedges_fired': 0,
+            'hedges_suppressed': 0,
+            'primary_wins': 0,
+            'hedge_wins': 0,
+            'fallback_wins': 0,
+            'deadline_misses': 0,
+            'all_failed': 0
+        }
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='gemini-hedge')
+            return self._executor
+
+    def _bump(self, name: str):
+        with self._lock:
+            self.stats[name] += 1
+
+    def call(self, candidates, call_fn: Callable[[str], Tuple[Any, Optional[str]]], hedge_delay: float,
+             deadline: Optional[Deadline] = None, may_hedge: Optional[Callable[[], bool]] = None):
+        """
+        ``call_fn(model)`` returns (result, error_kind) with error_kind None on success.
+        Returns (result, error_kind, model_used).
+        """
+        deadline = deadline or Deadline(None)
+        remaining_models = list(candidates)
+        if not remaining_models:
+            return None, 'no_models', None
+        self._bump('requests')
+
+        executor = self._get_executor()
+        pending = {}
+        hedged = set()
+        last_error = None
+
+        def launch():
+            model_name = remaining_models.pop(0)
+            # Run in a copy of the caller's context so per-request scopes (token accounting) follow the call
+            future = executor.submit(contextvars.copy_context().run, call_fn, model_name)
+            pending[future] = model_name
+            return future
+
+        launch()
+        primary_future = next(iter(pending))
+        hedge_time = time.time() + hedge_delay
+
+        while pending:
+            if deadline.expired():
+                break
+            can_hedge = bool(remaining_models) and time.time() < hedge_time
+            timeout = deadline.cap(max(0.0, hedge_time - time.time()) if can_hedge else None)
+            done, _ = wait(list(pending), timeout=timeout, return_when=FIRST_COMPLETED)
+
+            if not done:
+                if deadline.expired():
+                    break
+                if remaining_models and time.time() >= hedge_time:
+                    if may_hedge is None or may_hedge():
+                        self._bump('hedges_fired')
+                        logger.info(f" Primary model slow after {hedge_delay:.1f}s, hedging to {remaining_models[0]}")
+                        hedged.add(launch())
+                    else:
+                        self._bump('hedges_suppressed')
+                        remaining_models = []
+                continue
+
+            for future in done:
+                model_name = pending.pop(future)
+                try:
+                    result, error_kind = future.result()
+                except Exception as e:
+                    result, error_kind = None, classify_gemini_error(e)
+                if error_kind is None:
+                    if future is primary_future:
+                        self._bump('primary_wins')
+                    else:
+                        self._bump('hedge_wins' if future in hedged else 'fallback_wins')
+                    for loser in pending:
+                        loser.cancel()
+                    return result, None, model_name
+                last_error = error_kind
+                if error_kind == 'quota_exceeded':
+                    for loser in pending:
+                        loser.cancel()
+                    return None, error_kind, model_name
+
+            # A failure frees a slot: move on to the next candidate straight away
+            if not pending and remaining_models:
+                launch()
+                hedge_time = time.time() + hedge_delay
+
+        for loser in pending:
+            loser.cancel()
+        if deadline.expired():
+            self._bump('deadline_misses')
+            return None, 'deadline_exceeded', None
+        self._bump('all_failed')
+        return None, last_error or 'error', None
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self.stats)
@@ -0,0 +1,177 @@
+import os
+import io
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple, Dict, Any
+
+logger = logging.getLogger(__name__)
+
+try:
+    from PIL import Image, ImageOps
+    IMAGE_PROCESSING_AVAILABLE = True
+except ImportError as e:
+    logger.error(f" Image processing not available: {e}")
+    IMAGE_PROCESSING_AVAILABLE = False
+
+
+class VisionImagePreparer:
+    """Shrink images to what Gemini Vision actually uses before uploading them.
+
+    Images are orientation-corrected, flattened to RGB, downscaled so the long
+    side is at most ``max_side`` pixels and re-encoded as JPEG without EXIF or
+    other metadata. JPEG quality is searched so the payload fits ``byte_budget``.
+    Prepared bytes are cached by the digest of the source image so the same
+    photo reused within a session is not re-encoded.
+    """
+
+    def __init__(self):
+        # Gemini tiles images at 768px; larger inputs cost bandwidth without adding detail
+        self.max_side = int(os.getenv('VISION_IMAGE_MAX_SIDE', '1024'))
+        self.byte_budget = int(os.getenv('VISION_IMAGE_BYTE_BUDGET', str(200 * 1024)))
+        self.min_quality = int(os.getenv('VISION_IMAGE_MIN_QUALITY', '45'))
+        self.max_quality = int(os.getenv('VISION_IMAGE_MAX_QUALITY', '88'))
+        self.cache_max_bytes = int(os.getenv('VISION_IMAGE_CACHE_BYTES', str(32 * 1024 * 1024)))
+
+        self._cache: "OrderedDict[str, Tuple[bytes, Dict[str, Any]]]" = OrderedDict()
+        self._cache_bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {'prepared': 0, 'cache_hits': 0, 'bytes_in': 0, 'bytes_out': 0}
+
+    @staticmethod
+    def digest_for(image_bytes: Optional[bytes] = None, image=None) -> str:
+        """Digest of the source image; raw upload bytes are cheaper to hash than pixels"""
+        if image_bytes is not None:
+            return hashlib.sha256(image_bytes).hexdigest()
+        digest = hashlib.sha256()
+        digest.update(f"{image.mode}:{image.size}".encode('utf-8'))
+        digest.update(image.tobytes())
+        return digest.hexdigest()
+
+    def prepare(self, image=None, image_bytes: Optional[bytes] = None) -> Tuple[bytes, Dict[str, Any]]:
+        """
+        Prepare a PIL image (or raw image bytes) for a vision request.
+        Returns (jpeg_bytes, info) where info has width, height, quality, digest and sizes.
+        """
+        if not IMAGE_PROCESSING_AVAILABLE:
+            raise RuntimeError("Image processing is not available")
+        if image is None and image_bytes is None:
+            raise ValueError("An image or image bytes are required")
+
+        digest = self.digest_for(image_bytes, image)
+        with self._lock:
+            cached = self._cache.get(digest)
+            if cached is not None:
+                self._cache.move_to_end(digest)
+                self.stats['cache_hits'] += 1
+                return cached
+
+        if image is None:
+            image = Image.open(io.BytesIO(image_bytes))
+        source_size = len(image_bytes) if image_bytes is not None else None
+
+        source_format = image.format
+        source_has_metadata = bool(image.info.get('exif') or image.info.get('icc_profile'))
+        prepared, data, quality = self._encode_to_budget(self._normalize(image))
+        if (source_size is not None and source_size <= len(data) and source_format == 'JPEG'
+                and not source_has_metadata and prepared.size == image.size):
+            # Small, clean JPEGs are already cheaper than any re-encode
+            data, quality = image_bytes, None
+        info = {
+            'digest': digest,
+            'width': prepared.width,
+            'height': prepared.height,
+            'quality': quality,
+            'bytes': len(data),
+            'source_bytes': source_size,
+            'mime_type': 'image/jpeg'
+        }
+        logger.info(f" Prepared vision image {prepared.width}x{prepared.height} q={quality or 'original'} "
+                    f"({len(data) // 1024} KB{f' from {source_size // 1024} KB' if source_size else ''})")
+
+        with self._lock:
+            self.stats['prepared'] += 1
+            self.stats['bytes_in'] += source_size or 0
+            self.stats['bytes_out'] += len(data)
+            self._store(digest, (data, info))
+        return data, info
+
+    def prepare_part(self, image=None, image_bytes: Optional[bytes] = None) -> Dict[str, Any]:
+        """Prepared image as a Gemini inline data part"""
+        data, info = self.prepare(image=image, image_bytes=image_bytes)
+        return {"mime_type": info['mime_type'], "data": data}
+
+    def _normalize(self, image):
+        try:
+            # Apply the EXIF orientation before the metadata is dropped
+            image = ImageOps.exif_transpose(image)
+        except Exception:
+            pass
+        if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+            rgba = image.convert('RGBA')
+            background = Image.new('RGB', rgba.size, (255, 255, 255))
+            background.paste(rgba, mask=rgba.split()[-1])
+            image = background
+        elif image.mode != 'RGB':
+            image = image.convert('RGB')
+        if max(image.size) > self.max_side:
+            image = image.copy()
+            image.thumbnail((self.max_side, self.max_side), Image.Resampling.LANCZOS)
+        return image
+
+    def _encode(self, image, quality: int) -> bytes:
+        buffer = io.BytesIO()
+        # No exif/icc arguments: the re-encoded JPEG carries pixel data only
+        image.save(buffer, format='JPEG', quality=quality, optimize=True, progressive=True)
+        return buffer.getvalue()
+
+    def _encode_to_budget(self, image):
+        """Returns (final_image, jpeg_bytes, quality)"""
+        best = self._encode(image, self.max_quality)
+        if len(best) <= self.byte_budget:
+            return image, best, self.max_quality
+
+        while True:
+            # Binary search for the highest quality that fits the budget
+            low, high = self.min_quality, self.max_quality - 1
+            fitting = None
+            while low <= high:
+                quality = (low + high) // 2
+                data = self._encode(image, quality)
+                if len(data) <= self.byte_budget:
+                    fitting = (image, data, quality)
+                    low = quality + 1
+                else:
+                    high = quality - 1
+            if fitting is not None:
+                return fitting
+            if max(image.size) <= 256:
+                return image, self._encode(image, self.min_quality), self.min_quality
+            # Even the lowest quality is too big - trade resolution instead
+            image = image.resize((max(1, int(image.width * 0.8)), max(1, int(image.height * 0.8))),
+                                 Image.Resampling.LANCZOS)
+
+    def _store(self, digest: str, entry: Tuple[bytes, Dict[str, Any]]):
+        size = len(entry[0])
+        if size > self.cache_max_bytes:
+            return
+        previous = self._cache.pop(digest, None)
+        if previous is not None:
+            self._cache_bytes -= len(previous[0])
+        self._cache[digest] = entry
+        self._cache_bytes += size
+        while self._cache_bytes > self.cache_max_bytes and self._cache:
+            _, (old_data, _) = self._cache.popitem(last=False)
+            self._cache_bytes -= len(old_data)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+            stats['cache_entries'] = len(self._cache)
+            stats['cache_bytes'] = self._cache_bytes
+        return stats
+
+
+# Shared preparer used by disease detection and the chatbot
+vision_image_preparer = VisionImagePreparer()
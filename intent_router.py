@@ -0,0 +1,336 @@
+import os
+import re
+import math
+import logging
+import threading
+from collections import Counter, defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from fallback_matcher import fallback_matcher
+from knowledge_index import ANIMAL_ALIASES
+
+logger = logging.getLogger(__name__)
+
+OTHER = 'other'
+
+# Intents answered with a canned text (fallback_corpus 'intent.*') instead of a Gemini call
+SOCIAL_INTENTS = ('greeting', 'thanks', 'goodbye', 'about_platform', 'capabilities', 'disease_detection_help',
+                  'consult_vet')
+# Short, generic topic questions answered with the matching 'keyword.*' fallback text
+TOPIC_INTENTS = ('fever', 'diarrhea', 'cough', 'lameness', 'mastitis', 'vaccination', 'bloat', 'wound',
+                 'parasite', 'nutrition', 'breeding')
+
+# Messages with these words always go to Gemini, however short or confidently classified; a trailing * is a prefix
+URGENT_TERMS = (
+    'bleed*', 'blood*', 'haemorrhag*', 'hemorrhag*', 'emergenc*', 'urgent*', 'dying', 'dead', 'died', 'death',
+    'poison*', 'toxic', 'venom*', 'snake*', "can't breathe", 'cant breathe', 'cannot breathe', 'not breathing',
+    'breathless*', 'gasping', 'chok*', 'collaps*', 'unconscious', 'seizure*', 'convuls*', 'paraly*', 'fractur*',
+    'broken leg', 'broken bone', 'stuck calf', 'cannot get up', "can't get up",
+)
+# Indic words carry vowel signs that are not \w, so these match anywhere in the message
+URGENT_SUBSTRINGS = (
+    'खून', 'रक्त', 'जहर', 'ज़हर', 'विष', 'मर रह', 'मर गय', 'मरत', 'सांप', 'साँप', 'सांस नहीं', 'बेहोश', 'तुरंत',
+    'इमरजेंसी', 'आपातकाल',
+)
+_URGENT = re.compile(r"\b(?:%s)" % '|'.join(
+    re.escape(term[:-1]) + r"\w*" if term.endswith('*') else re.escape(term) + r"\b" for term in URGENT_TERMS))
+
+# Words a general topic question may have besides the topic keyword and an animal name; anything else
+# (a number, a duration, another symptom) is a detail the canned topic answer cannot take into account
+TOPIC_QUESTION_WORDS = set(ANIMAL_ALIASES) | {
+    'animal', 'animals', 'livestock', 'pet', 'pets', 'treatment', 'treat', 'cure', 'remedy', 'remedies', 'care',
+    'medicine', 'schedule', 'management', 'prevention', 'prevent', 'control', 'symptoms', 'signs', 'tips', 'advice',
+    'help', 'about', 'what', 'which', 'how', 'to', 'do', 'for', 'in', 'of', 'on', 'the', 'a', 'an', 'my', 'is', 'and',
+    'please', 'ka', 'ki', 'ke', 'ilaj', 'का', 'की', 'के', 'में', 'इलाज', 'उपाय', 'रोग', 'क्या', 'करें', 'कैसे',
+}
+
+SEED_EXAMPLES: Dict[str, List[str]] = {
+    'greeting': [
+        "hi", "hello", "hey", "hii", "hello there", "hi there", "good morning", "good evening", "good afternoon",
+        "namaste", "namaskar", "ram ram", "hello doctor", "hi doctor", "hey bot", "नमस्ते", "नमस्कार", "राम राम",
+        "हैलो", "hola", "bonjour", "hallo", "vanakkam", "வணக்கம்", "నమస్కారం", "নমস্কার", "sat sri akal",
+    ],
+    'thanks': [
+        "thanks", "thank you", "thank you so much", "thanks a lot", "thank you doctor", "ok thanks", "great thanks",
+        "thanks for the help", "very helpful thank you", "dhanyavad", "shukriya", "धन्यवाद", "शुक्रिया",
+        "आभारी आहे", "gracias", "merci", "danke", "நன்றி", "ధన్యవాదాలు", "ধন্যবাদ", "okay thank you",
+    ],
+    'goodbye': [
+        "bye", "goodbye", "bye bye", "see you", "see you later", "good night", "ok bye", "talk later",
+        "अलविदा", "फिर मिलेंगे", "tata", "adios", "au revoir", "tschüss",
+    ],
+    'about_platform': [
+        "what is pashuarogyam", "what is this website", "what is this app", "who made this app",
+        "tell me about this platform", "what does this site do", "about pashu arogyam", "what is pashu aarogyam",
+        "who are you", "what are you", "are you a doctor", "are you a real vet", "is this free",
+        "यह ऐप क्या है", "पशु आरोग्यम क्या है", "तुम कौन हो",
+    ],
+    'capabilities': [
+        "what can you do", "how can you help me", "what can i ask you", "help", "how do i use this chatbot",
+        "what questions can you answer", "can you help me", "what services do you provide",
+        "what do you know", "how does this chat work", "आप क्या कर सकते हो", "मदद", "मदत",
+    ],
+    'disease_detection_help': [
+        "how to detect disease", "how do i upload a photo", "how to use disease detection",
+        "how to check my cow for disease with photo", "where do i upload image", "how to scan my animal",
+        "how does disease prediction work", "how to use image detection", "can i upload a picture",
+        "how to find disease from photo", "फोटो कैसे अपलोड करें", "बीमारी कैसे पता करें",
+    ],
+    'consult_vet': [
+        "how to contact a vet", "i want to talk to a doctor", "book a consultation", "connect me to a veterinarian",
+        "how to consult a veterinarian", "i need a vet", "how can i talk to a real doctor", "vet appointment",
+        "consultation request", "talk to veterinarian", "डॉक्टर से बात करनी है", "पशु डॉक्टर से संपर्क",
+    ],
+    'fever': [
+        "fever", "fever treatment", "animal fever", "cow fever", "fever in cattle", "how to treat fever",
+        "what to do for fever", "high temperature", "fever remedy", "बुखार", "बुखार का इलाज", "ताप", "ज्वर",
+    ],
+    'diarrhea': [
+        "diarrhea", "diarrhoea", "loose motion", "loose motions", "diarrhea treatment", "dog diarrhea",
+        "calf diarrhea", "loose dung", "दस्त", "दस्त का इलाज", "जुलाब", "पतला गोबर",
+    ],
+    'cough': [
+        "cough", "coughing", "cough treatment", "animal coughing", "dog cough", "cough remedy",
+        "खांसी", "खोकला", "खांसी का इलाज",
+    ],
+    'lameness': [
+        "lameness", "limping", "lame cow", "limping dog", "leg problem", "hoof problem", "lameness treatment",
+        "लंगड़ापन", "लंगड़ा", "पैर में दर्द",
+    ],
+    'mastitis': [
+        "mastitis", "mastitis treatment", "udder infection", "swollen udder", "mastitis in cows",
+        "थनैला", "थनैला रोग", "स्तनदाह",
+    ],
+    'vaccination': [
+        "vaccination", "vaccine", "vaccination schedule", "cattle vaccines", "which vaccine", "vaccines for cows",
+        "puppy vaccination", "टीका", "टीकाकरण", "लसीकरण",
+    ],
+    'bloat': [
+        "bloat", "bloating", "bloated stomach", "tympany", "bloat treatment", "swollen stomach",
+        "अफरा", "पेट फूलना", "पोटफुगी",
+    ],
+    'wound': [
+        "wound", "wound care", "cut", "injury", "wound treatment", "bleeding wound", "घाव", "चोट", "जखम",
+    ],
+    'parasite': [
+        "parasite", "worms", "deworming", "ticks", "lice", "deworming schedule", "worm treatment", "कीड़े",
+        "कृमि", "जूँ", "किलनी",
+    ],
+    'nutrition': [
+        "nutrition", "feed", "diet", "what to feed", "cattle feed", "feeding schedule", "balanced diet",
+        "चारा", "आहार", "पशु आहार",
+    ],
+    'breeding': [
+        "breeding", "heat", "heat cycle", "artificial insemination", "pregnancy", "breeding management",
+        "गर्भधारण", "गर्मी में", "कृत्रिम गर्भाधान",
+    ],
+    OTHER: [
+        "my cow has had a fever for three days and stopped eating what should i do",
+        "hi my dog is vomiting yellow foam since morning and is very weak",
+        "hello, my buffalo gave birth yesterday and the placenta has not come out",
+        "thanks, but the swelling on her leg is getting bigger, should i give antibiotics",
+        "my goat has swelling under the jaw and is not chewing cud",
+        "what is the dose of oxytetracycline for a 300 kg cow",
+        "my cat is sneezing and has discharge from eyes for a week",
+        "sheep are dying suddenly in my flock, two died last night",
+        "is lumpy skin disease contagious to humans",
+        "my calf has a big swelling near the navel with pus",
+        "the cow's milk has blood in it and one teat is hard",
+        "how long after vaccination can i sell the milk",
+        "dog ate chocolate an hour ago what should i do",
+        "my hen has stopped laying eggs and feathers are falling",
+        "can i give paracetamol to my dog for pain",
+        "which disease causes blisters in the mouth and feet of cattle",
+        "difference between foot and mouth disease and lumpy skin disease",
+        "cow is pressing head against wall and walking in circles",
+        "my horse is rolling on the ground and kicking its belly",
+        "buffalo is not coming into heat after calving six months ago",
+        "what are the symptoms of rabies in dogs",
+        "my pig has red patches on the skin and high fever",
+        "is it safe to drink milk from a cow treated with antibiotics",
+        "मेरी गाय तीन दिन से खाना नहीं खा रही है और उसे बुखार है क्या करूं",
+        "मेरे कुत्ते को उल्टी हो रही है और वह कमजोर है",
+        "माझ्या म्हशीला दूध कमी येत आहे आणि कास सुजली आहे",
+        "what does this lab report mean for my cow",
+        "can you explain the result of the disease detection",
+        "my goat kid has diarrhea with blood and is very weak since yesterday",
+        "cow has a wound on the leg with maggots what medicine should i apply",
+        "help! cow bleeding heavily", "emergency", "emergency please help", "my cow is dying",
+        "dog ate rat poison", "calf can't breathe", "buffalo collapsed and cannot get up", "snake bit my goat",
+        "heavy bleeding after calving", "urgent help needed", "गाय को बहुत खून बह रहा है", "मेरी गाय मर रही है",
+    ],
+}
+
+_NON_WORD = re.compile(r"[^\w\s']+", re.UNICODE)
+
+
+def normalize(text: str) -> str:
+    return ' '.join(_NON_WORD.sub(' ', text.lower()).split())
+
+
+def is_urgent(text: str) -> bool:
+    """Whether the message reports an emergency that a canned answer must not absorb"""
+    lowered = (text or '').lower()
+    return bool(_URGENT.search(normalize(lowered))) or any(term in lowered for term in URGENT_SUBSTRINGS)
+
+
+def has_details(text: str) -> bool:
+    """Whether the message says more than a general topic question ("cow fever 105", "fever since 3 days")"""
+    return any(word not in TOPIC_QUESTION_WORDS for word in fallback_matcher.unmatched_words(text))
+
+
+def features(text: str) -> Counter:
+    """Character 2-4-grams of each padded word plus the words themselves"""
+    counts: Counter = Counter()
+    for word in normalize(text).split():
+        counts[f"w:{word}"] += 1
+        padded = f" {word} "
+        for size in (2, 3, 4):
+            for start in range(len(padded) - size + 1):
+                counts[padded[start:start + size]] += 1
+    return counts
+
+
+class IntentRouter:
+    """Offline intent classifier for chat messages: multinomial naive Bayes over character n-grams.
+
+    Trained from SEED_EXAMPLES (and optionally past messages) at startup in
+    well under a second. route() returns an intent only for short messages
+    classified with high confidence; everything else, including the explicit
+    'other' class of real veterinary questions, goes on to Gemini. Urgent
+    messages (URGENT_TERMS) are never routed, and a topic intent also needs
+    one of the topic's keywords as a word in the message, since character
+    n-grams alone confuse e.g. "bleeding" with "breeding", and nothing more
+    specific than an animal name beside it (TOPIC_QUESTION_WORDS). Counts of
+    routed and passed messages give the share of traffic it absorbs.
+    """
+
+    def __init__(self, enabled: bool = True, threshold: float = 0.85, topic_threshold: float = 0.92,
+                 max_words: int = 8, alpha: float = 0.1):
+        self.enabled = enabled
+        self.threshold = threshold
+        self.topic_threshold = topic_threshold
+        self.max_words = max_words
+        self.alpha = alpha
+        self._lock = threading.Lock()
+        self._model: Optional[Tuple[Dict[str, float], Dict[str, Dict[str, float]], Dict[str, float]]] = None
+        self._stats: Dict[str, Any] = {'messages': 0, 'routed': 0, 'urgent': 0, 'too_long': 0, 'low_confidence': 0,
+                                       'no_topic_keyword': 0, 'specific_details': 0, 'intents': {},
+                                       'training_examples': 0}
+        self.train(SEED_EXAMPLES)
+
+    def train(self, examples: Dict[str, List[str]]):
+        """Fit the model from {intent: [messages]}"""
+        class_counts = {intent: len(messages) for intent, messages in examples.items() if messages}
+        feature_counts: Dict[str, Counter] = defaultdict(Counter)
+        vocabulary = set()
+        for intent, messages in examples.items():
+            for message in messages:
+                message_features = features(message)
+                feature_counts[intent].update(message_features)
+                vocabulary.update(message_features)
+
+        total = sum(class_counts.values())
+        vocabulary_size = len(vocabulary) + 1
+        priors, likelihoods, unseen = {}, {}, {}
+        for intent, count in class_counts.items():
+            intent_total = sum(feature_counts[intent].values()) + self.alpha * vocabulary_size
+            priors[intent] = math.log(count / total)
+            likelihoods[intent] = {feature: math.log((value + self.alpha) / intent_total)
+                                   for feature, value in feature_counts[intent].items()}
+            unseen[intent] = math.log(self.alpha / intent_total)
+        with self._lock:
+            self._model = (priors, likelihoods, unseen)
+            self._vocabulary = vocabulary
+            self._stats['training_examples'] = total
+
+    def train_from_history(self, messages: Iterable[str], min_confidence: float = 0.97):
+        """Add past messages: long ones as 'other', confidently classified short ones under their intent"""
+        examples = {intent: list(messages_) for intent, messages_ in SEED_EXAMPLES.items()}
+        added = 0
+        for message in messages:
+            if not message or not message.strip():
+                continue
+            if len(message.split()) > self.max_words * 2:
+                examples[OTHER].append(message)
+                added += 1
+                continue
+            intent, confidence = self.classify(message)
+            if intent != OTHER and confidence >= min_confidence:
+                examples[intent].append(message)
+                added += 1
+        self.train(examples)
+        logger.info(f" Intent router retrained with {added} messages from history")
+        return added
+
+    def classify(self, message: str) -> Tuple[str, float]:
+        """Most likely intent and its posterior probability"""
+        with self._lock:
+            priors, likelihoods, unseen = self._model
+            vocabulary = self._vocabulary
+        message_features = {feature: count for feature, count in features(message).items() if feature in vocabulary}
+        if not message_features:
+            return OTHER, 0.0
+        scores = {}
+        for intent, prior in priors.items():
+            intent_likelihoods = likelihoods[intent]
+            default = unseen[intent]
+            scores[intent] = prior + sum(count * intent_likelihoods.get(feature, default)
+                                         for feature, count in message_features.items())
+        best = max(scores, key=scores.get)
+        top = scores[best]
+        confidence = 1.0 / sum(math.exp(score - top) for score in scores.values())
+        return best, confidence
+
+    def route(self, message: str) -> Optional[Tuple[str, float]]:
+        """(intent, confidence) when the message can be answered offline, else None"""
+        if not self.enabled or not message or not message.strip():
+            return None
+        with self._lock:
+            self._stats['messages'] += 1
+        if is_urgent(message):
+            self._count('urgent')
+            return None
+        if len(message.split()) > self.max_words:
+            self._count('too_long')
+            return None
+        intent, confidence = self.classify(message)
+        threshold = self.topic_threshold if intent in TOPIC_INTENTS else self.threshold
+        if intent == OTHER or confidence < threshold:
+            self._count('low_confidence')
+            return None
+        if intent in TOPIC_INTENTS and intent not in fallback_matcher.topics(message, limit=len(TOPIC_INTENTS)):
+            self._count('no_topic_keyword')
+            return None
+        if intent in TOPIC_INTENTS and has_details(message):
+            self._count('specific_details')
+            return None
+        with self._lock:
+            self._stats['routed'] += 1
+            self._stats['intents'][intent] = self._stats['intents'].get(intent, 0) + 1
+        return intent, confidence
+
+    def _count(self, stat: str):
+        with self._lock:
+            self._stats[stat] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats, intents=dict(self._stats['intents']))
+        stats['enabled'] = self.enabled
+        stats['absorbed_share'] = round(stats['routed'] / stats['messages'], 3) if stats['messages'] else 0.0
+        return stats
+
+
+def create_intent_router() -> IntentRouter:
+    """Create the router from environment configuration"""
+    return IntentRouter(
+        enabled=os.getenv('CHATBOT_INTENT_ROUTER', 'true').lower() == 'true',
+        threshold=float(os.getenv('CHATBOT_INTENT_THRESHOLD', '0.85')),
+        topic_threshold=float(os.getenv('CHATBOT_INTENT_TOPIC_THRESHOLD', '0.92')),
+        max_words=int(os.getenv('CHATBOT_INTENT_MAX_WORDS', '8'))
+    )
+
+
+# Shared by every chatbot instance in the process; retrained from db.conversations once MongoDB is up
+intent_router = create_intent_router()
@@ -0,0 +1,283 @@
+"""
+Local veterinary knowledge index.
+
+At startup app.py turns its knowledge tables (TREATMENT_DATABASE,
+MOCK_DISEASE_DATABASE and FALLBACK_DISEASE_DATABASE) into one passage per
+animal and disease and indexes them here with BM25. The chatbot searches the
+index to answer from the knowledge base when Gemini is unavailable, and puts
+the best passages into the prompt when it is, so answers build on the same
+treatments the rest of the app recommends.
+"""
+import os
+import re
+import math
+import logging
+import threading
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from prompt_budget import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+_TOKEN = re.compile(r'[a-z0-9]+')
+
+STOPWORDS = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'can', 'do', 'does', 'for', 'from', 'has', 'have', 'how',
+    'i', 'in', 'is', 'it', 'its', 'my', 'of', 'on', 'or', 'our', 'should', 'so', 'that', 'the', 'this', 'to',
+    'was', 'what', 'when', 'which', 'who', 'why', 'will', 'with', 'you', 'your', 'me', 'we', 'he', 'she',
+    'his', 'her', 'they', 'them', 'there', 'been', 'very', 'since', 'days', 'day', 'please', 'help'
+}
+
+# The tables name animals differently ('cattle' in one, 'cow' in another); passages use the first spelling here
+ANIMAL_ALIASES = {
+    'cow': 'cow', 'cows': 'cow', 'cattle': 'cow', 'bull': 'cow', 'calf': 'cow', 'calves': 'cow', 'bovine': 'cow',
+    'buffalo': 'cow', 'buffaloes': 'cow', 'dog': 'dog', 'dogs': 'dog', 'puppy': 'dog', 'canine': 'dog',
+    'cat': 'cat', 'cats': 'cat', 'kitten': 'cat', 'feline': 'cat', 'sheep': 'sheep', 'lamb': 'sheep',
+    'ewe': 'sheep', 'ram': 'sheep', 'goat': 'goat', 'goats': 'goat', 'kid': 'goat', 'pig': 'pig', 'pigs': 'pig',
+    'swine': 'pig', 'piglet': 'pig', 'chicken': 'chicken', 'chickens': 'chicken', 'hen': 'chicken',
+    'poultry': 'chicken', 'horse': 'horse', 'horses': 'horse', 'pony': 'horse', 'equine': 'horse'
+}
+
+
+def _stem(word: str) -> str:
+    """Light suffix stripping so 'coughing', 'coughs' and 'cough' meet in the index"""
+    if len(word) > 5 and word.endswith('ing'):
+        return word[:-3]
+    if len(word) > 4 and word.endswith('ies'):
+        return word[:-3] + 'y'
+    if len(word) > 3 and word.endswith('s') and not word.endswith(('ss', 'us', 'is')):
+        return word[:-1]
+    return word
+
+
+def tokenize(text: str) -> List[str]:
+    return [_stem(word) for word in _TOKEN.findall((text or '').lower()) if word not in STOPWORDS]
+
+
+def detect_animals(text: str) -> List[str]:
+    """Animals named in the text, as passage animal keys"""
+    animals = []
+    for word in _TOKEN.findall((text or '').lower()):
+        animal = ANIMAL_ALIASES.get(word)
+        if animal and animal not in animals:
+            animals.append(animal)
+    return animals
+
+
+def without_animals(text: str) -> str:
+    """The text's words other than animal names"""
+    return ' '.join(word for word in _TOKEN.findall((text or '').lower()) if word not in ANIMAL_ALIASES)
+
+
+class BM25Index:
+    """Okapi BM25 over a fixed list of passages (dicts with at least a 'text' key)"""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.passages: List[Dict[str, Any]] = []
+        self._postings: Dict[str, List[Tuple[int, int]]] = {}
+        self._lengths: List[int] = []
+        self._idf: Dict[str, float] = {}
+        self._average_length = 0.0
+
+    def build(self, passages: Iterable[Dict[str, Any]]) -> 'BM25Index':
+        self.passages = list(passages)
+        postings: Dict[str, List[Tuple[int, int]]] = {}
+        self._lengths = []
+        for position, passage in enumerate(self.passages):
+            terms = Counter(tokenize(passage.get('index_text') or passage['text']))
+            self._lengths.append(sum(terms.values()))
+            for term, count in terms.items():
+                postings.setdefault(term, []).append((position, count))
+        self._postings = postings
+        total = len(self.passages)
+        self._average_length = (sum(self._lengths) / total) if total else 0.0
+        self._idf = {term: math.log(1 + (total - len(hits) + 0.5) / (len(hits) + 0.5))
+                     for term, hits in postings.items()}
+        return self
+
+    def __len__(self):
+        return len(self.passages)
+
+    @property
+    def vocabulary(self) -> int:
+        return len(self._postings)
+
+    def scores(self, query: str) -> Dict[int, float]:
+        """BM25 score of every passage sharing a term with the query"""
+        scores: Dict[int, float] = {}
+        if not self.passages:
+            return scores
+        k1, b, average = self.k1, self.b, self._average_length or 1.0
+        for term in set(tokenize(query)):
+            idf = self._idf.get(term)
+            if idf is None:
+                continue
+            for position, count in self._postings[term]:
+                norm = k1 * (1 - b + b * self._lengths[position] / average)
+                scores[position] = scores.get(position, 0.0) + idf * count * (k1 + 1) / (count + norm)
+        return scores
+
+    def search(self, query: str, limit: int = 3, min_score: float = 0.0) -> List[Tuple[float, Dict[str, Any]]]:
+        ranked = sorted(((score, position) for position, score in self.scores(query).items() if score >= min_score),
+                        reverse=True)
+        return [(score, self.passages[position]) for score, position in ranked[:limit]]
+
+
+def _humanize(key: str) -> str:
+    return key.replace('_', ' ')
+
+
+def veterinary_passages(treatments: Dict[str, Any], mock_diseases: Dict[str, Any],
+                        fallback_diseases: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """One passage per animal and disease, merging what each table knows about it"""
+    merged: Dict[Tuple[str, str], Dict[str, Any]] = {}
+
+    def entry(animal: str, disease: str) -> Dict[str, Any]:
+        animal = ANIMAL_ALIASES.get(animal, animal)
+        key = (animal, disease.lower())
+        if key not in merged:
+            merged[key] = {'animal': animal, 'disease': disease, 'signs': [], 'visual_signs': [], 'about': [],
+                           'medicines': [], 'urgency': None}
+        return merged[key]
+
+    for animal, diseases in treatments.items():
+        for disease, info in diseases.items():
+            if disease.lower() == 'healthy':
+                continue
+            item = entry(animal, disease)
+            item['about'].extend(text for text in (info.get('description'), info.get('treatment')) if text)
+            item['medicines'].extend(info.get('medicines', []))
+
+    for animal, data in mock_diseases.items():
+        for disease in data.get('diseases', []):
+            entry(animal, disease)
+        for symptom, diseases in data.get('symptoms_map', {}).items():
+            for disease in diseases:
+                signs = entry(animal, disease)['signs']
+                if _humanize(symptom) not in signs:
+                    signs.append(_humanize(symptom))
+
+    for animal, diseases in fallback_diseases.items():
+        for info in diseases.values():
+            item = entry(animal, info['name'])
+            item['signs'].extend(sign for sign in info.get('symptoms', []) if sign not in item['signs'])
+            item['visual_signs'].extend(info.get('visual_signs', []))
+            item['urgency'] = info.get('urgency')
+
+    passages = []
+    for (animal, _), item in sorted(merged.items()):
+        lines = [f"**{item['disease']} ({animal})**"]
+        if item['signs']:
+            lines.append(f"Signs: {', '.join(item['signs'])}")
+        if item['visual_signs']:
+            lines.append(f"Visible signs: {', '.join(item['visual_signs'])}")
+        if item['about']:
+            lines.append(' '.join(f"{text.rstrip('.')}." for text in item['about']))
+        if item['medicines']:
+            lines.append("Commonly used: " + '; '.join(
+                f"{medicine['name']} ({medicine.get('type', 'medicine')}, {medicine.get('dosage', 'as prescribed')})"
+                for medicine in item['medicines'][:3]))
+        if item['urgency']:
+            lines.append(f"See a vet: {item['urgency']}")
+        text = '\n'.join(lines)
+        passages.append({
+            'id': f"{animal}/{item['disease'].lower()}",
+            'animal': animal,
+            'disease': item['disease'],
+            'text': text,
+            # The disease and animal names count twice, so a query naming them finds the passage first
+            'index_text': f"{item['disease']} {animal} {text}"
+        })
+    return passages
+
+
+class KnowledgeIndex:
+    """The veterinary knowledge passages with BM25 search, biased towards the animal asked about"""
+
+    def __init__(self, enabled: bool = True, min_score: float = 3.0, prompt_min_score: float = 2.0,
+                 prompt_tokens: int = 350, other_animal_weight: float = 0.4):
+        self.enabled = enabled
+        # Answering on its own needs a clearer match than adding reference notes to a prompt
+        self.min_score = min_score
+        self.prompt_min_score = prompt_min_score
+        self.prompt_tokens = prompt_tokens
+        self.other_animal_weight = other_animal_weight
+        self.index = BM25Index()
+        self._lock = threading.Lock()
+        self._stats = {'searches': 0, 'hits': 0, 'offline_answers': 0, 'prompt_injections': 0}
+
+    def build(self, passages: List[Dict[str, Any]]):
+        self.index = BM25Index().build(passages)
+        logger.info(f" Knowledge index built: {len(self.index)} passages, {self.index.vocabulary} terms")
+
+    @property
+    def ready(self) -> bool:
+        return self.enabled and len(self.index) > 0
+
+    def count(self, stat: str):
+        with self._lock:
+            self._stats[stat] += 1
+
+    def search(self, query: str, limit: int = 3, min_score: Optional[float] = None) -> List[Tuple[float, Dict[str, Any]]]:
+        """Best passages for the query; passages about other animals than the one asked about score lower.
+
+        The threshold applies to the score of the query without its animal
+        names: an animal name alone scores 3-5 against every passage about
+        that animal, so "my goat is sad" would otherwise find goat pneumonia.
+        """
+        if not self.ready or not query:
+            return []
+        animals = detect_animals(query)
+        scores = self.index.scores(query)
+        topic_scores = self.index.scores(without_animals(query)) if animals else scores
+        if animals:
+            for position in scores:
+                if self.index.passages[position]['animal'] not in animals:
+                    scores[position] *= self.other_animal_weight
+                    if position in topic_scores:
+                        topic_scores[position] *= self.other_animal_weight
+        threshold = self.min_score if min_score is None else min_score
+        ranked = sorted(((score, position) for position, score in scores.items()
+                         if topic_scores.get(position, 0.0) >= threshold), reverse=True)
+        results = [(score, self.index.passages[position]) for score, position in ranked[:limit]]
+        with self._lock:
+            self._stats['searches'] += 1
+            self._stats['hits'] += 1 if results else 0
+        return results
+
+    def context(self, query: str, max_tokens: Optional[int] = None, limit: int = 3) -> str:
+        """Best passages as one text block within `max_tokens`, best first; empty when nothing matches"""
+        max_tokens = self.prompt_tokens if max_tokens is None else max_tokens
+        block = []
+        for _, passage in self.search(query, limit, min_score=self.prompt_min_score):
+            if estimate_tokens('\n\n'.join(block + [passage['text']])) > max_tokens:
+                break
+            block.append(passage['text'])
+        return '\n\n'.join(block)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        stats['enabled'] = self.enabled
+        stats['passages'] = len(self.index)
+        stats['terms'] = self.index.vocabulary
+        stats['hit_rate'] = round(stats['hits'] / stats['searches'], 3) if stats['searches'] else 0.0
+        return stats
+
+
+def create_knowledge_index() -> KnowledgeIndex:
+    """Create the (empty) index from environment configuration; app.py fills it at startup"""
+    return KnowledgeIndex(
+        enabled=os.getenv('KNOWLEDGE_INDEX', 'true').lower() == 'true',
+        min_score=float(os.getenv('KNOWLEDGE_MIN_SCORE', '3.0')),
+        prompt_min_score=float(os.getenv('KNOWLEDGE_PROMPT_MIN_SCORE', '2.0')),
+        prompt_tokens=int(os.getenv('KNOWLEDGE_PROMPT_TOKENS', '350')),
+        other_animal_weight=float(os.getenv('KNOWLEDGE_OTHER_ANIMAL_WEIGHT', '0.4'))
+    )
+
+
+# Shared by app.py, which builds it, and the chatbot, which searches it
+knowledge_index = create_knowledge_index()
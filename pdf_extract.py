@@ -0,0 +1,60 @@
+"""
+PDF page-range text extraction, run in the PDF worker processes.
+
+Kept free of the app's other modules so a spawned worker only has to
+import PyPDF2.
+"""
+import io
+import re
+import time
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+
+import PyPDF2
+
+_BLANK_RUNS = re.compile(r'[ \t]+')
+_LINE_RUNS = re.compile(r'\n\s*\n+')
+
+# Opening a reader walks the whole page tree, so each process keeps its last few by content hash
+_READERS: 'OrderedDict[str, PyPDF2.PdfReader]' = OrderedDict()
+_MAX_READERS = 2
+
+
+def clean_page_text(text: str) -> str:
+    """Collapse the runs of spaces and empty lines PDF extraction leaves behind"""
+    text = _BLANK_RUNS.sub(' ', text or '')
+    return _LINE_RUNS.sub('\n\n', text).strip()
+
+
+def count_pages(pdf_bytes: bytes) -> int:
+    return len(PyPDF2.PdfReader(io.BytesIO(pdf_bytes)).pages)
+
+
+def _reader(digest: str, pdf_bytes: bytes) -> PyPDF2.PdfReader:
+    reader = _READERS.get(digest)
+    if reader is None:
+        reader = _READERS[digest] = PyPDF2.PdfReader(io.BytesIO(pdf_bytes))
+        while len(_READERS) > _MAX_READERS:
+            _READERS.popitem(last=False)
+    else:
+        _READERS.move_to_end(digest)
+    return reader
+
+
+def extract_page_range(digest: str, pdf_bytes: bytes, start: int, stop: int, cpu_limit: float) -> Dict:
+    """Text of pages start..stop-1 (0-based), stopping after the page that uses up `cpu_limit` CPU seconds.
+
+    Returns {'pages': [(page number, text), ...], 'cpu': seconds used, 'complete': whether the range was finished}.
+    """
+    started = time.process_time()
+    reader = _reader(digest, pdf_bytes)
+    pages: List[Tuple[int, str]] = []
+    for index in range(start, stop):
+        try:
+            text = reader.pages[index].extract_text() or ''
+        except Exception:
+            text = ''  # An unreadable page should not cost the rest of the range
+        pages.append((index + 1, clean_page_text(text)))
+        if time.process_time() - started > cpu_limit:
+            break
+    return {'pages': pages, 'cpu': time.process_time() - started, 'complete': len(pages) == stop - start}
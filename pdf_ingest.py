@@ -0,0 +1,314 @@
+"""
+PDF ingestion for document questions in the chat.
+
+Pages are cut into sentence-aligned chunks that never cross a page, so each
+chunk can be cited by page. A small BM25 index over a document's chunks picks
+the chunks most relevant to the question, up to the prompt's document
+budget, instead of sending only the first part of the file: findings on
+page 8 of a lab report reach the model.
+
+Text extraction runs in a process pool, a range of pages per task, so a
+multi-hundred-page herd record does not hold a request thread for the whole
+parse. It stops once the pages read hold enough text matching the question
+to fill the budget, or when the document's CPU-time budget is spent; a later
+question about the same file carries on from the last page read. Parsed
+documents are cached by content hash, so another question about the same
+upload does not parse it again, and follow-up chat questions in the session
+can draw on the matching chunks.
+"""
+import os
+import time
+import atexit
+import hashlib
+import logging
+import threading
+import multiprocessing
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from prompt_budget import estimate_tokens
+from knowledge_index import BM25Index, tokenize
+from translation_service import split_into_chunks
+
+logger = logging.getLogger(__name__)
+
+try:
+    from pdf_extract import extract_page_range, count_pages
+    PDF_AVAILABLE = True
+except ImportError:
+    PDF_AVAILABLE = False
+
+# Page label and separator around each chunk in the prompt
+_CHUNK_OVERHEAD_TOKENS = 10
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def chunk_page(number: int, text: str, chunk_chars: int) -> List[Dict[str, Any]]:
+    """Sentence-aligned chunks of at most `chunk_chars` from one page"""
+    parts = split_into_chunks(text, chunk_chars) if text else []
+    return [{'page': number, 'text': part.strip(), 'tokens': estimate_tokens(part), 'terms': frozenset(tokenize(part))}
+            for part in parts if part.strip()]
+
+
+class PDFDocument:
+    """A PDF read up to some page: its chunks, a BM25 index over them and chunk selection for a question"""
+
+    def __init__(self, digest: str, pages: int):
+        self.digest = digest
+        self.pages = pages
+        self.pages_read = 0
+        self.chunks: List[Dict[str, Any]] = []
+        self.tokens = 0
+        self.cpu_used = 0.0
+        self.lock = threading.RLock()
+        self._index: Optional[BM25Index] = None
+
+    @property
+    def complete(self) -> bool:
+        return self.pages_read >= self.pages
+
+    @property
+    def index(self) -> BM25Index:
+        with self.lock:
+            if self._index is None:
+                self._index = BM25Index().build(self.chunks)
+            return self._index
+
+    def add_pages(self, pages: List[Tuple[int, str]], chunk_chars: int):
+        with self.lock:
+            for number, text in pages:
+                chunks = chunk_page(number, text, chunk_chars)
+                self.chunks.extend(chunks)
+                self.tokens += sum(chunk['tokens'] for chunk in chunks)
+                self.pages_read = number
+            self._index = None
+
+    def enough_for(self, question: str, max_tokens: Optional[int]) -> bool:
+        """Whether the pages read so far can fill `max_tokens` with chunks matching the question"""
+        if self.complete:
+            return True
+        if max_tokens is None:
+            return False
+        terms = set(tokenize(question))
+        matching = sum(chunk['tokens'] + _CHUNK_OVERHEAD_TOKENS for chunk in self.chunks if terms & chunk['terms'])
+        return matching >= max_tokens
+
+    @staticmethod
+    def render(chunks: List[Dict[str, Any]]) -> str:
+        return '\n\n'.join(f"[Page {chunk['page']}]\n{chunk['text']}" for chunk in chunks)
+
+    def select(self, question: str, max_tokens: int, matching_only: bool = False) -> Tuple[str, bool]:
+        """The most relevant chunks for the question within `max_tokens`, in page order, and whether any were left out.
+
+        With ``matching_only`` (follow-up questions) only chunks sharing terms with the question are used.
+        """
+        with self.lock:
+            return self._select(question, max_tokens, matching_only)
+
+    def _select(self, question: str, max_tokens: int, matching_only: bool) -> Tuple[str, bool]:
+        scores = self.index.scores(question)
+        if matching_only:
+            order = sorted(scores, key=lambda position: (-scores[position], position))
+        elif self.complete and self.tokens + _CHUNK_OVERHEAD_TOKENS * len(self.chunks) <= max_tokens:
+            return self.render(self.chunks), False
+        else:
+            # The opening chunk usually names the animal, owner and report type; then by relevance, then page order
+            order = [0] + sorted(range(1, len(self.chunks)), key=lambda position: (-scores.get(position, 0.0), position))
+        chosen, used = [], 0
+        for position in order:
+            chunk_tokens = self.chunks[position]['tokens'] + _CHUNK_OVERHEAD_TOKENS
+            if used + chunk_tokens > max_tokens:
+                continue
+            chosen.append(position)
+            used += chunk_tokens
+        left_out = len(chosen) < len(self.chunks) or not self.complete
+        return self.render([self.chunks[position] for position in sorted(chosen)]), left_out
+
+
+def default_start_method() -> str:
+    """forkserver where available, else spawn: forking a threaded web worker can copy locks held by other threads"""
+    return 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+
+class PDFIngestor:
+    """Parses uploaded PDFs into PDFDocuments in a process pool, keeping the most recent ones by content hash"""
+
+    def __init__(self, chunk_tokens: int = 250, cache_documents: int = 32, followup_tokens: int = 600,
+                 workers: int = 2, range_pages: int = 16, cpu_budget: float = 20.0, start_method: Optional[str] = None):
+        self.chunk_chars = chunk_tokens * 4
+        self.cache_documents = cache_documents
+        # Cap on document excerpts added to follow-up chat questions
+        self.followup_tokens = followup_tokens
+        self.workers = workers
+        self.range_pages = range_pages
+        self.cpu_budget = cpu_budget
+        self.start_method = start_method
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._shutdown_registered = False
+        self._cache: 'OrderedDict[str, PDFDocument]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'documents': 0, 'cache_hits': 0, 'resumed': 0, 'pages': 0, 'early_stops': 0,
+                       'cpu_budget_stops': 0, 'extract_seconds': 0.0, 'pool_failures': 0}
+
+    def _count(self, stat: str, amount=1):
+        with self._lock:
+            self._stats[stat] += amount
+
+    def _executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                context = multiprocessing.get_context(self.start_method or default_start_method())
+                if context.get_start_method() == 'forkserver':
+                    # The server imports only the extractor, not the app's __main__ module
+                    context.set_forkserver_preload(['pdf_extract'])
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+                if not self._shutdown_registered:
+                    atexit.register(self.shutdown)
+                    self._shutdown_registered = True
+            return self._pool
+
+    def shutdown(self, wait: bool = True):
+        """Stop the worker processes; the next document that needs them starts a new pool"""
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=wait, cancel_futures=True)
+
+    def cached(self, digest: str) -> Optional[PDFDocument]:
+        """A recently parsed document by content hash, without parsing anything"""
+        with self._lock:
+            return self._cache.get(digest)
+
+    def load(self, pdf_bytes: bytes, question: str = '', max_tokens: Optional[int] = None) -> PDFDocument:
+        """The document for these bytes, read far enough to fill `max_tokens` with text matching the question.
+
+        Without `max_tokens` the whole document is read (CPU budget permitting).
+        """
+        digest = content_hash(pdf_bytes)
+        with self._lock:
+            document = self._cache.get(digest)
+            if document is not None:
+                self._cache.move_to_end(digest)
+        if document is None:
+            document = PDFDocument(digest, count_pages(pdf_bytes))
+            with self._lock:
+                document = self._cache.setdefault(digest, document)
+                while len(self._cache) > self.cache_documents:
+                    self._cache.popitem(last=False)
+            self._count('documents')
+        elif document.pages_read:
+            if document.enough_for(question, max_tokens) or document.cpu_used >= self.cpu_budget:
+                self._count('cache_hits')
+                return document
+            self._count('resumed')
+
+        with document.lock:
+            # Another request may have read further while this one waited
+            if not document.enough_for(question, max_tokens) and document.cpu_used < self.cpu_budget:
+                self._extract(pdf_bytes, document, question, max_tokens)
+        return document
+
+    def _serial_ranges(self, digest: str, pdf_bytes: bytes, ranges: List[Tuple[int, int]],
+                       cpu_left: Callable[[], float]) -> Iterator[Dict[str, Any]]:
+        for start, stop in ranges:
+            yield extract_page_range(digest, pdf_bytes, start, stop, cpu_left())
+
+    def _parallel_ranges(self, digest: str, pdf_bytes: bytes, ranges: List[Tuple[int, int]],
+                         cpu_left: Callable[[], float]) -> Iterator[Dict[str, Any]]:
+        """Range results in page order, with a few ranges in flight ahead of the one being consumed"""
+        pool = self._executor()
+        window = self.workers * 2
+        upcoming = deque(ranges)
+        pending = deque()
+
+        def submit():
+            start, stop = upcoming.popleft()
+            # In-flight ranges share what is left of the budget
+            pending.append(pool.submit(extract_page_range, digest, pdf_bytes, start, stop,
+                                       max(0.05, cpu_left() / window)))
+
+        try:
+            while upcoming and len(pending) < window:
+                submit()
+            while pending:
+                result = pending.popleft().result()
+                if upcoming:
+                    submit()
+                yield result
+        finally:
+            # Early stop: ranges not yet started are dropped, running ones end at their CPU limit
+            for future in pending:
+                future.cancel()
+
+    def _extract(self, pdf_bytes: bytes, document: PDFDocument, question: str, max_tokens: Optional[int],
+                 use_pool: bool = True):
+        started = time.perf_counter()
+        first_page = document.pages_read
+        ranges = [(start, min(start + self.range_pages, document.pages))
+                  for start in range(document.pages_read, document.pages, self.range_pages)]
+        cpu_left = lambda: self.cpu_budget - document.cpu_used
+        parallel = use_pool and self.workers > 1 and len(ranges) > 1
+        results = (self._parallel_ranges if parallel else self._serial_ranges)(document.digest, pdf_bytes, ranges, cpu_left)
+        stop_reason = None
+        try:
+            for result in results:
+                document.add_pages(result['pages'], self.chunk_chars)
+                document.cpu_used += result['cpu']
+                if document.complete:
+                    break
+                if not result['complete'] or document.cpu_used >= self.cpu_budget:
+                    stop_reason = 'CPU budget spent'
+                    self._count('cpu_budget_stops')
+                    break
+                if document.enough_for(question, max_tokens):
+                    stop_reason = 'enough text for the question'
+                    self._count('early_stops')
+                    break
+        except Exception as e:
+            # A broken pool (killed worker, no fork support) is replaced for the next document;
+            # this one is read in this process
+            if not parallel:
+                raise
+            logger.warning(f" PDF worker pool failed ({e}); reading the rest in-process")
+            self._count('pool_failures')
+            results.close()
+            self.shutdown(wait=False)
+            return self._extract(pdf_bytes, document, question, max_tokens, use_pool=False)
+        finally:
+            results.close()
+
+        elapsed = time.perf_counter() - started
+        self._count('pages', document.pages_read - first_page)
+        self._count('extract_seconds', elapsed)
+        logger.info(f" PDF pages {first_page + 1}-{document.pages_read} of {document.pages} read in {elapsed:.2f}s "
+                    f"({document.cpu_used:.2f}s CPU, {len(document.chunks)} chunks)"
+                    + (f", stopped: {stop_reason}" if stop_reason else ""))
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['cached_documents'] = len(self._cache)
+        stats['extract_seconds'] = round(stats['extract_seconds'], 3)
+        stats['pages_per_second'] = (round(stats['pages'] / stats['extract_seconds'], 1)
+                                     if stats['extract_seconds'] else 0.0)
+        return stats
+
+
+def create_pdf_ingestor() -> PDFIngestor:
+    """Create the ingestor from environment configuration"""
+    return PDFIngestor(
+        chunk_tokens=int(os.getenv('PDF_CHUNK_TOKENS', '250')),
+        cache_documents=int(os.getenv('PDF_CACHE_DOCUMENTS', '32')),
+        followup_tokens=int(os.getenv('PDF_FOLLOWUP_TOKENS', '600')),
+        workers=int(os.getenv('PDF_WORKERS', '2')),
+        range_pages=int(os.getenv('PDF_RANGE_PAGES', '16')),
+        cpu_budget=float(os.getenv('PDF_CPU_BUDGET_SECONDS', '20')),
+        start_method=os.getenv('PDF_WORKER_START_METHOD') or None
+    )
+
+
+pdf_ingestor = create_pdf_ingestor()
@@ -0,0 +1,75 @@
+import threading
+from collections import deque
+from typing import Dict, Any
+
+# Tiers that can answer an integrated prediction, cheapest first
+TIER_LOCAL = 'local'
+TIER_GEMINI = 'gemini'
+TIER_FALLBACK = 'fallback'
+
+
+class PredictionTierStats:
+    """Per-tier counters for the integrated prediction pipeline.
+
+    Tracks how many requests each tier answered, their latency and how many
+    Gemini calls were avoided by answering locally.
+    """
+
+    def __init__(self, latency_window: int = 200):
+        self._lock = threading.Lock()
+        self._latency_window = latency_window
+        self._tiers: Dict[str, Dict[str, Any]] = {}
+        self.gemini_calls_saved = 0
+        self.escalations = 0
+        self.events: Dict[str, int] = {}
+
+    def _tier(self, tier: str) -> Dict[str, Any]:
+        if tier not in self._tiers:
+            self._tiers[tier] = {
+                'answered': 0,
+                'total_latency': 0.0,
+                'latencies': deque(maxlen=self._latency_window)
+            }
+        return self._tiers[tier]
+
+    def record(self, tier: str, latency: float, gemini_calls_saved: int = 0, escalated: bool = False):
+        """Record one answered request"""
+        with self._lock:
+            entry = self._tier(tier)
+            entry['answered'] += 1
+            entry['total_latency'] += latency
+            entry['latencies'].append(latency)
+            self.gemini_calls_saved += gemini_calls_saved
+            if escalated:
+                self.escalations += 1
+
+    def record_event(self, name: str):
+        """Count a pipeline event such as a deadline miss"""
+        with self._lock:
+            self.events[name] = self.events.get(name, 0) + 1
+
+    @staticmethod
+    def _percentile(values, fraction: float) -> float:
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            total = sum(entry['answered'] for entry in self._tiers.values())
+            tiers = {}
+            for name, entry in self._tiers.items():
+                latencies = list(entry['latencies'])
+                tiers[name] = {
+                    'answered': entry['answered'],
+                    'share': round(entry['answered'] / total, 3) if total else 0.0,
+                    'avg_latency': round(entry['total_latency'] / entry['answered'], 3) if entry['answered'] else 0.0,
+                    'p50_latency': round(self._percentile(latencies, 0.5), 3) if latencies else 0.0,
+                    'p90_latency': round(self._percentile(latencies, 0.9), 3) if latencies else 0.0
+                }
+            return {
+                'total': total,
+                'escalations': self.escalations,
+                'gemini_calls_saved': self.gemini_calls_saved,
+                'events': dict(self.events),
+                'tiers': tiers
+            }
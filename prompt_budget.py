@@ -0,0 +1,234 @@
+import os
+import re
+import math
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+from quota_ledger import quota_ledger
+
+logger = logging.getLogger(__name__)
+
+# Gemini bills a small image as one 258-token tile and larger images per 768x768 tile
+IMAGE_TILE_TOKENS = 258
+IMAGE_TILE_SIZE = 768
+
+_SENTENCE_END = re.compile(r'(?<=[.!?।])\s+|\n+')
+_TRUNCATION_MARKER = "\n[... document truncated to fit the prompt budget ...]"
+
+
+def estimate_tokens(text: Optional[str]) -> int:
+    """
+    Local token estimate without a tokenizer round-trip: about 4 characters per token
+    for Latin script and about 1.5 for Indic and other non-ASCII scripts.
+    """
+    if not text:
+        return 0
+    non_ascii = sum(1 for ch in text if ord(ch) > 127)
+    return math.ceil((len(text) - non_ascii) / 4 + non_ascii / 1.5)
+
+
+def estimate_image_tokens(width: Optional[int] = None, height: Optional[int] = None) -> int:
+    if not width or not height or max(width, height) <= 384:
+        return IMAGE_TILE_TOKENS
+    tiles = math.ceil(width / IMAGE_TILE_SIZE) * math.ceil(height / IMAGE_TILE_SIZE)
+    return tiles * IMAGE_TILE_TOKENS
+
+
+def trim_to_tokens(text: str, max_tokens: int, marker: str = _TRUNCATION_MARKER) -> str:
+    """Keep the start of text within max_tokens, cutting at a sentence or line boundary"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    if max_tokens <= 0:
+        return ''
+
+    kept: List[str] = []
+    used = estimate_tokens(marker)
+    position = 0
+    for match in _SENTENCE_END.finditer(text):
+        piece = text[position:match.end()]
+        cost = estimate_tokens(piece)
+        if used + cost > max_tokens:
+            break
+        kept.append(piece)
+        used += cost
+        position = match.end()
+
+    if not kept:
+        # A single sentence is over budget: hard cut, leaving room for the marker unless it alone is over budget
+        room = max_tokens - estimate_tokens(marker)
+        if room <= 0:
+            marker, room = '', max_tokens
+        cut = int(len(text) * room / max(1, estimate_tokens(text)))
+        # The ratio is an average; scripts mixed unevenly through the text can still be over by a few tokens
+        while cut > 0 and estimate_tokens(text[:cut]) > room:
+            cut -= max(1, cut // 20)
+        return text[:cut].rstrip() + marker
+    return ''.join(kept).rstrip() + marker
+
+
+def fit_recent(items: List[Any], max_tokens: int, render: Callable[[Any], str]) -> List[Any]:
+    """Newest items (in original order) whose rendered text fits in max_tokens"""
+    selected = []
+    used = 0
+    for item in reversed(items):
+        cost = estimate_tokens(render(item))
+        if used + cost > max_tokens:
+            break
+        selected.append(item)
+        used += cost
+    selected.reverse()
+    return selected
+
+
+class _CallUsage:
+    def __init__(self, feature: str, user_id: Optional[str]):
+        self.feature = feature
+        self.user_id = user_id
+        self.estimated_input = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.calls = 0
+        self.trimmed = False
+
+
+_current_call: contextvars.ContextVar = contextvars.ContextVar('gemini_call_usage', default=None)
+
+
+class TokenBudget:
+    """Prompt budgets and token accounting for Gemini calls.
+
+    Callers estimate prompts locally and trim context and documents to the
+    per-call budget before sending. Each request runs inside ``scope()``; the
+    rate limiters report the real usage_metadata of every response into the
+    active scope, which is charged to the user's persisted daily total and to
+    per-feature counters.
+    """
+
+    def __init__(self):
+        self.max_prompt_tokens = int(os.getenv('GEMINI_MAX_PROMPT_TOKENS', '8000'))
+        # Share of the per-call budget a document or conversation context may take
+        self.document_share = float(os.getenv('GEMINI_DOCUMENT_BUDGET_SHARE', '0.7'))
+        self.history_share = float(os.getenv('GEMINI_HISTORY_BUDGET_SHARE', '0.3'))
+        # Cap for a single free-text form field (symptom notes, treatment history)
+        self.max_field_tokens = int(os.getenv('GEMINI_MAX_FIELD_TOKENS', '400'))
+        self.user_daily_tokens = int(os.getenv('GEMINI_USER_DAILY_TOKEN_BUDGET', '200000'))
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def document_budget(self, surrounding_text: str = '') -> int:
+        """Tokens a document may use next to the rest of the prompt"""
+        return max(0, int(self.max_prompt_tokens * self.document_share) - estimate_tokens(surrounding_text))
+
+    def history_budget(self, prompt_without_history: str) -> int:
+        """Tokens conversation context may use next to the rest of the prompt"""
+        remaining = self.max_prompt_tokens - estimate_tokens(prompt_without_history)
+        return max(0, min(int(self.max_prompt_tokens * self.history_share), remaining))
+
+    def user_remaining(self, user_id: Optional[str]) -> Optional[int]:
+        """Tokens left in the user's daily budget (None when unlimited or anonymous)"""
+        if not user_id or self.user_daily_tokens <= 0:
+            return None
+        return max(0, self.user_daily_tokens - quota_ledger.user_tokens_today(user_id))
+
+    def allows_user(self, user_id: Optional[str], estimated_tokens: int = 0) -> bool:
+        remaining = self.user_remaining(user_id)
+        return remaining is None or remaining > estimated_tokens
+
+    def _counters(self, feature: str) -> Dict[str, int]:
+        return self._stats.setdefault(feature, {
+            'requests': 0, 'calls': 0, 'estimated_input_tokens': 0, 'input_tokens': 0,
+            'output_tokens': 0, 'trimmed': 0, 'rejected': 0, 'over_budget': 0
+        })
+
+    def reject(self, feature: str, reason: str):
+        """Count a request refused for budget reasons"""
+        logger.info(f" {feature} request refused: {reason}")
+        with self._lock:
+            self._counters(feature)['rejected'] += 1
+
+    @contextmanager
+    def scope(self, feature: str, user_id: Optional[str] = None):
+        """Attribute every Gemini response inside the block to feature and user"""
+        usage = _CallUsage(feature, str(user_id) if user_id else None)
+        token = _current_call.set(usage)
+        try:
+            yield usage
+        finally:
+            _current_call.reset(token)
+            with self._lock:
+                counters = self._counters(feature)
+                counters['requests'] += 1
+                counters['calls'] += usage.calls
+                counters['estimated_input_tokens'] += usage.estimated_input
+                counters['input_tokens'] += usage.input_tokens
+                counters['output_tokens'] += usage.output_tokens
+                counters['trimmed'] += int(usage.trimmed)
+            if usage.calls:
+                logger.info(f" {feature}: ~{usage.estimated_input} tokens estimated, "
+                            f"{usage.input_tokens} in / {usage.output_tokens} out over {usage.calls} call(s)")
+
+    def trim_field(self, text: Optional[str]) -> Optional[str]:
+        """Trim one free-text field to the per-field budget"""
+        if not text:
+            return text
+        trimmed = trim_to_tokens(text, self.max_field_tokens, marker=' [...]')
+        if trimmed != text:
+            self.mark_trimmed()
+        return trimmed
+
+    def mark_trimmed(self):
+        """Note that context or a document was cut to fit the active request's budget"""
+        usage = _current_call.get()
+        if usage is not None:
+            usage.trimmed = True
+
+    def note_prompt(self, prompt: str, extra_tokens: int = 0) -> int:
+        """Record the local estimate of a prompt about to be sent; returns the estimate.
+
+        Advisory: the budget is enforced where prompts are built (document_budget, history_budget,
+        trim_field). A prompt still over it is sent as is, logged and counted as over_budget.
+        """
+        estimate = estimate_tokens(prompt) + extra_tokens
+        usage = _current_call.get()
+        if usage is not None:
+            usage.estimated_input += estimate
+        if estimate > self.max_prompt_tokens:
+            logger.warning(f" Prompt of ~{estimate} tokens exceeds the {self.max_prompt_tokens}-token budget")
+            if usage is not None:
+                with self._lock:
+                    self._counters(usage.feature)['over_budget'] += 1
+        return estimate
+
+    def observe(self, response):
+        """Add a response's usage_metadata to the active scope and the user's daily total"""
+        usage_metadata = getattr(response, 'usage_metadata', None)
+        usage = _current_call.get()
+        if usage_metadata is None or usage is None:
+            return
+        input_tokens = getattr(usage_metadata, 'prompt_token_count', 0) or 0
+        output_tokens = getattr(usage_metadata, 'candidates_token_count', 0) or 0
+        usage.calls += 1
+        usage.input_tokens += input_tokens
+        usage.output_tokens += output_tokens
+        quota_ledger.record_user_tokens(usage.user_id, input_tokens, output_tokens)
+
+    def record(self, feature: str, user_id: Optional[str], response, estimated_input: int = 0):
+        """Account one call made outside a scope, e.g. a stream consumed across generator yields"""
+        with self.scope(feature, user_id) as usage:
+            usage.estimated_input += estimated_input
+            self.observe(response)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'max_prompt_tokens': self.max_prompt_tokens,
+                'user_daily_tokens': self.user_daily_tokens,
+                'features': {feature: dict(counters) for feature, counters in self._stats.items()}
+            }
+
+
+# Shared by the disease-detection and chatbot call paths
+token_budget = TokenBudget()
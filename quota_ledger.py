@@ -0,0 +1,258 @@
+import os
+import time
+import sqlite3
+import logging
+import tempfile
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from gemini_resilience import key_fingerprint
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS daily_usage (
+    key_fingerprint TEXT NOT NULL,
+    day TEXT NOT NULL,
+    calls INTEGER NOT NULL DEFAULT 0,
+    input_tokens INTEGER NOT NULL DEFAULT 0,
+    output_tokens INTEGER NOT NULL DEFAULT 0,
+    rate_limited INTEGER NOT NULL DEFAULT 0,
+    exhausted_until REAL NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (key_fingerprint, day)
+);
+CREATE TABLE IF NOT EXISTS user_usage (
+    user_id TEXT NOT NULL,
+    day TEXT NOT NULL,
+    calls INTEGER NOT NULL DEFAULT 0,
+    input_tokens INTEGER NOT NULL DEFAULT 0,
+    output_tokens INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (user_id, day)
+);
+"""
+
+
+def today() -> str:
+    """Ledger day; matches the limiters' local-midnight reset"""
+    return time.strftime('%Y-%m-%d')
+
+
+class QuotaLedger:
+    """Persistent per-API-key daily usage: calls, tokens, 429s and quota lockouts.
+
+    Backed by SQLite so counts survive restarts and are shared by every worker
+    on the host. Keys are stored by fingerprint, never in clear. If the database
+    cannot be opened the ledger is disabled and callers keep their in-memory state.
+    """
+
+    def __init__(self, path: Optional[str] = None, refresh_seconds: float = 2.0):
+        self.path = path
+        self.refresh_seconds = refresh_seconds
+        self.enabled = False
+        self._local = threading.local()
+        self._keys: Dict[str, Dict[str, Any]] = {}
+        self._exhausted_cache: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+
+        for candidate in (path, os.path.join(tempfile.gettempdir(), 'gemini_quota_ledger.db')):
+            if not candidate:
+                continue
+            try:
+                self.path = candidate
+                self._connection().executescript(_SCHEMA)
+                self.enabled = True
+                logger.info(f" Gemini quota ledger at {candidate}")
+                break
+            except (sqlite3.Error, OSError) as e:
+                logger.warning(f" Quota ledger unavailable at {candidate}: {e}")
+                self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+        return connection
+
+    def _execute(self, sql: str, params: tuple = ()) -> List[tuple]:
+        if not self.enabled:
+            return []
+        try:
+            return self._connection().execute(sql, params).fetchall()
+        except sqlite3.Error as e:
+            logger.warning(f" Quota ledger error: {e}")
+            return []
+
+    def register_key(self, api_key: Optional[str], label: str, daily_limit: Optional[int] = None):
+        """Name a key and its daily call budget for reporting"""
+        if not api_key:
+            return
+        with self._lock:
+            self._keys[key_fingerprint(api_key)] = {'label': label, 'daily_limit': daily_limit}
+
+    def _add(self, api_key: Optional[str], calls: int = 0, input_tokens: int = 0,
+             output_tokens: int = 0, rate_limited: int = 0, exhausted_until: float = 0):
+        if not api_key:
+            return
+        self._execute(
+            """INSERT INTO daily_usage (key_fingerprint, day, calls, input_tokens, output_tokens,
+                                        rate_limited, exhausted_until, updated_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+               ON CONFLICT (key_fingerprint, day) DO UPDATE SET
+                   calls = calls + excluded.calls,
+                   input_tokens = input_tokens + excluded.input_tokens,
+                   output_tokens = output_tokens + excluded.output_tokens,
+                   rate_limited = rate_limited + excluded.rate_limited,
+                   exhausted_until = MAX(exhausted_until, excluded.exhausted_until),
+                   updated_at = excluded.updated_at""",
+            (key_fingerprint(api_key), today(), calls, input_tokens, output_tokens,
+             rate_limited, exhausted_until, time.time())
+        )
+
+    def record_call(self, api_key: Optional[str]):
+        self._add(api_key, calls=1)
+
+    def record_tokens(self, api_key: Optional[str], input_tokens: int = 0, output_tokens: int = 0):
+        if input_tokens or output_tokens:
+            self._add(api_key, input_tokens=input_tokens or 0, output_tokens=output_tokens or 0)
+
+    def record_usage_metadata(self, api_key: Optional[str], response):
+        """Record token counts from a Gemini response's usage_metadata, when present"""
+        usage = getattr(response, 'usage_metadata', None)
+        if usage is None:
+            return
+        self.record_tokens(api_key,
+                           getattr(usage, 'prompt_token_count', 0) or 0,
+                           getattr(usage, 'candidates_token_count', 0) or 0)
+
+    def record_rate_limit(self, api_key: Optional[str], exhausted_until: float = 0):
+        """Record a 429; exhausted_until marks a daily-quota lockout seen by every worker"""
+        self._add(api_key, rate_limited=1, exhausted_until=exhausted_until)
+        if exhausted_until:
+            with self._lock:
+                self._exhausted_cache.pop(key_fingerprint(api_key), None)
+
+    def clear_exhausted(self, api_key: Optional[str]):
+        """Lift a recorded lockout (admin action for a lockout known to be false)"""
+        if not api_key:
+            return
+        fingerprint = key_fingerprint(api_key)
+        self._execute("UPDATE daily_usage SET exhausted_until = 0 WHERE key_fingerprint = ?", (fingerprint,))
+        with self._lock:
+            self._exhausted_cache.pop(fingerprint, None)
+
+    def exhausted_until(self, api_key: Optional[str]) -> float:
+        """Timestamp until which the key's daily quota is known to be exhausted (0 when it is not)"""
+        if not api_key or not self.enabled:
+            return 0
+        fingerprint = key_fingerprint(api_key)
+        now = time.time()
+        with self._lock:
+            cached = self._exhausted_cache.get(fingerprint)
+        if cached and now - cached[1] < self.refresh_seconds:
+            until = cached[0]
+        else:
+            yesterday = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d')
+            rows = self._execute(
+                "SELECT MAX(exhausted_until) FROM daily_usage WHERE key_fingerprint = ? AND day >= ?",
+                (fingerprint, yesterday)
+            )
+            until = (rows[0][0] or 0) if rows else 0
+            with self._lock:
+                self._exhausted_cache[fingerprint] = (until, now)
+        return until if until > now else 0
+
+    def usage_today(self, api_key: Optional[str]) -> Dict[str, int]:
+        empty = {'calls': 0, 'input_tokens': 0, 'output_tokens': 0, 'rate_limited': 0}
+        if not api_key:
+            return empty
+        rows = self._execute(
+            "SELECT calls, input_tokens, output_tokens, rate_limited FROM daily_usage WHERE key_fingerprint = ? AND day = ?",
+            (key_fingerprint(api_key), today())
+        )
+        if not rows:
+            return empty
+        calls, input_tokens, output_tokens, rate_limited = rows[0]
+        return {'calls': calls, 'input_tokens': input_tokens, 'output_tokens': output_tokens, 'rate_limited': rate_limited}
+
+    def calls_today(self, api_key: Optional[str]) -> int:
+        return self.usage_today(api_key)['calls']
+
+    def record_user_tokens(self, user_id: Optional[str], input_tokens: int = 0, output_tokens: int = 0):
+        """Charge one call's tokens to a user's daily total"""
+        if not user_id:
+            return
+        self._execute(
+            """INSERT INTO user_usage (user_id, day, calls, input_tokens, output_tokens, updated_at)
+               VALUES (?, ?, 1, ?, ?, ?)
+               ON CONFLICT (user_id, day) DO UPDATE SET
+                   calls = calls + 1,
+                   input_tokens = input_tokens + excluded.input_tokens,
+                   output_tokens = output_tokens + excluded.output_tokens,
+                   updated_at = excluded.updated_at""",
+            (str(user_id), today(), input_tokens, output_tokens, time.time())
+        )
+
+    def user_tokens_today(self, user_id: Optional[str]) -> int:
+        if not user_id:
+            return 0
+        rows = self._execute(
+            "SELECT input_tokens + output_tokens FROM user_usage WHERE user_id = ? AND day = ?",
+            (str(user_id), today())
+        )
+        return rows[0][0] if rows else 0
+
+    def report(self, days: int = 14) -> List[Dict[str, Any]]:
+        """Per-key usage history (newest first) with today's remaining budget"""
+        since = (datetime.now() - timedelta(days=days - 1)).strftime('%Y-%m-%d')
+        rows = self._execute(
+            """SELECT key_fingerprint, day, calls, input_tokens, output_tokens, rate_limited, exhausted_until
+               FROM daily_usage WHERE day >= ? ORDER BY key_fingerprint, day DESC""",
+            (since,)
+        )
+        with self._lock:
+            keys = {fingerprint: dict(info) for fingerprint, info in self._keys.items()}
+
+        report: Dict[str, Dict[str, Any]] = {}
+        for fingerprint, info in keys.items():
+            report[fingerprint] = {'fingerprint': fingerprint, 'label': info['label'],
+                                   'daily_limit': info['daily_limit'], 'history': []}
+        now = time.time()
+        for fingerprint, day, calls, input_tokens, output_tokens, rate_limited, exhausted in rows:
+            entry = report.setdefault(fingerprint, {'fingerprint': fingerprint, 'label': fingerprint,
+                                                    'daily_limit': None, 'history': []})
+            entry['history'].append({
+                'day': day,
+                'calls': calls,
+                'input_tokens': input_tokens,
+                'output_tokens': output_tokens,
+                'rate_limited': rate_limited,
+                'quota_exhausted': exhausted > now
+            })
+
+        current_day = today()
+        for entry in report.values():
+            today_row = next((row for row in entry['history'] if row['day'] == current_day), None)
+            calls = today_row['calls'] if today_row else 0
+            entry['today'] = today_row or {'day': current_day, 'calls': 0, 'input_tokens': 0,
+                                           'output_tokens': 0, 'rate_limited': 0, 'quota_exhausted': False}
+            entry['remaining_calls'] = max(0, entry['daily_limit'] - calls) if entry['daily_limit'] else None
+        return list(report.values())
+
+
+def create_quota_ledger() -> QuotaLedger:
+    """Create the ledger from environment configuration"""
+    path = os.getenv('GEMINI_QUOTA_LEDGER_PATH', os.path.join('instance', 'gemini_quota_ledger.db'))
+    return QuotaLedger(path, refresh_seconds=float(os.getenv('GEMINI_QUOTA_LEDGER_REFRESH', '2')))
+
+
+# Shared by the disease-detection and chatbot rate limiters
+quota_ledger = create_quota_ledger()
@@ -1105,6 +1105,15 @@ class VeterinaryChatbot {
         // Show typing indicator
         this.showTypingIndicator();
 
+        // Prefer the streaming endpoint so the answer starts rendering immediately
+        try {
+            if (await this.streamMessage(message)) {
+                return;
+            }
+        } catch (streamError) {
+            console.warn('⚠️ Streaming failed, falling back to standard request:', streamError);
+        }
+
         try {
             const response = await fetch('/api/chat', {
                 method: 'POST',
@@ -1165,6 +1174,121 @@ class VeterinaryChatbot {
         }
     }
 
+    async streamMessage(message) {
+        // Returns true when the streamed answer was fully handled, false to use /api/chat instead
+        if (!window.ReadableStream || !window.TextDecoder) {
+            return false;
+        }
+
+        const response = await fetch('/api/chat/stream', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'Accept': 'text/event-stream'
+            },
+            body: JSON.stringify({
+                message: message,
+                language: this.currentLanguage,
+                session_key: this.currentSessionKey
+            })
+        });
+
+        const contentType = response.headers.get('Content-Type') || '';
+        if (!response.ok || !response.body || !contentType.includes('text/event-stream')) {
+            return false;
+        }
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let fullText = '';
+        let messageDiv = null;
+        let renderPending = false;
+        let completed = false;
+
+        const render = () => {
+            renderPending = false;
+            if (!messageDiv) {
+                this.hideTypingIndicator();
+                messageDiv = this.addMessage('bot', fullText, false);
+            } else {
+                messageDiv.querySelector('.message-text').innerHTML = this.formatMessage(fullText);
+                if (this.settings.autoScrollEnabled) {
+                    this.scrollToBottom();
+                }
+            }
+        };
+
+        const handleEvent = (event) => {
+            if (event.type === 'start' && event.session_key) {
+                this.currentSessionKey = event.session_key;
+            } else if (event.type === 'chunk') {
+                fullText += event.text;
+                // Batch DOM updates to one per animation frame
+                if (!renderPending) {
+                    renderPending = true;
+                    requestAnimationFrame(render);
+                }
+            } else if (event.type === 'done') {
+                completed = true;
+                fullText = event.response || fullText;
+                render();
+                this.speak(fullText);
+                this.storeMessageInSession('bot', fullText);
+                if (event.session_key) {
+                    this.currentSessionKey = event.session_key;
+                }
+                if (event.incomplete) {
+                    this.showToast(event.error || 'Response was interrupted', 'error');
+                } else if (event.is_fallback) {
+                    this.showToast('AI service busy - showing general guidance', 'info');
+                }
+            } else if (event.type === 'error') {
+                if (!fullText) {
+                    throw new Error(event.error || 'Streaming error');
+                }
+                this.showToast(event.error || 'Response was interrupted', 'error');
+            }
+        };
+
+        let finished = false;
+        while (!finished) {
+            const { value, done } = await reader.read();
+            if (done) {
+                break;
+            }
+            buffer += decoder.decode(value, { stream: true });
+
+            // SSE frames are separated by a blank line
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const frame = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+                const dataLines = frame.split('\n')
+                    .filter(line => line.startsWith('data:'))
+                    .map(line => line.slice(5).trim());
+                if (dataLines.length === 0) {
+                    continue;
+                }
+                const event = JSON.parse(dataLines.join('\n'));
+                handleEvent(event);
+                if (event.type === 'done' || event.type === 'error') {
+                    finished = true;
+                }
+            }
+        }
+
+        if (!fullText) {
+            return false;
+        }
+        if (!completed) {
+            // Connection dropped or errored mid-answer - keep what we received
+            render();
+            this.storeMessageInSession('bot', fullText);
+        }
+        return true;
+    }
+
     addMessage(sender, text, storeInSession = true) {
         const messagesContainer = document.getElementById('chatMessages');
         const messageDiv = document.createElement('div');
@@ -1192,6 +1316,8 @@ class VeterinaryChatbot {
         if (this.settings.autoScrollEnabled) {
             this.scrollToBottom();
         }
+
+        return messageDiv;
     }
 
     formatMessage(text) {
@@ -1345,6 +1471,9 @@ class VeterinaryChatbot {
             formData.append('file', file);
             formData.append('language', this.currentLanguage);
             formData.append('question', 'Please analyze this file and provide insights about animal health or disease information.');
+            if (this.currentSessionKey) {
+                formData.append('session_key', this.currentSessionKey);
+            }
 
             const response = await fetch('/api/chat/upload', {
                 method: 'POST',
@@ -0,0 +1,308 @@
+import os
+import re
+import json
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Parse paths, cheapest first; 'schema_invalid' and 'unparseable' mean the caller falls back
+PARSE_PATHS = ('json', 'fenced', 'extracted', 'repaired', 'schema_invalid', 'unparseable')
+
+_FENCE_PATTERN = re.compile(r"```(?:json|JSON)?\s*(.*?)```", re.DOTALL)
+_SMART_QUOTES = str.maketrans({'“': '"', '”': '"', '‘': "'", '’': "'"})
+_PYTHON_LITERALS = (('True', 'true'), ('False', 'false'), ('None', 'null'))
+
+
+def _strip_trailing_comma(out: List[str]):
+    """Drop a dangling comma (and the whitespace after it) from the output buffer"""
+    index = len(out) - 1
+    while index >= 0 and out[index].isspace():
+        index -= 1
+    if index >= 0 and out[index] == ',':
+        del out[index:]
+
+
+def _extract_balanced(text: str) -> Optional[str]:
+    """First balanced {...} object in text, ignoring braces inside strings"""
+    start = text.find('{')
+    if start < 0:
+        return None
+    depth = 0
+    in_string = False
+    escape = False
+    for index in range(start, len(text)):
+        ch = text[index]
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == '\\':
+                escape = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch == '{':
+            depth += 1
+        elif ch == '}':
+            depth -= 1
+            if depth == 0:
+                return text[start:index + 1]
+    return None
+
+
+def repair_json(text: str) -> List[str]:
+    """
+    Best-effort repairs for JSON-like model output: single or smart quotes, Python
+    literals, comments, trailing commas, raw newlines in strings and output cut off
+    mid-object. Returns candidate strings, most complete first.
+    """
+    start = text.find('{')
+    if start < 0:
+        return []
+    text = text[start:].translate(_SMART_QUOTES)
+
+    out: List[str] = []
+    stack: List[str] = []
+    # (buffer length, open containers) after each complete member, used to cut off a truncated tail
+    safe_points: List[Tuple[int, List[str]]] = []
+    in_string = False
+    quote = '"'
+    escape = False
+    index = 0
+    while index < len(text):
+        ch = text[index]
+        if in_string:
+            if escape:
+                escape = False
+                if ch == "'":
+                    out[-1] = "'"
+                else:
+                    out.append(ch)
+            elif ch == '\\':
+                escape = True
+                out.append(ch)
+            elif ch == quote:
+                in_string = False
+                out.append('"')
+            elif ch == '"':
+                out.append('\\"')
+            elif ch == '\n':
+                out.append('\\n')
+            else:
+                out.append(ch)
+        elif ch in '"\'':
+            in_string = True
+            quote = ch
+            out.append('"')
+        elif ch in '{[':
+            stack.append('}' if ch == '{' else ']')
+            out.append(ch)
+        elif ch in '}]':
+            _strip_trailing_comma(out)
+            if stack:
+                stack.pop()
+            out.append(ch)
+            if not stack:
+                break
+        elif ch == ',':
+            safe_points.append((len(out), list(stack)))
+            out.append(ch)
+        elif ch == '/' and text.startswith('//', index):
+            newline = text.find('\n', index)
+            index = len(text) if newline < 0 else newline
+            continue
+        else:
+            for python_literal, json_literal in _PYTHON_LITERALS:
+                if (text.startswith(python_literal, index)
+                        and not text[index + len(python_literal):index + len(python_literal) + 1].isalnum()
+                        and not (index and text[index - 1].isalnum())):
+                    out.append(json_literal)
+                    index += len(python_literal)
+                    break
+            else:
+                out.append(ch)
+                index += 1
+            continue
+        index += 1
+
+    candidates = []
+    if in_string:
+        out.append('"')
+    tail = ''.join(out).rstrip()
+    if tail.endswith(':'):
+        tail += ' null'
+    closed = list(tail)
+    _strip_trailing_comma(closed)
+    candidates.append(''.join(closed) + ''.join(reversed(stack)))
+
+    if stack and safe_points:
+        # Output was cut off: drop the incomplete last member and close what was open before it
+        length, open_containers = safe_points[-1]
+        candidates.append(''.join(out[:length]) + ''.join(reversed(open_containers)))
+    return candidates
+
+
+def _coerce_number(value: Any) -> Any:
+    if isinstance(value, bool):
+        raise ValueError("boolean is not a number")
+    if isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        text = value.strip()
+        is_percent = text.endswith('%')
+        number = float(text.rstrip('%').strip())
+        return number / 100 if is_percent else number
+    raise ValueError(f"expected number, got {type(value).__name__}")
+
+
+def validate_against_schema(value: Any, schema: Dict[str, Any], path: str = '$') -> Tuple[Any, List[str]]:
+    """
+    Validate (and lightly coerce) value against a Gemini-style response schema.
+    Supports OBJECT/ARRAY/STRING/NUMBER/INTEGER/BOOLEAN with properties, items and required.
+    Returns (coerced_value, errors).
+    """
+    schema_type = str(schema.get('type', '')).upper()
+    errors: List[str] = []
+
+    if value is None:
+        if schema.get('nullable'):
+            return None, errors
+        return None, [f"{path}: value is null"]
+
+    if schema_type == 'OBJECT':
+        if not isinstance(value, dict):
+            return value, [f"{path}: expected object"]
+        result = dict(value)
+        for key in schema.get('required', []):
+            if key not in value:
+                errors.append(f"{path}.{key}: missing")
+        for key, property_schema in schema.get('properties', {}).items():
+            if key in value:
+                result[key], property_errors = validate_against_schema(value[key], property_schema, f"{path}.{key}")
+                errors.extend(property_errors)
+        return result, errors
+
+    if schema_type == 'ARRAY':
+        if isinstance(value, (str, dict)):
+            value = [value]
+        if not isinstance(value, list):
+            return value, [f"{path}: expected array"]
+        items_schema = schema.get('items')
+        if not items_schema:
+            return value, errors
+        result = []
+        for position, item in enumerate(value):
+            coerced, item_errors = validate_against_schema(item, items_schema, f"{path}[{position}]")
+            result.append(coerced)
+            errors.extend(item_errors)
+        return result, errors
+
+    if schema_type == 'STRING':
+        if isinstance(value, str):
+            return value, errors
+        if isinstance(value, list):
+            return ', '.join(str(item) for item in value), errors
+        if isinstance(value, dict):
+            return json.dumps(value), errors
+        return str(value), errors
+
+    if schema_type in ('NUMBER', 'INTEGER'):
+        try:
+            number = _coerce_number(value)
+        except ValueError as e:
+            return value, [f"{path}: {e}"]
+        return (int(number) if schema_type == 'INTEGER' else number), errors
+
+    if schema_type == 'BOOLEAN':
+        if isinstance(value, bool):
+            return value, errors
+        if isinstance(value, str) and value.strip().lower() in ('true', 'false'):
+            return value.strip().lower() == 'true', errors
+        return value, [f"{path}: expected boolean"]
+
+    return value, errors
+
+
+class StructuredOutputParser:
+    """Parse model output into schema-valid JSON, trying progressively more forgiving paths.
+
+    Paths: plain ``json`` -> markdown ``fenced`` -> balanced-brace ``extracted`` ->
+    locally ``repaired``. Results that still fail schema validation count as
+    ``schema_invalid``; text with no recoverable JSON counts as ``unparseable``.
+    Counters are kept per call site so fallback rates can be compared.
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv('GEMINI_STRUCTURED_OUTPUT_ENABLED', 'true').lower() == 'true'
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self._unsupported_models = set()
+
+    def generation_config(self, model_name: str, schema: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """JSON response MIME type + schema for models that accept them"""
+        if not self.enabled or schema is None or model_name in self._unsupported_models:
+            return None
+        return {'response_mime_type': 'application/json', 'response_schema': schema}
+
+    def mark_unsupported(self, model_name: str):
+        with self._lock:
+            if model_name not in self._unsupported_models:
+                logger.warning(f" Model {model_name} rejected JSON response schema, using prompt-only JSON")
+            self._unsupported_models.add(model_name)
+
+    @staticmethod
+    def is_schema_rejection(error: Exception) -> bool:
+        message = str(error).lower()
+        return any(marker in message for marker in ('response_schema', 'response_mime_type', 'json mode', 'responseschema'))
+
+    def _record(self, name: str, path: str):
+        with self._lock:
+            counters = self._stats.setdefault(name, {parse_path: 0 for parse_path in PARSE_PATHS})
+            counters[path] += 1
+
+    def _candidates(self, text: str):
+        text = text.strip().lstrip('\ufeff')
+        yield 'json', text
+        fence = _FENCE_PATTERN.search(text)
+        if fence:
+            yield 'fenced', fence.group(1).strip()
+        extracted = _extract_balanced(text)
+        if extracted:
+            yield 'extracted', extracted
+        for repaired in repair_json(fence.group(1) if fence else text):
+            yield 'repaired', repaired
+
+    def parse(self, text: Optional[str], schema: Dict[str, Any], name: str) -> Tuple[Optional[Dict[str, Any]], str]:
+        """Returns (data, path); data is None when the caller should fall back"""
+        schema_errors = None
+        for path, candidate in self._candidates(text or ''):
+            try:
+                data = json.loads(candidate)
+            except (json.JSONDecodeError, ValueError):
+                continue
+            data, errors = validate_against_schema(data, schema)
+            if not errors:
+                self._record(name, path)
+                return data, path
+            schema_errors = errors
+
+        if schema_errors:
+            logger.info(f" {name}: JSON failed schema validation ({'; '.join(schema_errors[:3])})")
+            self._record(name, 'schema_invalid')
+            return None, 'schema_invalid'
+        self._record(name, 'unparseable')
+        return None, 'unparseable'
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'unsupported_models': sorted(self._unsupported_models),
+                'paths': {name: dict(counters) for name, counters in self._stats.items()}
+            }
+
+
+# Shared parser used by disease prediction
+structured_output_parser = StructuredOutputParser()
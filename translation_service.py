@@ -0,0 +1,265 @@
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+try:
+    from deep_translator import GoogleTranslator
+    TRANSLATION_AVAILABLE = True
+except ImportError:
+    GoogleTranslator = None
+    TRANSLATION_AVAILABLE = False
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS translations (
+    source TEXT NOT NULL,
+    target TEXT NOT NULL,
+    text_hash TEXT NOT NULL,
+    translated TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (source, target, text_hash)
+);
+"""
+
+# Sentence ends (including the Devanagari danda) and line breaks; the terminator stays with its sentence
+_SENTENCE_END = re.compile(r'(?<=[.!?।\n])')
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def split_into_chunks(text: str, max_chars: int) -> List[str]:
+    """Split text into sentence-aligned chunks of at most max_chars; ''.join(chunks) == text"""
+    if len(text) <= max_chars:
+        return [text]
+    chunks: List[str] = []
+    current = ''
+    for sentence in _SENTENCE_END.split(text):
+        while len(sentence) > max_chars:
+            # A single overlong sentence is cut at the last space that fits
+            cut = sentence.rfind(' ', 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            if current:
+                chunks.append(current)
+                current = ''
+            chunks.append(sentence[:cut])
+            sentence = sentence[cut:]
+        if current and len(current) + len(sentence) > max_chars:
+            chunks.append(current)
+            current = ''
+        current += sentence
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _respace(chunk: str, translated: str) -> str:
+    """The translation with the chunk's surrounding whitespace, which the API strips"""
+    leading = chunk[:len(chunk) - len(chunk.lstrip())]
+    trailing = chunk[len(chunk.rstrip()):]
+    return f"{leading}{translated}{trailing}"
+
+
+class TranslationService:
+    """Cached, pooled translation for the chatbot.
+
+    Text is split into sentence-aligned chunks that are translated in parallel
+    on a fixed worker pool and reassembled in order. Each chunk is cached under
+    (source, target, sha256(text)) in a bounded in-memory LRU backed by SQLite,
+    so fixed phrases (default questions, fallback texts, common answers) are
+    only ever translated once per language on a host. Each worker thread keeps
+    its own translator per language pair, as the client is not thread-safe.
+    On timeout or error the original text is returned, as before.
+    """
+
+    def __init__(self, cache_path: Optional[str] = None, memory_size: int = 2000, max_workers: int = 4,
+                 chunk_chars: int = 1500, timeout: float = 5.0, ttl_days: float = 30):
+        self.cache_path = cache_path
+        self.memory_size = memory_size
+        self.chunk_chars = chunk_chars
+        self.timeout = timeout
+        self.ttl_seconds = ttl_days * 86400
+        self.persistent = False
+        self._memory: 'OrderedDict[Tuple[str, str, str], str]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='translate')
+        self._stats = {'requests': 0, 'chunks': 0, 'memory_hits': 0, 'persistent_hits': 0,
+                       'translated': 0, 'timeouts': 0, 'errors': 0, 'cache_only_misses': 0}
+
+        for candidate in (cache_path, os.path.join(tempfile.gettempdir(), 'translation_cache.db')):
+            if not candidate:
+                continue
+            try:
+                self.cache_path = candidate
+                connection = self._connection()
+                connection.executescript(_SCHEMA)
+                if self.ttl_seconds > 0:
+                    connection.execute("DELETE FROM translations WHERE created_at < ?", (time.time() - self.ttl_seconds,))
+                self.persistent = True
+                logger.info(f" Translation cache at {candidate}")
+                break
+            except (sqlite3.Error, OSError) as e:
+                logger.warning(f" Translation cache unavailable at {candidate}: {e}")
+                self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            directory = os.path.dirname(self.cache_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self.cache_path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+        return connection
+
+    def _count(self, stat: str, amount: int = 1):
+        with self._lock:
+            self._stats[stat] += amount
+
+    def _remember(self, key: Tuple[str, str, str], translated: str):
+        with self._lock:
+            self._memory[key] = translated
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+
+    def _lookup(self, key: Tuple[str, str, str]) -> Optional[str]:
+        with self._lock:
+            translated = self._memory.get(key)
+            if translated is not None:
+                self._memory.move_to_end(key)
+                self._stats['memory_hits'] += 1
+                return translated
+        if not self.persistent:
+            return None
+        try:
+            rows = self._connection().execute(
+                "SELECT translated FROM translations WHERE source = ? AND target = ? AND text_hash = ?", key
+            ).fetchall()
+        except sqlite3.Error as e:
+            logger.warning(f" Translation cache error: {e}")
+            return None
+        if not rows:
+            return None
+        self._count('persistent_hits')
+        self._remember(key, rows[0][0])
+        return rows[0][0]
+
+    def _store(self, key: Tuple[str, str, str], translated: str):
+        self._remember(key, translated)
+        if not self.persistent:
+            return
+        try:
+            self._connection().execute(
+                "INSERT OR REPLACE INTO translations (source, target, text_hash, translated, created_at) VALUES (?, ?, ?, ?, ?)",
+                key + (translated, time.time())
+            )
+        except sqlite3.Error as e:
+            logger.warning(f" Translation cache error: {e}")
+
+    def _translator(self, source: str, target: str):
+        translators = getattr(self._local, 'translators', None)
+        if translators is None:
+            translators = self._local.translators = {}
+        translator = translators.get((source, target))
+        if translator is None:
+            translator = translators[(source, target)] = GoogleTranslator(source=source, target=target)
+        return translator
+
+    def _translate_chunk(self, chunk: str, source: str, target: str) -> str:
+        """Translate one chunk, keeping its surrounding whitespace (the API strips it)"""
+        body = chunk.strip()
+        if not body:
+            return chunk
+        key = (source, target, text_hash(body))
+        translated = self._lookup(key)
+        if translated is None:
+            translated = self._translator(source, target).translate(body)
+            if not translated:
+                raise ValueError("empty translation")
+            self._count('translated')
+            self._store(key, translated)
+        return _respace(chunk, translated)
+
+    def translate(self, text: str, source: str, target: str, timeout: Optional[float] = None) -> str:
+        """Translate text; returns the original text if any chunk fails or the deadline passes"""
+        if not TRANSLATION_AVAILABLE or source == target or not text or not text.strip():
+            return text
+        self._count('requests')
+        chunks = split_into_chunks(text, self.chunk_chars)
+        self._count('chunks', len(chunks))
+        futures = [self._executor.submit(self._translate_chunk, chunk, source, target) for chunk in chunks]
+        done, pending = wait(futures, timeout=self.timeout if timeout is None else timeout)
+        if pending:
+            # Workers finish in the background and still fill the cache for next time
+            self._count('timeouts')
+            logger.warning(f" Translation timed out ({source} → {target}, {len(pending)}/{len(chunks)} chunks pending)")
+            return text
+        try:
+            return ''.join(future.result() for future in futures)
+        except Exception as e:
+            self._count('errors')
+            logger.warning(f" Translation failed ({source} → {target}): {e}")
+            return text
+
+    def cached(self, text: str, source: str, target: str) -> Optional[str]:
+        """The translation if every chunk is already cached, else None; never waits on the network.
+
+        Missing chunks are translated in the background, so the text is
+        cached the next time it is asked for.
+        """
+        if source == target or not text or not text.strip():
+            return text
+        chunks = split_into_chunks(text, self.chunk_chars)
+        translated = []
+        missing = []
+        for chunk in chunks:
+            body = chunk.strip()
+            hit = self._lookup((source, target, text_hash(body))) if body else body
+            if hit is None:
+                missing.append(chunk)
+            else:
+                translated.append(_respace(chunk, hit) if body else chunk)
+        if not missing:
+            return ''.join(translated)
+        self._count('cache_only_misses')
+        if TRANSLATION_AVAILABLE:
+            for chunk in missing:
+                self._executor.submit(self._translate_chunk, chunk, source, target)
+        return None
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['memory_entries'] = len(self._memory)
+        stats['persistent'] = self.persistent
+        return stats
+
+
+def create_translation_service() -> TranslationService:
+    """Create the translation service from environment configuration"""
+    return TranslationService(
+        cache_path=os.getenv('TRANSLATION_CACHE_PATH', os.path.join('instance', 'translation_cache.db')),
+        memory_size=int(os.getenv('TRANSLATION_CACHE_SIZE', '2000')),
+        max_workers=int(os.getenv('TRANSLATION_WORKERS', '4')),
+        chunk_chars=int(os.getenv('TRANSLATION_CHUNK_CHARS', '1500')),
+        timeout=float(os.getenv('TRANSLATION_TIMEOUT', '5')),
+        ttl_days=float(os.getenv('TRANSLATION_CACHE_TTL_DAYS', '30'))
+    )
+
+
+# Shared by every chatbot instance in the process
+translation_service = create_translation_service()